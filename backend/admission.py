@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import time
+
+class AdmissionController():
+    """ Admission control of expensive requests, so cheap turn actions keep a low latency under overload.
+
+    The cost of a request is estimated before it runs, in amplitude operations: the size of the
+    game state it touches times the number of states it compares it with, plus a fixed cost per
+    image it renders. Requests cheaper than `cheap_cost` always run right away. Others run at
+    most `max_running` at a time; the rest wait in a priority queue, cheapest first, of at most
+    `max_queued` requests, and are rejected once it is full.
+    """
+    # amplitude operations a matplotlib render is worth
+    RENDER_COST = 2**14
+    # amplitude operations of the circuit replay generating one target state
+    TARGET_COST = 2**8
+    # amplitude operations of a bot's search, per amplitude of the game state
+    SEARCH_COST = 2**12
+
+    def __init__(self, max_running:int = 4, max_queued:int = 64, cheap_cost:int = 2**10) -> None:
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.cheap_cost = cheap_cost
+        self.running = 0
+        self.queue = []
+        self.sequence = itertools.count()
+        self.service_time = 0.1
+        self.admitted = 0
+        self.rejected = 0
+
+    def estimate(self, path:str, body:bytes, games:list)-> int:
+        """ Estimates the cost of a request from its endpoint, its body and the game it targets.
+
+        Args:
+            path (str): path of the request
+            body (bytes): JSON body of the request
+            games (list): all games, indexed by game id
+
+        Returns:
+            int: estimated cost in amplitude operations
+        """
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return 0
+        if not isinstance(data, dict):
+            return 0
+        if path == "/create_game/":
+            players = len(data.get("players") or [])
+            amplitudes = len(data.get("initial_state") or [1, 0, 0, 0])
+            return players*(amplitudes*AdmissionController.TARGET_COST + len(["bloch_sphere", "q_sphere"])*AdmissionController.RENDER_COST)
+        if path == "/create_rooms/":
+            rooms = [room for room in data.get("rooms") or [] if isinstance(room, dict)]
+            # renders are deferred until the images are fetched
+            return sum(len(room.get("players") or [])*len(room.get("initial_state") or [1, 0, 0, 0])*AdmissionController.TARGET_COST for room in rooms)
+        if path == "/game_circuit/":
+            return AdmissionController.RENDER_COST//8 if data.get("format") == "svg" else AdmissionController.RENDER_COST
+        if path == "/bot_turn/":
+            try:
+                game = games[int(data.get("game_id"))]
+            except (IndexError, TypeError, ValueError):
+                return 0
+            return len(game._game_state)*AdmissionController.SEARCH_COST
+        if path == "/play_card/":
+            try:
+                game = games[int(data.get("game_id"))]
+            except (IndexError, TypeError, ValueError):
+                return 0
+            # the state is read without applying queued gates
+            amplitudes = len(game._game_state)*(2 if data.get("card") == "add_card" else 1)
+            if data.get("evaluate", True) is False:
+                return amplitudes
+            return amplitudes*(1+len(game.get_players()))
+        return 0
+
+    def retry_after(self)-> int:
+        """ Seconds until the queue has likely drained enough to admit a new request.
+        """
+        return max(1, math.ceil(self.service_time*(len(self.queue)+1)/self.max_running))
+
+    async def acquire(self, cost:int)-> bool:
+        """ Waits until a request of the given cost may run.
+
+        Returns:
+            bool: False if the request is rejected because the queue is full
+        """
+        if cost < self.cheap_cost:
+            return True
+        if self.running < self.max_running and len(self.queue) == 0:
+            self.running = self.running+1
+            self.admitted = self.admitted+1
+            return True
+        if len(self.queue) >= self.max_queued:
+            self.rejected = self.rejected+1
+            return False
+        future = asyncio.get_running_loop().create_future()
+        entry = (cost, next(self.sequence), future)
+        heapq.heappush(self.queue, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just as the client went away
+                self.release(cost, self.service_time)
+            elif entry in self.queue:
+                self.queue.remove(entry)
+                heapq.heapify(self.queue)
+            raise
+        self.admitted = self.admitted+1
+        return True
+
+    def release(self, cost:int, elapsed:float):
+        """ Frees the slot of a finished request and hands it to the cheapest queued one.
+        """
+        if cost < self.cheap_cost:
+            return
+        self.service_time = 0.9*self.service_time+0.1*elapsed
+        self.running = self.running-1
+        while len(self.queue) != 0:
+            _, _, future = heapq.heappop(self.queue)
+            if not future.done():
+                self.running = self.running+1
+                future.set_result(None)
+                break
+
+    async def run(self, cost:int, call):
+        """ Runs `call` (a coroutine function) once admitted.
+
+        Returns:
+            the result of `call`, None if the request is rejected
+        """
+        if not await self.acquire(cost):
+            return None
+        start = time.monotonic()
+        try:
+            return await call()
+        finally:
+            self.release(cost, time.monotonic()-start)
+
+    def stats(self)-> dict:
+        return {"max_running": self.max_running,
+                "max_queued": self.max_queued,
+                "cheap_cost": self.cheap_cost,
+                "running": self.running,
+                "queued": len(self.queue),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "service_time": self.service_time}
@@ -0,0 +1,168 @@
+import numpy as np
+
+from code_game import Game
+
+class StateBatch():
+    """ Game states of one width stored as the rows of one 2D array.
+
+    The game state of every game in the batch is a view of its row, so it always shows the
+    latest state without copying.
+    """
+    def __init__(self, num_qubits:int, capacity:int = 16) -> None:
+        self.num_qubits = num_qubits
+        self.states = np.zeros((capacity, 2**num_qubits), dtype= complex if Game.precision is None else Game.precision.dtype)
+        self.rows = {}
+        self.games = {}
+        # game id -> the view of its row the game was given
+        self.views = {}
+        self.free_rows = list(range(capacity-1, -1, -1))
+
+    def add(self, game:Game):
+        if len(self.free_rows) == 0:
+            capacity = len(self.states)
+            self.states = np.concatenate([self.states, np.zeros_like(self.states)])
+            self.free_rows = list(range(2*capacity-1, capacity-1, -1))
+            # rows moved to the new array, so every game needs a fresh view
+            for game_id, row in self.rows.items():
+                self.views[game_id] = self.states[row]
+                self.games[game_id].game_state = self.views[game_id]
+        row = self.free_rows.pop()
+        self.states[row] = np.asarray(game.game_state, dtype= self.states.dtype)
+        self.rows[game.game_id] = row
+        self.games[game.game_id] = game
+        self.views[game.game_id] = self.states[row]
+        game.game_state = self.views[game.game_id]
+
+    def remove(self, game:Game):
+        row = self.release(game)
+        game.game_state = self.states[row].tolist()
+
+    def release(self, game:Game)-> int:
+        """ Frees the row of a game without touching its game state.
+        """
+        row = self.rows.pop(game.game_id)
+        self.games.pop(game.game_id)
+        self.views.pop(game.game_id)
+        self.free_rows.append(row)
+        return row
+
+    def refresh(self, game:Game)-> bool:
+        """ Copies the game state into the row of the game again if a move played outside of the batch replaced it.
+
+        Returns:
+            bool: False if the game state no longer fits the row (its width changed)
+        """
+        game_state = game._game_state
+        if game_state is self.views[game.game_id]:
+            return True
+        if len(game_state) != self.states.shape[1]:
+            return False
+        self.views[game.game_id][:] = np.asarray(game_state, dtype= self.states.dtype)
+        game.game_state = self.views[game.game_id]
+        return True
+
+    def apply(self, game_ids:list, unitary:list, qubits:list):
+        """ Applies the same gate on the same qubits of the given games in one array operation.
+        """
+        rows = [self.rows[game_id] for game_id in game_ids]
+        num_gate_qubits = len(qubits)
+        states = self.states[rows].reshape((len(rows),)+(2,)*self.num_qubits)
+        gate = np.asarray(unitary, dtype= complex).reshape((2,)*(2*num_gate_qubits))
+        # qubit 0 is the most significant bit of an index, i.e. the first axis after the row axis
+        axes = [1+qubit for qubit in qubits]
+        states = np.tensordot(states, gate, axes= (axes, list(range(num_gate_qubits, 2*num_gate_qubits))))
+        states = np.moveaxis(states, list(range(states.ndim-num_gate_qubits, states.ndim)), axes)
+        self.states[rows] = states.reshape(len(rows), 2**self.num_qubits)
+
+class BatchedGameEngine():
+    """ Advances many games at once by stepping games of the same width together.
+
+    Moves are queued with `submit` and played by `step`. A step takes at most one move per game,
+    groups the gate moves by (gate, qubits, width) and applies each group to the rows of its
+    batch in a single array operation. add_card and remove_card change the width of a game, so
+    they are played on the game alone and the game moves to the batch of its new width.
+    Everything else about a move (hands, deck, journal, fidelities) is done by the game itself.
+    Moves played on an attached game outside of the engine, including gates they left queued,
+    are applied to its row before the game is stepped.
+    """
+    def __init__(self) -> None:
+        self.batches = {}
+        self.batch_of = {}
+        self.pending = []
+
+    def attach(self, game:Game):
+        num_qubits = len(game.game_state).bit_length()-1
+        if num_qubits not in self.batches:
+            self.batches[num_qubits] = StateBatch(num_qubits)
+        self.batches[num_qubits].add(game)
+        self.batch_of[game.game_id] = num_qubits
+
+    def detach(self, game:Game):
+        """ Takes a game out of the engine, its game state becomes a list again.
+        """
+        self.batches[self.batch_of.pop(game.game_id)].remove(game)
+
+    def refresh(self, game:Game):
+        """ Brings the row of a game up to date with moves played on the game outside of the engine (Game.drop_card).
+        """
+        # gates queued by moves played with evaluate=False come before the batched gate
+        if game._pending_gates is not None:
+            game.flush_gates()
+        if not self.batches[self.batch_of[game.game_id]].refresh(game):
+            self.batches[self.batch_of.pop(game.game_id)].release(game)
+            self.attach(game)
+
+    def submit(self, game:Game, player:str, card:str, qubits:list= [], angle:float|None = None):
+        if game.game_id not in self.batch_of:
+            self.attach(game)
+        self.pending.append((game, player, card, qubits, angle))
+
+    def step(self)-> list:
+        """ Plays at most one pending move of every game.
+
+        Returns:
+            list: (game, player, result) of every played move in submission order, result being the return value of drop_card or the exception the move raised
+        """
+        moves = []
+        deferred = []
+        stepped = set()
+        for move in self.pending:
+            if move[0].game_id in stepped:
+                deferred.append(move)
+            else:
+                stepped.add(move[0].game_id)
+                moves.append(move)
+        self.pending = deferred
+
+        checked = []
+        results = {}
+        groups = {}
+        for index, (game, player, card, qubits, angle) in enumerate(moves):
+            try:
+                self.refresh(game)
+                players, _player, gate_matrix = game.check_move(players= game.get_players(), player= player, card= card, qubits= qubits)
+            except Exception as e:
+                results[index] = e
+                continue
+            checked.append((index, game, players, _player, card, qubits, angle, gate_matrix))
+            if gate_matrix is not None:
+                key = (card, tuple(qubits), self.batch_of[game.game_id])
+                groups.setdefault(key, (gate_matrix, []))[1].append(game.game_id)
+
+        for (card, qubits, num_qubits), (gate_matrix, game_ids) in groups.items():
+            self.batches[num_qubits].apply(game_ids, gate_matrix, list(qubits))
+
+        for index, game, players, _player, card, qubits, angle, gate_matrix in checked:
+            try:
+                measurement = None
+                if gate_matrix is None:
+                    measurement, game_state = game.next_game_state(card= card, qubits= qubits, gate_matrix= None)
+                    self.detach(game)
+                else:
+                    game_state = game.game_state
+                results[index] = game.complete_move(players= players, player= _player, card= card, qubits= qubits, angle= angle, measurement= measurement, game_state= game_state)
+                if gate_matrix is None:
+                    self.attach(game)
+            except Exception as e:
+                results[index] = e
+        return [(moves[index][0], moves[index][1], results[index]) for index in range(len(moves))]
@@ -0,0 +1,118 @@
+""" Checks BatchedGameEngine against moves played one by one with drop_card and times both.
+
+The same seeded games are played round by round twice: once with Game.drop_card for every
+move, and once by submitting the move of every game to a BatchedGameEngine and stepping it once
+a round. Every game draws its moves from its own generator, the players taking turns. remove_card
+is never played, as the in-memory measurement keeps only the magnitude of every amplitude and
+can fail on a division by zero. The script fails if a move succeeds on one path only, or an
+amplitude of any final game state differs by more than --max-error.
+
+Usage: python benchmark_batch.py --games 500 --rounds 30 --qubits 3
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from batch_engine import BatchedGameEngine
+from code_game import Game
+from players import Player
+
+def reset_registries():
+    Game.all_games.clear()
+    Player.all_players.clear()
+
+def create_games(games:int, num_qubits:int, seed:int)-> list:
+    reset_registries()
+    rng = random.Random(seed)
+    created = []
+    for i in range(games):
+        initial_state = [1]+[0]*(2**num_qubits-1)
+        game = Game(initial_state= initial_state, decks= 6, seed= rng.getrandbits(64))
+        names = [name+"_"+str(game.game_id) for name in ["A", "B", "C"]]
+        for name in names:
+            Player(name= name)
+        game.distribute_cards(players= names, decks= game.num_decks)
+        game.set_target_states()
+        created.append(game)
+    return created
+
+def next_move(game:Game, moves_rng:random.Random, turn:int)-> tuple|None:
+    """ Picks the next move of a game, None if the player has nothing but remove_card.
+    """
+    player = game.get_players()[turn % len(game.get_players())]
+    cards = [card for card in player.cards if card != "remove_card"]
+    if len(cards) == 0:
+        return None
+    width = len(game.game_state).bit_length()-1
+    card = moves_rng.choice(cards)
+    if card in ["CNOT", "SWAP"]:
+        qubits = moves_rng.sample(range(width), 2) if width > 1 else [0, 0]
+    elif card == "add_card":
+        qubits = []
+    else:
+        qubits = [moves_rng.randrange(width)]
+    return player.name, card, qubits
+
+def play(games:int, rounds:int, num_qubits:int, seed:int, batched:bool)-> (list, list, float):
+    """ Plays seeded random games and returns their final game states, the outcome of every move and the time it took.
+    """
+    created = create_games(games, num_qubits, seed)
+    moves_rngs = [random.Random(game.seed) for game in created]
+    engine = BatchedGameEngine()
+    outcomes = []
+    start = time.perf_counter()
+    for turn in range(rounds):
+        for game, moves_rng in zip(created, moves_rngs):
+            if len(game.remaining_cards) == 0:
+                continue
+            move = next_move(game, moves_rng, turn)
+            if move is None:
+                continue
+            player, card, qubits = move
+            if batched:
+                engine.submit(game, player, card, qubits)
+                continue
+            try:
+                game.drop_card(players= game.get_players(), player= player, card= card, qubits= qubits)
+                outcomes.append((game.seed, turn, True))
+            except Exception:
+                outcomes.append((game.seed, turn, False))
+        if batched:
+            for game, _, result in engine.step():
+                outcomes.append((game.seed, turn, not isinstance(result, Exception)))
+    states = [np.array(game.game_state, dtype= complex) for game in created]
+    elapsed = time.perf_counter()-start
+    for game in created:
+        if game.game_id in engine.batch_of:
+            engine.detach(game)
+        game.end_game()
+    return states, outcomes, elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type= int, default= 500)
+    parser.add_argument("--rounds", type= int, default= 30)
+    parser.add_argument("--qubits", type= int, default= 3)
+    parser.add_argument("--max-error", type= float, default= 1e-9)
+    parser.add_argument("--seed", type= int, default= 0)
+    args = parser.parse_args()
+
+    expected, expected_outcomes, expected_time = play(args.games, args.rounds, args.qubits, args.seed, batched= False)
+    batched, batched_outcomes, batched_time = play(args.games, args.rounds, args.qubits, args.seed, batched= True)
+
+    mismatches = sum(1 for a, b in zip(sorted(expected_outcomes), sorted(batched_outcomes)) if a != b)+abs(len(expected_outcomes)-len(batched_outcomes))
+    max_error = 0
+    for expected_state, batched_state in zip(expected, batched):
+        if len(expected_state) != len(batched_state):
+            mismatches = mismatches+1
+            continue
+        max_error = max(max_error, float(np.max(np.abs(expected_state-batched_state))))
+
+    print(f"{len(expected_outcomes)} moves in {args.games} games of {args.qubits} qubits")
+    print(f"drop_card: {expected_time:.2f} s, batched: {batched_time:.2f} s ({expected_time/batched_time:.1f}x)")
+    print(f"{mismatches} moves or games differ, max amplitude error: {max_error:.2e} (bound {args.max_error:.0e})")
+    if mismatches != 0 or max_error > args.max_error:
+        sys.exit(1)
@@ -0,0 +1,46 @@
+""" Measures the memory held by idle games (dealt, with target states, nobody playing) per game.
+
+Usage: python benchmark_memory.py --games 500
+"""
+import argparse
+import gc
+import tracemalloc
+
+from code_game import Game
+from players import Player
+
+def reset_registries():
+    Game.all_games.clear()
+    Player.all_players.clear()
+    gc.collect()
+
+def create_idle_games(games:int, players:int):
+    for i in range(games):
+        game = Game(initial_state= [1, 0, 0, 0], decks= players, seed= i)
+        names = ["P"+str(player)+"_"+str(game.game_id) for player in range(players)]
+        for name in names:
+            Player(name= name)
+        game.distribute_cards(players= names, decks= game.num_decks)
+        game.set_target_states()
+
+def bytes_per_game(games:int, players:int)-> float:
+    reset_registries()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    create_idle_games(games, players)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    reset_registries()
+    return allocated/games
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= __doc__)
+    parser.add_argument("--games", type= int, default= 500)
+    args = parser.parse_args()
+
+    # warm up caches shared by all games (gate tables, enum lookups) before measuring
+    create_idle_games(5, 2)
+    for players in [2, 4, 8]:
+        print(f"{players} players: {bytes_per_game(args.games, players):,.0f} bytes per idle game")
@@ -0,0 +1,65 @@
+""" Measures how the parallel gate kernels scale from 1 to N worker threads.
+
+For every state size a random statevector is created, then a general single qubit gate (H), a
+two qubit permutation (CNOT), a measurement and a fidelity are timed with 1, 2, 4, ... workers.
+"H list" is the gate on the same state given as a list of Python complex numbers: the list is
+converted to an array on one thread first. Game states in the default precision are lists until
+the first gate of the parallel kernels, which leaves them arrays, so only that gate pays for it.
+
+Usage: python benchmark_parallel.py --qubits 18,20,22 --workers 1,2,4,8
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from gates import QuantumGates
+from parallel import ParallelKernels
+
+class FixedChoice():
+    """ Stands in for the game random generator so every measurement takes the same branch.
+    """
+    def choices(self, population:list, weights:list):
+        return [population[0]]
+
+def best_time(function, repeat:int)-> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter()-start)
+    return min(times)
+
+def benchmark(num_qubits:int, workers:int, repeat:int)-> dict:
+    rng = np.random.default_rng(num_qubits)
+    state = rng.normal(size= 2**num_qubits)+1j*rng.normal(size= 2**num_qubits)
+    state = state/np.linalg.norm(state)
+    other = np.roll(state, 1)
+    state_list = state.tolist()
+    kernels = ParallelKernels(workers= workers, min_qubits= 0)
+    try:
+        return {"H": best_time(lambda: kernels.apply_gate(state, QuantumGates.H.value, [num_qubits//2]), repeat),
+                "H list": best_time(lambda: kernels.apply_gate(state_list, QuantumGates.H.value, [num_qubits//2]), repeat),
+                "CNOT": best_time(lambda: kernels.apply_gate(state, QuantumGates.CNOT.value, [0, num_qubits-1]), repeat),
+                "measure": best_time(lambda: kernels.measure_and_remove_qubit(num_qubits//2, state, FixedChoice()), repeat),
+                "fidelity": best_time(lambda: kernels.fidelity(state, other), repeat)}
+    finally:
+        kernels.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qubits", default= "18,20,22")
+    parser.add_argument("--workers", default= ",".join(str(2**i) for i in range((os.cpu_count() or 1).bit_length())))
+    parser.add_argument("--repeat", type= int, default= 5)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores")
+    for num_qubits in [int(i) for i in args.qubits.split(",")]:
+        print(f"\n== {num_qubits} qubits ==")
+        print(f"{'workers':>8}" + "".join(f"{kernel+' ms':>14}{'speedup':>9}" for kernel in ["H", "H list", "CNOT", "measure", "fidelity"]))
+        baseline = None
+        for workers in [int(i) for i in args.workers.split(",")]:
+            times = benchmark(num_qubits, workers, args.repeat)
+            baseline = baseline or times
+            print(f"{workers:>8}" + "".join(f"{times[kernel]*1000:>14.2f}{baseline[kernel]/times[kernel]:>8.2f}x" for kernel in times))
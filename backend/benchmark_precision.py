@@ -0,0 +1,148 @@
+""" Compares single precision (complex64) game states with the double precision path.
+
+The same seeded games are played move for move once with states stored as lists of complex
+numbers and once with StatePrecision("complex64"). The largest difference of the fidelities
+reported to players is printed with the memory per amplitude of both, and the script fails if
+the difference exceeds --max-error. Then seeded rooms are played through the API with
+QUNO_PRECISION=complex64, and the script fails if any endpoint answers with a server error.
+
+Usage: python benchmark_precision.py --games 50 --moves 80 --max-error 1e-4
+"""
+import argparse
+import os
+import random
+import sys
+
+from budget import ResourceBudget
+from code_game import Game
+from players import Player
+from precision import StatePrecision
+
+def reset_registries():
+    Game.all_games.clear()
+    Player.all_players.clear()
+
+def play(games:int, moves:int, seed:int)-> list:
+    """ Plays seeded random games and returns the fidelities of every player after every move.
+    """
+    reset_registries()
+    rng = random.Random(seed)
+    history = []
+    for i in range(games):
+        game = Game(initial_state= [1, 0, 0, 0], decks= 6, seed= rng.getrandbits(64))
+        names = [name+"_"+str(game.game_id) for name in ["A", "B", "C"]]
+        for name in names:
+            Player(name= name)
+        game.distribute_cards(players= names, decks= game.num_decks)
+        game.set_target_states()
+        fidelities = []
+        for move in range(moves):
+            if len(game.remaining_cards) == 0:
+                break
+            player = game.get_players()[move % len(names)]
+            num_qubits = len(game.game_state).bit_length()-1
+            card = rng.choice(player.cards)
+            if card in ["CNOT", "SWAP"]:
+                qubits = rng.sample(range(num_qubits), 2) if num_qubits > 1 else [0, 0]
+            else:
+                qubits = [rng.randrange(num_qubits)]
+            try:
+                measurement, _, _, _fidelities = game.drop_card(players= game.get_players(), player= player.name, card= card, qubits= qubits)
+            except Exception:
+                fidelities.append(None)
+                continue
+            fidelities.append((measurement, [float(_fidelities[name]) for name in names]))
+        history.append(fidelities)
+    return history
+
+def check_api(rooms:int, moves:int, seed:int)-> list:
+    """ Plays seeded rooms through the endpoints of main.py in complex64 mode.
+
+    Returns:
+        list: (method, path, status) of the requests answered with a server error
+    """
+    reset_registries()
+    os.environ["QUNO_PRECISION"] = "complex64"
+    os.environ.setdefault("QUNO_TARGET_POOL_SIZE", "0")
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app, raise_server_exceptions= False)
+    rng = random.Random(seed)
+    failures = []
+
+    def request(method:str, path:str, **kwargs):
+        response = client.request(method, path, **kwargs)
+        if response.status_code >= 500:
+            failures.append((method, path, response.status_code))
+        return response.json() if response.status_code < 300 and response.headers.get("content-type") == "application/json" else {}
+
+    created = request("POST", "/create_rooms/", json= {"rooms": [{"players": ["A", "B"], "initial_state": [1, 0, 0, 0], "decks": 6, "seed": rng.getrandbits(32)}]})
+    game_ids = [room["game_id"] for room in created.get("rooms", [])]
+    for room in range(rooms):
+        created = request("POST", "/create_game/", json= {"players": ["A", "B", "C"], "initial_state": [1, 0, 0, 0], "decks": 6, "seed": rng.getrandbits(32)})
+        if "game_id" in created:
+            game_ids.append(created["game_id"])
+    for game_id in game_ids:
+        game = main.get_game(game_id)
+        for move in range(moves):
+            # a game that ended has no players left
+            if len(game.get_players()) == 0:
+                break
+            player = game.get_players()[move % len(game.get_players())]
+            name = player.name.split("_")[0]
+            if move % 4 == 3:
+                request("POST", "/bot_turn/", json= {"game_id": game_id, "player": name})
+                continue
+            if not player.cards:
+                continue
+            num_qubits = len(game.game_state).bit_length()-1
+            card = rng.choice(player.cards)
+            qubits = rng.sample(range(num_qubits), 2) if card in ["CNOT", "SWAP"] and num_qubits > 1 else [rng.randrange(num_qubits)]
+            request("POST", "/play_card/", json= {"game_id": game_id, "player": name, "card": card, "qubits": qubits, "angle": None})
+        request("GET", "/rooms/"+str(game_id))
+        request("GET", "/state_summary/"+str(game_id))
+        request("GET", "/samples/"+str(game_id))
+        fork = request("POST", "/forks/", json= {"game_id": game_id})
+        if "fork_id" in fork:
+            request("GET", "/forks/"+fork["fork_id"])
+    main.bots.shutdown()
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type= int, default= 50)
+    parser.add_argument("--moves", type= int, default= 80)
+    parser.add_argument("--renormalize-every", type= int, default= 8)
+    parser.add_argument("--max-error", type= float, default= 1e-4)
+    parser.add_argument("--seed", type= int, default= 0)
+    parser.add_argument("--api-rooms", type= int, default= 4)
+    args = parser.parse_args()
+
+    Game.precision = None
+    expected = play(args.games, args.moves, args.seed)
+    Game.precision = StatePrecision(dtype= "complex64", renormalize_every= args.renormalize_every)
+    single = play(args.games, args.moves, args.seed)
+
+    max_error = 0
+    compared = 0
+    diverged = 0
+    for expected_game, single_game in zip(expected, single):
+        for expected_move, single_move in zip(expected_game, single_game):
+            if (expected_move is None) != (single_move is None) or (expected_move is not None and expected_move[0] != single_move[0]):
+                # a measurement drew the other outcome, the two games are no longer comparable
+                diverged = diverged+1
+                break
+            if expected_move is None:
+                continue
+            compared = compared+1
+            max_error = max([max_error]+[abs(a-b) for a, b in zip(expected_move[1], single_move[1])])
+
+    print(f"bytes per amplitude: {ResourceBudget.BYTES_PER_AMPLITUDE} as a list of complex, {Game.precision.bytes_per_amplitude} as complex64")
+    print(f"{compared} moves compared, {diverged} of {args.games} games diverged on a measurement")
+    print(f"max fidelity error: {max_error:.2e} (bound {args.max_error:.0e})")
+
+    failures = check_api(args.api_rooms, min(args.moves, 16), args.seed)
+    print(f"API in complex64 mode: {len(failures)} server errors" + "".join(f"\n  {method} {path} -> {status}" for method, path, status in failures[:10]))
+    if max_error > args.max_error or len(failures) != 0:
+        sys.exit(1)
@@ -0,0 +1,77 @@
+""" Measures how long recovering games from the journal takes, with and without checkpoints.
+
+Usage: python benchmark_recovery.py --games 20 --moves 60 --checkpoint-every 20
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from code_game import Game
+from journal import GameJournal
+from players import Player
+
+def reset_registries():
+    Game.journal = None
+    Game.all_games.clear()
+    Player.all_players.clear()
+
+def play_random_move(game:Game, rng:random.Random)-> bool:
+    num_qubits = len(game.game_state).bit_length()-1
+    for player in game.get_players():
+        for card in player.cards or []:
+            if card in ["CNOT", "SWAP"] and num_qubits < 2:
+                continue
+            elif card in ["CNOT", "SWAP"]:
+                qubits = rng.sample(range(num_qubits), 2)
+            else:
+                qubits = [rng.randrange(num_qubits)]
+            try:
+                game.drop_card(players= game.get_players(), player= player.name, card= card, qubits= qubits)
+                return True
+            except Exception:
+                continue
+    return False
+
+def populate(directory:str, games:int, moves:int, checkpoint_every:int, seed:int = 0)-> list:
+    reset_registries()
+    rng = random.Random(seed)
+    Game.journal = GameJournal(directory= directory, checkpoint_every= checkpoint_every)
+    states = []
+    for i in range(games):
+        game = Game(initial_state= [1, 0, 0, 0], decks= 6, seed= rng.getrandbits(64))
+        names = [name+"_"+str(game.game_id) for name in ["A", "B", "C"]]
+        for name in names:
+            Player(name= name)
+        game.distribute_cards(players= names, decks= game.num_decks)
+        game.set_target_states()
+        for _ in range(moves):
+            if len(game.remaining_cards) == 0 or not play_random_move(game, rng):
+                break
+        states.append(game.game_state)
+    Game.journal.close()
+    return states
+
+def recover(directory:str)-> (float, list):
+    reset_registries()
+    journal = GameJournal(directory= directory)
+    start = time.perf_counter()
+    games = journal.recover()
+    elapsed = time.perf_counter()-start
+    journal.close()
+    return elapsed, [game.game_state for game in games]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= __doc__)
+    parser.add_argument("--games", type= int, default= 20)
+    parser.add_argument("--moves", type= int, default= 60)
+    parser.add_argument("--checkpoint-every", type= int, default= 20)
+    args = parser.parse_args()
+
+    for label, checkpoint_every in [("log replay only", 10**9), ("checkpoint every "+str(args.checkpoint_every), args.checkpoint_every)]:
+        with tempfile.TemporaryDirectory() as directory:
+            expected = populate(directory, args.games, args.moves, checkpoint_every)
+            elapsed, recovered = recover(directory)
+            if recovered != expected:
+                raise Exception("Recovered game states differ from the played ones")
+            print(f"{label:>24}: {args.games} games x {args.moves} moves recovered in {elapsed*1000:.1f} ms")
@@ -0,0 +1,104 @@
+""" Checks memory-mapped game states against the in-memory path and times both.
+
+The same seeded games are played move for move once with in-memory game states and once with
+ScratchStorage mapping every state of --min-qubits qubits or more, streamed in blocks of
+2**--block-qubits amplitudes. Games start at --min-qubits-1 qubits and add qubits with
+add_card, so states cross the threshold both ways and are both smaller and larger than a block.
+A game is compared up to its first remove_card: the in-memory measurement keeps only the
+magnitude of every amplitude and can fail on a division by zero, while the streamed one keeps
+the phases, so the two games part ways there. The script fails if a move succeeds on one path
+only, or the probability of any basis state differs by more than --max-error.
+
+Usage: python benchmark_scratch.py --games 10 --moves 60 --min-qubits 3 --block-qubits 2
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from code_game import Game
+from players import Player
+from scratch import ScratchStorage
+
+def reset_registries():
+    Game.all_games.clear()
+    Player.all_players.clear()
+
+def play(games:int, moves:int, num_qubits:int, seed:int)-> (list, float):
+    """ Plays seeded random games and returns the measurement and game state after every move, with the time it took.
+    """
+    reset_registries()
+    rng = random.Random(seed)
+    history = []
+    start = time.perf_counter()
+    for i in range(games):
+        initial_state = [1]+[0]*(2**num_qubits-1)
+        game = Game(initial_state= initial_state, decks= 6, seed= rng.getrandbits(64))
+        names = [name+"_"+str(game.game_id) for name in ["A", "B", "C"]]
+        for name in names:
+            Player(name= name)
+        game.distribute_cards(players= names, decks= game.num_decks)
+        game.set_target_states()
+        # every game draws its moves from its own generator, so a game that diverged does not shift the next ones
+        moves_rng = random.Random(game.seed)
+        states = []
+        for move in range(moves):
+            if len(game.remaining_cards) == 0:
+                break
+            player = game.get_players()[move % len(names)]
+            width = len(game.game_state).bit_length()-1
+            card = moves_rng.choice(player.cards)
+            if card in ["CNOT", "SWAP"]:
+                qubits = moves_rng.sample(range(width), 2) if width > 1 else [0, 0]
+            else:
+                qubits = [moves_rng.randrange(width)]
+            try:
+                measurement, game_state, _, _ = game.drop_card(players= game.get_players(), player= player.name, card= card, qubits= qubits)
+            except Exception:
+                states.append((card, None))
+                continue
+            states.append((card, np.array(game_state, dtype= complex)))
+        history.append(states)
+        game.end_game()
+    return history, time.perf_counter()-start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type= int, default= 10)
+    parser.add_argument("--moves", type= int, default= 60)
+    parser.add_argument("--min-qubits", type= int, default= 3)
+    parser.add_argument("--block-qubits", type= int, default= 2)
+    parser.add_argument("--max-error", type= float, default= 1e-9)
+    parser.add_argument("--seed", type= int, default= 0)
+    args = parser.parse_args()
+
+    Game.scratch = None
+    expected, expected_time = play(args.games, args.moves, args.min_qubits-1, args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        Game.scratch = ScratchStorage(directory= directory, min_qubits= args.min_qubits, block_qubits= args.block_qubits)
+        mapped, mapped_time = play(args.games, args.moves, args.min_qubits-1, args.seed)
+        Game.scratch = None
+
+    max_error = 0
+    compared = 0
+    mismatches = 0
+    for expected_game, mapped_game in zip(expected, mapped):
+        for (card, expected_state), (_, mapped_state) in zip(expected_game, mapped_game):
+            if card == "remove_card":
+                break
+            if (expected_state is None) != (mapped_state is None) or (expected_state is not None and len(expected_state) != len(mapped_state)):
+                mismatches = mismatches+1
+                break
+            if expected_state is None:
+                continue
+            compared = compared+1
+            max_error = max(max_error, float(np.max(np.abs(np.abs(expected_state)**2-np.abs(mapped_state)**2))))
+
+    print(f"in memory: {expected_time:.2f} s, mapped from {args.min_qubits} qubits in blocks of 2**{args.block_qubits}: {mapped_time:.2f} s")
+    print(f"{compared} moves compared, {mismatches} games differ in a move")
+    print(f"max probability error: {max_error:.2e} (bound {args.max_error:.0e})")
+    if mismatches != 0 or max_error > args.max_error:
+        sys.exit(1)
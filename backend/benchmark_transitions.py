@@ -0,0 +1,87 @@
+""" Measures the transition cache on many small seeded games.
+
+The same seeded games are played move for move without and with a TransitionCache. The time
+spent updating the game state and computing the fidelities every move reports (the work the
+cache saves, the rest of drop_card is the same either way), the hit rates of the cache and the
+largest difference of the reported fidelities are printed, and the script fails if the
+difference exceeds --max-error.
+
+Usage: python benchmark_transitions.py --games 200 --moves 40 --max-qubits 4
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmark_precision import reset_registries
+from code_game import Game
+from players import Player
+from transitions import TransitionCache
+
+def play(games:int, moves:int, seed:int, initial_qubits:int = 2)-> (list, float):
+    """ Plays seeded random games, returns the fidelities of every player after every move and the time spent on game states and fidelities.
+    """
+    reset_registries()
+    rng = random.Random(seed)
+    history = []
+    elapsed = 0.0
+    for i in range(games):
+        game = Game(initial_state= [1]+[0]*(2**initial_qubits-1), decks= 6, seed= rng.getrandbits(64))
+        names = [name+"_"+str(game.game_id) for name in ["A", "B", "C"]]
+        for name in names:
+            Player(name= name)
+        game.distribute_cards(players= names, decks= game.num_decks)
+        game.set_target_states()
+        fidelities = []
+        for move in range(moves):
+            if len(game.remaining_cards) == 0:
+                break
+            player = game.get_players()[move % len(names)]
+            num_qubits = len(game.game_state).bit_length()-1
+            card = rng.choice(player.cards)
+            if card in ["CNOT", "SWAP"]:
+                qubits = rng.sample(range(num_qubits), 2) if num_qubits > 1 else [0, 0]
+            else:
+                qubits = [rng.randrange(num_qubits)]
+            try:
+                measurement, _, _, _ = game.drop_card(players= game.get_players(), player= player.name, card= card, qubits= qubits, evaluate= False)
+            except Exception:
+                fidelities.append(None)
+                continue
+            players = game.get_players()
+            start = time.perf_counter()
+            game.game_state
+            _fidelities = game.players_fedilites(players= players)
+            elapsed = elapsed+time.perf_counter()-start
+            fidelities.append((measurement, [float(_fidelities[name]) for name in names]))
+        history.append(fidelities)
+    return history, elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type= int, default= 200)
+    parser.add_argument("--moves", type= int, default= 40)
+    parser.add_argument("--max-qubits", type= int, default= 4)
+    parser.add_argument("--max-error", type= float, default= 1e-8)
+    parser.add_argument("--seed", type= int, default= 0)
+    args = parser.parse_args()
+
+    Game.transitions = None
+    expected, uncached_time = play(args.games, args.moves, args.seed)
+    Game.transitions = TransitionCache(max_qubits= args.max_qubits)
+    cached, cached_time = play(args.games, args.moves, args.seed)
+
+    max_error = 0
+    for expected_game, cached_game in zip(expected, cached):
+        for expected_move, cached_move in zip(expected_game, cached_game):
+            if (expected_move is None) != (cached_move is None) or (expected_move is not None and expected_move[0] != cached_move[0]):
+                break
+            if expected_move is not None:
+                max_error = max([max_error]+[abs(a-b) for a, b in zip(expected_move[1], cached_move[1])])
+
+    stats = Game.transitions.stats()
+    print(f"game states and fidelities: {uncached_time*1000:.1f} ms without the cache, {cached_time*1000:.1f} ms with it")
+    print(f"transition hit rate {stats['transition_hit_rate']:.1%} ({stats['transitions']} entries), fidelity hit rate {stats['fidelity_hit_rate']:.1%} ({stats['fidelities']} entries)")
+    print(f"max fidelity error: {max_error:.2e} (bound {args.max_error:.0e})")
+    if max_error > args.max_error:
+        sys.exit(1)
@@ -0,0 +1,229 @@
+import collections
+import concurrent.futures
+import itertools
+import math
+import threading
+import time
+
+import numpy as np
+
+from gates import CARDS, CARD_CODES
+from code_game import Game
+
+class SearchTimeout(Exception):
+    pass
+
+class BotEngine():
+    """ Plans the moves of server-side bot players with a depth-limited expectimax search.
+
+    A bot only knows its own hand, its own target state, the game state and the cards left in
+    the deck. At every turn of the search it plays the best of its cards (on the best qubits), or
+    stops if no card is expected to do better than its current fidelity; the chance nodes are the
+    outcomes of remove_card and the card drawn after every move, weighted by the counts of the
+    cards left in the deck. The search deepens one turn at a time until `depth` turns or until
+    `time_budget` seconds are spent, and the deepest finished search decides the move. A bot
+    shows only once its fidelity reaches `show_threshold`, or when none of its cards can be played.
+
+    Values of searched positions are kept in a transposition cache keyed by a hash of the target,
+    the game state rounded to `decimals` digits, the hand as a multiset and the remaining depth,
+    so positions reached by different move orders, and positions searched on earlier turns, are
+    searched once. The deck a value was computed with is not part of the key: it changes by one
+    card per draw, which barely moves the draw probabilities.
+
+    With `workers` set, bot turns are planned in a pool of processes, each with its own cache.
+    """
+    def __init__(self, depth:int = 2, time_budget:float = 0.25, cache_size:int = 2**16, decimals:int = 6, show_threshold:float = 0.95, workers:int = 0) -> None:
+        self.depth = depth
+        self.time_budget = time_budget
+        self.cache_size = cache_size
+        self.decimals = decimals
+        self.show_threshold = show_threshold
+        self.workers = workers
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.gates = {}
+        for card in CARDS:
+            if card in ["add_card", "remove_card"]:
+                continue
+            gate = np.asarray(Game.get_gate_matrix(gate= card), dtype= complex)
+            self.gates[card] = (gate, int(len(gate)).bit_length()-1, bool(np.allclose(gate, np.eye(len(gate)))))
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers= workers) if workers > 0 else None
+        # a search keeps its target and deadline on the engine, so in-process searches run one at a time
+        self.lock = threading.Lock()
+        self.deadline = None
+        self.target = None
+        self.draws = []
+
+    def settings(self)-> dict:
+        return {"depth": self.depth, "time_budget": self.time_budget, "cache_size": self.cache_size,
+                "decimals": self.decimals, "show_threshold": self.show_threshold}
+
+    def inputs(self, game:Game, player)-> tuple:
+        """ What a bot player knows: its target state, the game state, its hand and the chances of every card being drawn next.
+        """
+        if game.num_decks is not None:
+            counts = collections.Counter(game._remaining_cards)
+        else:
+            counts = collections.Counter(CARD_CODES[card] for card in game.total_cards())
+        total = sum(counts.values())
+        draws = [(code, count/total) for code, count in sorted(counts.items())]
+        return (np.asarray(player.target_state, dtype= complex), np.asarray(game.game_state, dtype= complex), player.card_codes, draws)
+
+    def choose_move(self, game:Game, player)-> (str, list|None):
+        """ The move of a bot player: ("show", None) or (card, qubits).
+        """
+        inputs = self.inputs(game, player)
+        with self.lock:
+            return self.plan(*inputs)
+
+    def submit(self, game:Game, player)-> concurrent.futures.Future:
+        """ Plans the move of a bot player in the worker pool, or right away without one.
+        """
+        if self.pool is not None:
+            return self.pool.submit(plan_move, self.settings(), *self.inputs(game, player))
+        future = concurrent.futures.Future()
+        future.set_result(self.choose_move(game, player))
+        return future
+
+    def plan(self, target:np.ndarray, state:np.ndarray, hand:bytes, draws:list)-> (str, list|None):
+        self.target = (target, np.linalg.norm(target), hash((np.round(target, self.decimals)+0.0).tobytes()))
+        self.draws = draws
+        hand = bytes(sorted(hand))
+        if self.score(state) >= self.show_threshold:
+            return "show", None
+        best = None
+        self.deadline = None
+        start = time.monotonic()
+        for depth in range(1, self.depth+1):
+            try:
+                values = [(self.expected(state, hand, code, qubits, depth), code, qubits) for code, qubits in self.moves(state, hand)]
+            except SearchTimeout:
+                break
+            if len(values) == 0:
+                break
+            best = max(values, key= lambda value: value[0])
+            # the first turn is always searched in full, deeper ones only while there is time left
+            self.deadline = start+self.time_budget
+            if time.monotonic() > self.deadline:
+                break
+        self.deadline = None
+        if best is None:
+            # moves() leaves out qubits past the target, but growing the game still beats showing below the threshold
+            if CARD_CODES["add_card"] in hand:
+                return "add_card", []
+            # nothing in the hand can be played (remove_card or two-qubit gates on one qubit)
+            return "show", None
+        return CARDS[best[1]], list(best[2])
+
+    def score(self, state:np.ndarray)-> float:
+        """ Fidelity of the bot's target with a state, as Operations.fidelity computes it.
+        """
+        target, target_norm, _ = self.target
+        size = min(len(target), len(state))
+        return float(abs(np.vdot(state[:size], target[:size]))/(target_norm*np.linalg.norm(state)))
+
+    def moves(self, state:np.ndarray, hand:bytes)-> list:
+        """ Distinct legal moves of a hand, as (card code, qubits).
+        """
+        num_qubits = len(state).bit_length()-1
+        moves = []
+        for code in sorted(set(hand)):
+            card = CARDS[code]
+            if card == "add_card":
+                # qubits past the target only lower the fidelity
+                if len(state) < len(self.target[0]):
+                    moves.append((code, ()))
+            elif card == "remove_card":
+                if num_qubits > 1:
+                    moves.extend((code, (qubit,)) for qubit in range(num_qubits))
+            else:
+                _, num_gate_qubits, identity = self.gates[card]
+                if num_gate_qubits > num_qubits:
+                    continue
+                if identity:
+                    # only swaps the card for a new one, the qubits do not matter
+                    moves.append((code, tuple(range(num_gate_qubits))))
+                else:
+                    moves.extend((code, qubits) for qubits in itertools.permutations(range(num_qubits), num_gate_qubits))
+        return moves
+
+    def outcomes(self, state:np.ndarray, code:int, qubits:tuple)-> list:
+        """ States a move can lead to, with their probabilities.
+        """
+        card = CARDS[code]
+        if card == "add_card":
+            return [(1.0, np.concatenate([state, np.zeros_like(state)]))]
+        num_qubits = len(state).bit_length()-1
+        if card == "remove_card":
+            amplitudes = state.reshape(2**qubits[0], 2, -1)
+            outcomes = []
+            for bit in (0, 1):
+                part = amplitudes[:, bit, :].reshape(-1)
+                probability = float(np.vdot(part, part).real)
+                if probability > 1e-12:
+                    outcomes.append((probability, part/math.sqrt(probability)))
+            total = sum(probability for probability, _ in outcomes)
+            return [(probability/total, part) for probability, part in outcomes]
+        gate, num_gate_qubits, identity = self.gates[card]
+        if identity:
+            return [(1.0, state)]
+        # qubit 0 is the most significant bit of an index, i.e. the first axis
+        new_state = np.tensordot(gate.reshape((2,)*(2*num_gate_qubits)), state.reshape((2,)*num_qubits), axes= (list(range(num_gate_qubits, 2*num_gate_qubits)), list(qubits)))
+        new_state = np.moveaxis(new_state, list(range(num_gate_qubits)), list(qubits))
+        return [(1.0, new_state.reshape(-1))]
+
+    def expected(self, state:np.ndarray, hand:bytes, code:int, qubits:tuple, depth:int)-> float:
+        """ Expected value of playing a card with `depth` turns left, this one included.
+        """
+        index = hand.index(code)
+        rest = hand[:index]+hand[index+1:]
+        value = 0.0
+        for probability, new_state in self.outcomes(state, code, qubits):
+            if depth == 1:
+                value = value+probability*self.score(new_state)
+                continue
+            for drawn, chance in self.draws:
+                value = value+probability*chance*self.value(new_state, bytes(sorted(rest+bytes((drawn,)))), depth-1)
+        return value
+
+    def value(self, state:np.ndarray, hand:bytes, depth:int)-> float:
+        """ Value of a position with `depth` turns left: the best expected value of a move, or the current fidelity if no move beats it.
+        """
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SearchTimeout()
+        key = hash((self.target[2], (np.round(state, self.decimals)+0.0).tobytes(), hand, depth))
+        value = self.cache.get(key)
+        if value is not None:
+            self.hits = self.hits+1
+            self.cache.move_to_end(key)
+            return value
+        self.misses = self.misses+1
+        value = self.score(state)
+        for code, qubits in self.moves(state, hand):
+            value = max(value, self.expected(state, hand, code, qubits, depth))
+        self.cache[key] = value
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last= False)
+        return value
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures= True)
+
+    def stats(self)-> dict:
+        return {"depth": self.depth,
+                "time_budget": self.time_budget,
+                "workers": self.workers,
+                "cache_entries": len(self.cache),
+                "cache_hits": self.hits,
+                "cache_misses": self.misses}
+
+# engine of a worker process, created with the settings of the first move it plans
+worker_engine = None
+
+def plan_move(settings:dict, target:np.ndarray, state:np.ndarray, hand:bytes, draws:list)-> (str, list|None):
+    global worker_engine
+    if worker_engine is None:
+        worker_engine = BotEngine(**settings)
+    return worker_engine.plan(target, state, hand, draws)
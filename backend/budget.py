@@ -0,0 +1,108 @@
+import sys
+
+class ResourceBudget():
+    """ Memory budget of the games hosted by this process.
+
+    Memory is estimated from the number of amplitudes every game holds (its game state and the
+    target states of its players), and is tracked incrementally per game. A game may not grow
+    past `max_game_bytes` (nor past `max_qubits` when a qubit cap is set), and new games are only admitted while the estimated
+    memory of all games stays under `admission_ratio` of `max_total_bytes`.
+    """
+    # A statevector is a list of complex numbers: one complex object plus one list slot per amplitude.
+    BYTES_PER_AMPLITUDE = sys.getsizeof(complex())+8
+    BYTES_PER_INDEX = 8
+
+    def __init__(self, max_qubits:int|None = None, max_game_bytes:int = 64*2**20, max_total_bytes:int = 2**30, admission_ratio:float = 0.9, bytes_per_amplitude:int|None = None) -> None:
+        self.max_qubits = max_qubits
+        self.max_game_bytes = max_game_bytes
+        self.max_total_bytes = max_total_bytes
+        self.admission_ratio = admission_ratio
+        # states stored as numpy arrays (see StatePrecision) take only their item size per amplitude
+        self.bytes_per_amplitude = bytes_per_amplitude if bytes_per_amplitude is not None else ResourceBudget.BYTES_PER_AMPLITUDE
+        # ScratchStorage whose memory-mapped game states are not counted, None if every state is in memory
+        self.scratch = None
+        self.game_bytes = {}
+        self.used_bytes = 0
+
+    def state_bytes(self, num_amplitudes:int)-> int:
+        return num_amplitudes*self.bytes_per_amplitude
+
+    def working_bytes(self, num_qubits:int)-> int:
+        """ Estimates the temporary memory needed to apply a gate on a state of `num_qubits` qubits:
+        the new state plus one cached gather index or phase per amplitude.
+        """
+        return self.state_bytes(2**num_qubits) + 2**num_qubits*ResourceBudget.BYTES_PER_INDEX
+
+    def estimate_game_bytes(self, game)-> int:
+        amplitudes = len(game.game_state)
+        if self.scratch is not None and self.scratch.accepts(amplitudes):
+            amplitudes = 0
+        for player in game.get_players():
+            if player.target_state is not None:
+                amplitudes = amplitudes+len(player.target_state)
+        return self.state_bytes(amplitudes)
+
+    def update(self, game):
+        """ Recomputes the memory held by a game after its states changed.
+        """
+        game_bytes = self.estimate_game_bytes(game)
+        self.used_bytes = self.used_bytes - self.game_bytes.get(game.game_id, 0) + game_bytes
+        self.game_bytes[game.game_id] = game_bytes
+
+    def release(self, game):
+        self.used_bytes = self.used_bytes - self.game_bytes.pop(game.game_id, 0)
+
+    def check_add_qubit(self, game):
+        """ Checks that the game state of a game may grow by one qubit.
+
+        Raises:
+            Exception: the game would exceed the qubit cap, its own budget or the budget of the process
+        """
+        num_qubits = len(game.game_state).bit_length()
+        if self.max_qubits is not None and num_qubits > self.max_qubits:
+            raise Exception("Game cannot grow beyond "+str(self.max_qubits)+" qubits.")
+        if self.scratch is not None and self.scratch.accepts(2**num_qubits):
+            # the grown state is memory-mapped and processed in blocks
+            return
+        added_bytes = self.state_bytes(len(game.game_state))
+        if self.game_bytes.get(game.game_id, 0)+added_bytes+self.working_bytes(num_qubits) > self.max_game_bytes:
+            raise Exception("Game memory budget exceeded.")
+        if self.used_bytes+added_bytes > self.max_total_bytes:
+            raise Exception("Server memory budget exceeded, try again later.")
+
+    def can_admit(self, initial_state:list, num_players:int)-> bool:
+        """ Checks whether a new game with the given initial state and no. of players fits in the budget.
+        """
+        num_qubits = len(initial_state).bit_length()-1
+        if self.max_qubits is not None and num_qubits > self.max_qubits:
+            return False
+        new_bytes = self.state_bytes(len(initial_state)*(num_players+1))
+        return self.used_bytes+new_bytes <= self.max_total_bytes*self.admission_ratio
+
+    def can_admit_rooms(self, rooms:list)-> bool:
+        """ Checks whether new games, given as (initial state, no. of players), fit in the budget together.
+        """
+        new_bytes = 0
+        for initial_state, num_players in rooms:
+            if self.max_qubits is not None and len(initial_state).bit_length()-1 > self.max_qubits:
+                return False
+            new_bytes = new_bytes+self.state_bytes(len(initial_state)*(num_players+1))
+        return self.used_bytes+new_bytes <= self.max_total_bytes*self.admission_ratio
+
+    def limits(self)-> dict:
+        return {"max_qubits": self.max_qubits,
+                "max_game_bytes": self.max_game_bytes,
+                "max_total_bytes": self.max_total_bytes,
+                "admission_ratio": self.admission_ratio,
+                "used_bytes": self.used_bytes,
+                "games": len(self.game_bytes)}
+
+    def set_limits(self, max_qubits:int|None = None, max_game_bytes:int|None = None, max_total_bytes:int|None = None, admission_ratio:float|None = None):
+        if max_qubits is not None:
+            self.max_qubits = int(max_qubits)
+        if max_game_bytes is not None:
+            self.max_game_bytes = int(max_game_bytes)
+        if max_total_bytes is not None:
+            self.max_total_bytes = int(max_total_bytes)
+        if admission_ratio is not None:
+            self.admission_ratio = float(admission_ratio)
@@ -1,6 +1,8 @@
 import cmath
+import itertools
 import random
 import warnings
+from collections import OrderedDict
 import matplotlib.pyplot as plt
 
 from qiskit import QuantumCircuit
@@ -8,17 +10,41 @@ from qiskit import QuantumCircuit
 from qiskit.visualization import plot_bloch_vector, plot_bloch_multivector
 from qiskit.visualization.bloch import Bloch
 
-from gates import QuantumGates
+from gates import QuantumGates, CARDS, CARD_CODES
 from players import Player
 from utils import Operations, Constants
 
 class Game(Operations):
+    # Tens of thousands of idle games are kept around, so games are slotted and the
+    # deck, gate sequence and angles are stored as bytearrays of card codes and angle indices.
+    __slots__ = ("initial_state", "_game_state", "_pending_gates", "num_qubits", "num_decks", "_gate_sequence", "_random_angles",
+                 "target_sequence_num", "players", "ejected_players", "winning_players", "game_started",
+                 "_remaining_cards", "seed", "rng", "target_seed", "game_id", "version")
     all_games=[]
-
-    def __init__(self, initial_state:list = [1, 0, 0, 0], decks:int = None):
+    journal = None
+    budget = None
+    target_pool = None
+    # fused gates whose product differs from the identity by less than this are dropped
+    IDENTITY_TOLERANCE = 1e-12
+    # the queue of gates is applied once it grows past this length
+    MAX_PENDING_GATES = 32
+    # StatePrecision that game and target states are stored with, None to keep them as lists of Python complex numbers
+    precision = None
+    # Leaderboard updated with every result, None to keep no statistics
+    leaderboard = None
+    # ScratchStorage that keeps large game states in memory-mapped files, None to keep every state in memory
+    scratch = None
+    # StateSampler keeping the measurement tables of game states, released with the game
+    sampler = None
+    # TransitionCache shared by all games for the gates and fidelities of small states, None to always compute them
+    transitions = None
+    NO_ANGLE = 255
+
+    def __init__(self, initial_state:list = [1, 0, 0, 0], decks:int = None, seed:int|None = None):
         if self.is_valid_statevector(initial_state):
             self.initial_state = initial_state
-            self.game_state = initial_state
+            self._pending_gates = None
+            self.game_state = initial_state if Game.precision is None else Game.precision.store(initial_state)
             self.num_qubits = int(cmath.log(len(initial_state), 2).real)
             self.num_decks = decks
             self.gate_sequence = None
@@ -28,14 +54,16 @@ class Game(Operations):
             self.ejected_players = []
             self.winning_players = []
             self.game_started = False
-            self.cards = [i.name for i in list(QuantumGates)]
-            for i in ['Rx', 'Ry', 'Rz']:
-                self.cards.append(i)
-            if decks is not None:
-                self.cards = self.cards * decks
             self.remaining_cards = []
+            self.seed = seed if seed is not None else random.getrandbits(64)
+            self.rng = random.Random(self.seed)
+            self.target_seed = None
+            # counts the changes of the public state of the game (state, hands, deck, players), see main's /rooms/
+            self.version = 0
             Game.all_games.append(self)
             self.game_id = len(Game.all_games)-1
+            if Game.journal is not None:
+                Game.journal.record_create(self)
         else:
             raise Exception("Initial state provided in not a Statevector")
         
@@ -43,66 +71,207 @@ class Game(Operations):
     def get_all_games(g):
         return g.all_games
 
-    def set_target_states(self, players:list|None= None, total_qubits:int = None):
+    @property
+    def game_state(self)-> list:
+        """ Current game state, gates played since it was last read are applied first.
+        """
+        if self._pending_gates is not None:
+            self.flush_gates()
+        return self._game_state
+
+    @game_state.setter
+    def game_state(self, game_state:list):
+        self._game_state = game_state
+        self._pending_gates = None
+
+    def queue_gate(self, gate_matrix:list, qubits:list):
+        """ Queues a gate on the game state instead of applying it.
+
+        The gate is fused with the latest queued gate on the same qubits when every gate queued after
+        that one acts on other qubits (so they commute), and a fused gate equal to the identity is dropped.
+        """
+        qubits = tuple(qubits)
+        pending = self._pending_gates if self._pending_gates is not None else []
+        for i in range(len(pending)-1, -1, -1):
+            _qubits, _matrix = pending[i]
+            if _qubits == qubits:
+                gate_matrix = self.multiply_gates(gate_matrix, _matrix)
+                del pending[i]
+                break
+            if set(_qubits) & set(qubits):
+                break
+        if any(abs(gate_matrix[i][j]-(i == j)) > Game.IDENTITY_TOLERANCE for i in range(len(gate_matrix)) for j in range(len(gate_matrix))):
+            pending.append((qubits, gate_matrix))
+        self._pending_gates = pending if len(pending) != 0 else None
+        if len(pending) > Game.MAX_PENDING_GATES:
+            self.flush_gates()
+
+    def flush_gates(self):
+        """ Applies the queued gates to the game state.
+        """
+        game_state = self._game_state
+        for qubits, gate_matrix in self._pending_gates:
+            if Game.scratch is not None and Game.scratch.accepts(len(game_state)):
+                game_state = Game.scratch.apply_gate(self, game_state, gate_matrix, list(qubits))
+            elif Game.transitions is not None and Game.transitions.accepts(len(game_state)):
+                game_state = Game.transitions.apply_gate(game_state, gate_matrix, qubits, compute= lambda: self.apply_gate_to_statevector(statevector= game_state, unitary= gate_matrix, qubits= qubits))
+            else:
+                game_state = self.apply_gate_to_statevector(statevector= game_state, unitary= gate_matrix, qubits= qubits)
+        if Game.precision is not None:
+            game_state = Game.precision.store(game_state)
+        self.game_state = game_state
+
+    def fidelity(self, state1, state2)-> float:
+        if Game.transitions is not None and Game.transitions.accepts(len(state1)) and Game.transitions.accepts(len(state2)):
+            return Game.transitions.fidelity(self, state1, state2)
+        # array states give numpy scalars (float32 in complex64 mode), which responses cannot serialize
+        return float(Operations.fidelity(self, state1, state2).real)
+
+    @property
+    def cards(self)-> list:
+        cards = [i.name for i in list(QuantumGates)]
+        for i in ['Rx', 'Ry', 'Rz']:
+            cards.append(i)
+        if self.num_decks is not None:
+            cards = cards * self.num_decks
+        return cards
+
+    @property
+    def remaining_cards(self)-> list:
+        return [CARDS[i] for i in self._remaining_cards]
+
+    @remaining_cards.setter
+    def remaining_cards(self, cards:list):
+        self._remaining_cards = bytearray(CARD_CODES[card] for card in cards)
+
+    @property
+    def gate_sequence(self)-> list|None:
+        if self._gate_sequence is None:
+            return None
+        return [CARDS[i] for i in self._gate_sequence]
+
+    @gate_sequence.setter
+    def gate_sequence(self, gate_sequence:list|None):
+        self._gate_sequence = None if gate_sequence is None else bytearray(CARD_CODES[gate] for gate in gate_sequence)
+
+    @property
+    def random_angles(self)-> list:
+        return [None if i == Game.NO_ANGLE else Constants.R_angles.value[i] for i in self._random_angles]
+
+    @random_angles.setter
+    def random_angles(self, random_angles:list):
+        self._random_angles = bytearray(Game.NO_ANGLE if angle is None else Constants.R_angles.value.index(angle) for angle in random_angles)
+
+    def set_target_states(self, players:list|None= None, total_qubits:int = None, seed:int|None = None):
         if not self.game_started:
             raise Exception("Distribure cards for players")
         if players is None:
             players = self.get_players()
         if not isinstance(players[0], Player):
             players = self.player_ids_to_object(players= players)
-        target_state = self.initial_state.copy()
-        target_state = self.row_to_coloumn_vector(target_state)
         if total_qubits is None:
             total_qubits = self.num_qubits
+        # Only fresh target sets may come from the pool, a given seed must reproduce its own set.
+        use_pool = seed is None
+        # Always advance the game generator, so a replay passing the logged seed stays in step with the original game.
+        drawn_seed = self.rng.getrandbits(64)
+        if seed is None:
+            seed = drawn_seed
+        self.version = self.version+1
         if self.num_decks != None:
             if self.num_decks < len(players):
                 warnings.warn("Cards insufficient, add more decks")
                 return
-            gate_sequence = [i.name for i in list(QuantumGates)]
-            for i in ['Rx', 'Ry', 'Rz']:
-                gate_sequence.append(i)
-            gate_sequence = gate_sequence* self.num_decks
-            # for i in range(2*self.num_decks):
-            #     ii = random.randrange(8)
-
-            random.shuffle(gate_sequence)
-            target_sequence_num = random.sample(list(range(len(gate_sequence))), len(players))
-            target_sequence_num.sort()
-            self.target_sequence_num = target_sequence_num
+            target_set = None
+            if Game.target_pool is not None and use_pool:
+                target_set = Game.target_pool.pop(initial_state= self.initial_state, num_decks= self.num_decks, num_players= len(players), total_qubits= total_qubits)
+            if target_set is not None:
+                seed, target_states, gate_sequence, target_sequence_num, random_angles = target_set
+            else:
+                target_states, gate_sequence, target_sequence_num, random_angles = self.generate_target_set(initial_state= self.initial_state, num_decks= self.num_decks, num_players= len(players), total_qubits= total_qubits, seed= seed)
             self.gate_sequence = gate_sequence
-            target_states = []
-            for i in range(len(gate_sequence)):
-                if gate_sequence[i] in ['Rx', 'Ry', 'Rz']:
-                    angle = random.choice(Constants.R_angles.value)
-                else:
-                    angle = None
-                gate = self.get_gate_matrix(gate= gate_sequence[i], angle= angle)
-                self.random_angles.append(angle)
-                qubit = random.sample(list(range(total_qubits)), self.num_qubits_required(gate))
-                gate = self.get_total_unitary(unitary= gate, total_qubits= total_qubits, qubit_num= qubit)
-                target_state = self.multiply_gates(gate1= gate, gate2= target_state)
-                if i in target_sequence_num:
-                    if True not in [cmath.isclose(self.fidelity(self.coloumn_to_row_vector(target_state), present_state), 1) for present_state in target_states]:
-                        target_states.append(self.coloumn_to_row_vector(target_state))
-                        random.shuffle(target_states)
-                    else:
-                        target_states =self.set_target_states(players= players, total_qubits = total_qubits)
+            self.target_sequence_num = target_sequence_num
+            self.random_angles = random_angles
+            self.target_seed = seed
+            if Game.journal is not None:
+                Game.journal.record(self.game_id, "targets", seed= seed, total_qubits= total_qubits)
             try:
                 for i, player in enumerate(players):
-                    player.target_state = list(target_states[i])
+                    player.target_state = list(target_states[i]) if Game.precision is None else Game.precision.store(target_states[i])
             except AttributeError as e:
                 # print(e)
                 pass
+            if Game.budget is not None:
+                Game.budget.update(self)
 
             return target_states
         else:
+            rng = random.Random(seed)
+            self.target_seed = seed
+            if Game.journal is not None:
+                Game.journal.record(self.game_id, "targets", seed= seed, total_qubits= total_qubits)
             for player in players:
                 try:
-                    player.target_state = self.random_statevector(total_qubits)
+                    player.target_state = self.random_statevector(total_qubits, rng= rng)
+                    if Game.precision is not None:
+                        player.target_state = Game.precision.store(player.target_state)
                 except AttributeError as e:
                     print(e)
+            if Game.budget is not None:
+                Game.budget.update(self)
         return None, None
 
+    @classmethod
+    def generate_target_set(cls, initial_state:list, num_decks:int, num_players:int, total_qubits:int, seed:int)-> (list, list, list, list):
+        """ Generates distinct target states by applying a shuffled deck of gates on the initial state.
+
+        The same arguments always produce the same target set, which is what lets a journal replay it.
+        It does not need a game, so target sets can also be generated ahead of time.
+
+        Args:
+            initial_state (list): state the gates are applied on
+            num_decks (int): no. of decks the gate sequence is made of
+            num_players (int): number of target states to generate
+            total_qubits (int): no. of qubits of the target states
+            seed (int): seed of the random generator used for the deck, qubits and angles
+
+        Returns:
+            (list, list, list, list): target states, gate sequence, target sequence numbers, random angles
+        """
+        operations = Operations()
+        rng = random.Random(seed)
+        while True:
+            gate_sequence = [i.name for i in list(QuantumGates)]
+            for i in ['Rx', 'Ry', 'Rz']:
+                gate_sequence.append(i)
+            gate_sequence = gate_sequence* num_decks
+
+            rng.shuffle(gate_sequence)
+            target_sequence_num = rng.sample(list(range(len(gate_sequence))), num_players)
+            target_sequence_num.sort()
+            random_angles = []
+            target_states = []
+            target_state = list(initial_state)
+            duplicate = False
+            for i in range(len(gate_sequence)):
+                if gate_sequence[i] in ['Rx', 'Ry', 'Rz']:
+                    angle = rng.choice(Constants.R_angles.value)
+                else:
+                    angle = None
+                gate = cls.get_gate_matrix(gate= gate_sequence[i], angle= angle)
+                random_angles.append(angle)
+                qubit = rng.sample(list(range(total_qubits)), operations.num_qubits_required(gate))
+                target_state = operations.apply_gate_to_statevector(statevector= target_state, unitary= gate, qubits= qubit)
+                if i in target_sequence_num:
+                    if True not in [cmath.isclose(operations.fidelity(target_state, present_state), 1) for present_state in target_states]:
+                        target_states.append(list(target_state))
+                        rng.shuffle(target_states)
+                    else:
+                        duplicate = True
+                        break
+            if not duplicate:
+                return target_states, gate_sequence, target_sequence_num, random_angles
+
     def apply_gate_on_game_state(self, gate:str, angle:float= 0):
         gate_matrix = self.get_gate_matrix(gate= gate, angle= angle)
         if gate_matrix is None:
@@ -111,7 +280,8 @@ class Game(Operations):
         self.game_state = self.multiply_gates(gate_matrix, self.game_state)
         self.game_state = self.coloumn_to_row_vector(self.game_state)
 
-    def get_gate_matrix(self, gate:str, angle:float= 0):
+    @staticmethod
+    def get_gate_matrix(gate:str, angle:float= 0):
         if (angle not in Constants.R_angles.value) and (angle is not None):
             raise Exception("Gate not valid")
         if gate == 'Rx':
@@ -129,6 +299,7 @@ class Game(Operations):
         if self.game_started:
             raise Exception("Game: "+str(self.game_id)+" already started. Check for other games.")
         self.game_started = True
+        self.version = self.version+1
         player_flag = players.copy()
         if players is not None:
             if len(players)!=0 and (not isinstance(players[0], Player)):
@@ -154,7 +325,11 @@ class Game(Operations):
         
         if (decks is None) and (self.num_decks is not None):
             decks = self.num_decks
+        self.deal(players= players, decks= decks, num_cards= num_cards)
 
+    def deal(self, players:list, decks:int|None, num_cards:int = 7):
+        """ Deals the hands of the players (Player objects), one card to each player in turn.
+        """
         cards = [i.name for i in list(QuantumGates)]
         for i in ['Rx', 'Ry', 'Rz', 'add_card', 'remove_card']:
             cards.append(i)
@@ -162,17 +337,19 @@ class Game(Operations):
         if decks is None:
             for i in range(num_cards):
                 for player in players:
-                    player.add_card(random.choice(cards))
+                    player.add_card(self.rng.choice(cards))
         else:
             if num_cards*len(players) >= len(cards)*decks:
                 raise Exception("Insufficient number of cards to distribute/play")
-            self.remaining_cards = self.total_cards() * decks
+            self._remaining_cards = bytearray(range(len(CARDS))) * decks
             for i in range(num_cards):
                 for player in players:
-                    random_card = random.choice(self.remaining_cards)
-                    player.add_card(random_card)
-                    self.remaining_cards.remove(random_card)
+                    random_card = self.rng.choice(self._remaining_cards)
+                    player.add_card(CARDS[random_card])
+                    self._remaining_cards.remove(random_card)
             # print("After distribution:", len(self.remaining_cards))
+        if Game.journal is not None:
+            Game.journal.record(self.game_id, "deal", players= [player.name for player in players], decks= decks, num_cards= num_cards)
 
     def check_top_fedility(self, player):
         if not isinstance(player, Player):
@@ -224,10 +401,7 @@ class Game(Operations):
         return player.game_id == game_id
 
     def total_cards(self):
-        _ = [i.name for i in list(QuantumGates)]
-        for i in ["add_card", "remove_card", "Rx", "Ry", "Rz"]:
-            _.append(i)
-        return _.copy()
+        return CARDS.copy()
 
     def player_ids_to_object(self, players:list|str|int, game_id:int|None= None)-> list|Player:
         if game_id == None: game_id = self.game_id
@@ -253,7 +427,81 @@ class Game(Operations):
             fedilities[player.name] = self.fidelity(player.target_state, self.game_state).real
         return fedilities
     
-    def drop_card(self, players:list, player:Player|str, card:str, qubits:list= [], angle:float = None, game_id:int|None =None)-> (int|None, list, str, dict):
+    def drop_card(self, players:list, player:Player|str, card:str, qubits:list= [], angle:float = None, game_id:int|None =None, evaluate:bool = True)-> (int|None, list|None, str, dict|None):
+        """ Plays a card of a player.
+
+        Gates are queued (see `queue_gate`) and only applied when the game state is read. With
+        `evaluate` False the game state and fidelities are not read, so a gate move costs no state
+        update at all, and None is returned in their place.
+
+        Returns:
+            (int|None, list|None, str, dict|None): measurement of remove_card, game state, new card of the player, fidelities of the players
+        """
+        players, player, gate_matrix = self.check_move(players= players, player= player, card= card, qubits= qubits, game_id= game_id)
+        if gate_matrix is not None:
+            self.queue_gate(gate_matrix= gate_matrix, qubits= qubits)
+            measurement, game_state = None, None
+        else:
+            measurement, game_state = self.next_game_state(card= card, qubits= qubits, gate_matrix= gate_matrix)
+        return self.complete_move(players= players, player= player, card= card, qubits= qubits, angle= angle, measurement= measurement, game_state= game_state, evaluate= evaluate)
+
+    @classmethod
+    def create_rooms(cls, rooms:list, num_cards:int = 7)-> list:
+        """ Creates many games at once, for events that open hundreds of rooms.
+
+        Every room is created as /create_game/ would (same deal and targets for the same seeds), but
+        the players of all rooms are created in one batch and dealt from the Player objects, without
+        looking any player up by name, and the target states come from the shared target pool.
+
+        Args:
+            rooms (list): room specs, dicts of "players" (names, suffixed with "_<game id>"), "initial_state", "decks" and optionally "seed" and "target_seed"
+            num_cards (int, optional): cards per hand. Defaults to 7.
+
+        Returns:
+            list: the games, in the order of the specs
+        """
+        operations = Operations()
+        for room in rooms:
+            if not operations.is_valid_statevector(room.get("initial_state") or [1, 0, 0, 0]):
+                raise Exception("Initial state provided in not a Statevector")
+            if len(room.get("players") or []) == 0:
+                raise Exception("No players found")
+        # player names are checked before any game is created, so a bad room leaves no games behind;
+        # the rooms get the next game ids in order
+        names = [name+"_"+str(len(Game.all_games)+index) for index, room in enumerate(rooms) for name in room["players"]]
+        taken = {player.name for player in Player.all_players}
+        if len(set(names)) != len(names) or any(name in taken for name in names):
+            raise Exception("Player id already taken. Choose another")
+        games = [cls(initial_state= room.get("initial_state") or [1, 0, 0, 0], decks= room.get("decks"), seed= room.get("seed")) for room in rooms]
+        players = Player.create_players([name+"_"+str(game.game_id) for room, game in zip(rooms, games) for name in room["players"]])
+        start = 0
+        for room, game in zip(rooms, games):
+            room_players = players[start:start+len(room["players"])]
+            start = start+len(room_players)
+            for player in room_players:
+                player.game_id = game.game_id
+            game.game_started = True
+            game.version = game.version+1
+            game.deal(players= room_players, decks= game.num_decks, num_cards= num_cards)
+            game.set_target_states(players= room_players, seed= room.get("target_seed"))
+        return games
+
+    def fork(self)-> "GameFork":
+        """ Branches the game to try moves on it without changing the game.
+
+        The fork shares the game state and the target states with the game, and copies only the
+        queued gates, the hands and the deck (a few bytes each), so it is cheap until it plays.
+        """
+        hands = {player.name: player.card_codes for player in self.get_players()}
+        targets = {player.name: player.target_state for player in self.get_players()}
+        return GameFork(parent= self, hands= hands, targets= targets)
+
+    def check_move(self, players:list, player:Player|str, card:str, qubits:list= [], game_id:int|None =None)-> (list, Player, list|None):
+        """ Checks that a player may play a card on the given qubits, without changing the game.
+
+        Returns:
+            (list, Player, list|None): players and player as Player objects, matrix of the gate (None for add_card and remove_card)
+        """
         self.players = self.get_players(game_id= self.game_id)
         if game_id is None:
             game_id = self.game_id
@@ -266,34 +514,91 @@ class Game(Operations):
         for _player_ in players:
             if not self.is_player_of_game(player= _player_, game_id= game_id):
                 raise Exception("Player not a part of the game.")
-        measurement = None
-        try:
-            player.cards.remove(card)
-        except ValueError as e:
+        if not player.has_card(card):
             raise Exception("Card not in Player's cards")
-        if card == "add_card":
-            self.game_state = QuantumGates.add_qubit(statevector= self.game_state)
-        elif card == "remove_card":
-            if len(self.game_state) == 2:
-                raise Exception("Remove card is not allowded here")
-            measurement, self.game_state = QuantumGates.measure_and_remove_qubit(qubit= qubits[0], statevector= self.game_state)
-        else:
+        return players, player, self.check_card(card= card, qubits= qubits)
+
+    def check_card(self, card:str, qubits:list= [])-> list|None:
+        """ Checks that a card may be played on the given qubits of the game state, whoever holds it.
+
+        Returns:
+            list|None: matrix of the gate (None for add_card and remove_card)
+        """
+        # the length of the game state is read without applying queued gates
+        if card == "remove_card" and len(self._game_state) == 2:
+            raise Exception("Remove card is not allowded here")
+        if card == "add_card" and Game.budget is not None:
+            Game.budget.check_add_qubit(self)
+        gate_matrix = None
+        if card not in ["add_card", "remove_card"]:
             gate_matrix = self.get_gate_matrix(gate= card)
             num_qubits = self.num_qubits_required(gate_matrix)
-            if len(qubits)!=num_qubits or  qubits[0] not in range(int(cmath.log(len(self.game_state), 2).real)):
-                player.add_card(card= card)
+            if len(qubits)!=num_qubits or len(set(qubits))!=num_qubits or True in [qubit not in range(int(cmath.log(len(self._game_state), 2).real)) for qubit in qubits]:
                 raise Exception("Gate is not applicable for this set of qubits.")
-            total_unitary = self.get_total_unitary(unitary= gate_matrix, total_qubits = int(cmath.log(len(self.game_state), 2).real),qubit_num = qubits)
-            self.game_state = self.multiply_gates(total_unitary, self.row_to_coloumn_vector(self.game_state))
-            self.game_state = self.coloumn_to_row_vector(self.game_state)
+        return gate_matrix
+
+    def next_game_state(self, card:str, qubits:list, gate_matrix:list|None)-> (int|None, list):
+        """ Computes the game state after a checked move, without changing the game state.
+
+        Returns:
+            (int|None, list): measurement of remove_card, new game state
+        """
+        measurement = None
+        # A move that fails leaves the game untouched, including its random generator, so journal replays stay in step.
+        rng_state = self.rng.getstate()
+        try:
+            num_amplitudes = len(self.game_state)*(2 if card == "add_card" else 1)
+            if Game.scratch is not None and Game.scratch.accepts(num_amplitudes):
+                return Game.scratch.next_game_state(self, card= card, qubits= qubits, gate_matrix= gate_matrix)
+            if card in ["add_card", "remove_card"]:
+                # single precision states drift off norm 1, which the measurement checks, so they are renormalized in double precision first
+                statevector = [complex(i) for i in self.game_state] if Game.precision is None else Game.precision.to_list(self.game_state)
+            if card == "add_card":
+                game_state = QuantumGates.add_qubit(statevector= statevector)
+            elif card == "remove_card":
+                measurement, game_state = QuantumGates.measure_and_remove_qubit(qubit= qubits[0], statevector= statevector, rng= self.rng)
+            else:
+                game_state = self.apply_gate_to_statevector(statevector= self.game_state, unitary= gate_matrix, qubits= qubits)
+        except Exception:
+            self.rng.setstate(rng_state)
+            raise
+        return measurement, game_state
+
+    def complete_move(self, players:list, player:Player, card:str, qubits:list, angle:float|None, measurement:int|None, game_state:list|None, evaluate:bool = True)-> (int|None, list|None, str, dict|None):
+        """ Commits a checked move: sets the new game state, takes the card from the player and deals a new one.
+
+        Args:
+            game_state (list|None): new game state, None if the move only queued a gate
+
+        Returns:
+            (int|None, list|None, str, dict|None): measurement, game state, new card of the player, fidelities of the players (None for both unless `evaluate`)
+        """
+        player.remove_card(card)
+        self.version = self.version+1
+        if game_state is not None:
+            self.game_state = game_state
+            if Game.precision is not None:
+                self.game_state = Game.precision.store(game_state)
+        if Game.precision is not None:
+            Game.precision.after_move(self)
+        if Game.budget is not None and card in ["add_card", "remove_card"]:
+            Game.budget.update(self)
         
         if self.num_decks is not None:
-            new_card = random.choice(self.remaining_cards)
-            self.remaining_cards.remove(new_card)
+            new_card = self.rng.choice(self._remaining_cards)
+            self._remaining_cards.remove(new_card)
+            new_card = CARDS[new_card]
         else:
-            new_card = random.choice(self.total_cards())
+            new_card = self.rng.choice(self.total_cards())
         player.add_card(new_card)
 
+        if Game.journal is not None:
+            Game.journal.record_move(self, player= player.name, card= card, qubits= qubits, angle= angle, measurement= measurement, new_card= new_card)
+        if Game.leaderboard is not None:
+            Game.leaderboard.record_move(self, player= player.name)
+
+        if not evaluate:
+            return measurement, None, new_card, None
         fidelities = self.players_fedilites(players=players)
         # print("After dfropping:", len(self.remaining_cards))
 
@@ -322,8 +627,10 @@ class Game(Operations):
         """
         if self.num_decks is not None:  
             self.num_decks = self.num_decks+1
-            for i in self.total_cards():
-                self.remaining_cards.append(i)
+            self.version = self.version+1
+            self._remaining_cards.extend(range(len(CARDS)))
+            if Game.journal is not None:
+                Game.journal.record(self.game_id, "add_deck")
 
     def winners_list(self)->list:
         """ Returns list of all players in winning order.
@@ -352,37 +659,162 @@ class Game(Operations):
 
     def show(self, player:str):
         player = self.player_ids_to_object(players= player)
+        self.version = self.version+1
         if self.check_top_fedility(player):
             self.winning_players.append(player)
             b = True
         else:
             self.ejected_players.insert(0, player)
             b = False
+        if Game.leaderboard is not None:
+            Game.leaderboard.record_result(self, player.name, won= b, fidelity= self.fidelity(player.target_state, self.game_state).real)
         player.target_state = None 
         player.empty_cards()
         player.game_id = None
+        if Game.budget is not None:
+            Game.budget.update(self)
+        if Game.journal is not None:
+            Game.journal.record(self.game_id, "show", player= player.name, win= b)
         return b
 
     def drop(self, player:str):
         player = self.player_ids_to_object(players= player)
+        self.version = self.version+1
         self.ejected_players.append(player)
+        if Game.leaderboard is not None and player.target_state is not None:
+            Game.leaderboard.record_result(self, player.name, won= False, fidelity= self.fidelity(player.target_state, self.game_state).real)
         player.target_state = None 
         player.empty_cards()
         player.game_id = None
+        if Game.budget is not None:
+            Game.budget.update(self)
+        if Game.journal is not None:
+            Game.journal.record(self.game_id, "drop", player= player.name)
 
     def end_game(self):
         players = self.get_top_players()
+        self.version = self.version+1
         for player in players:
             self.winning_players.append(player)
+            if Game.leaderboard is not None and player.target_state is not None:
+                Game.leaderboard.record_result(self, player.name, won= True, fidelity= self.fidelity(player.target_state, self.game_state).real)
             player.target_state = None 
             player.empty_cards()
             player.game_id = None
+        if Game.budget is not None:
+            Game.budget.release(self)
+        if Game.precision is not None:
+            Game.precision.release(self)
+        if Game.scratch is not None:
+            Game.scratch.release(self)
+        if Game.leaderboard is not None:
+            Game.leaderboard.release(self)
+        if Game.sampler is not None:
+            Game.sampler.release(self)
+        if Game.journal is not None:
+            Game.journal.record(self.game_id, "end")
+
+class GameFork(Game):
+    """ What-if branch of a game, see `Game.fork`.
+
+    A fork plays like its game, with its own hands, deck and random generator (a copy of the
+    game's, so it draws the cards the game would draw), but it is not registered in
+    `Game.all_games`, its players are not `Player` objects and it is neither journaled nor
+    budgeted. Forks live in `GameFork.all_forks` until discarded, the oldest ones are dropped
+    past `MAX_FORKS`.
+    """
+    __slots__ = ("parent_id", "hands", "targets")
+    all_forks = OrderedDict()
+    MAX_FORKS = 1024
+    fork_ids = itertools.count()
+
+    def __init__(self, parent:Game, hands:dict, targets:dict) -> None:
+        self.game_id = "fork"+str(next(GameFork.fork_ids))
+        # forks of forks keep the id of the game, players are named after it
+        self.parent_id = parent.parent_id if isinstance(parent, GameFork) else parent.game_id
+        self.initial_state = parent.initial_state
+        self.num_qubits = parent.num_qubits
+        self.num_decks = parent.num_decks
+        self._gate_sequence = parent._gate_sequence
+        self._random_angles = parent._random_angles
+        self.target_sequence_num = parent.target_sequence_num
+        self.seed = parent.seed
+        self.target_seed = parent.target_seed
+        self.version = parent.version
+        self.game_started = parent.game_started
+        self.players = None
+        self.ejected_players = []
+        self.winning_players = []
+        # the deck is copied into an immutable snapshot, it becomes a bytearray on the first card drawn
+        self._remaining_cards = bytes(parent._remaining_cards)
+        self.hands = hands
+        self.targets = targets
+        self.rng = random.Random()
+        self.rng.setstate(parent.rng.getstate())
+        self._pending_gates = list(parent._pending_gates) if parent._pending_gates is not None else None
+        game_state = parent._game_state
+        if Game.scratch is not None and Game.scratch.accepts(len(game_state)):
+            game_state = Game.scratch.store(self, game_state)
+        elif not isinstance(game_state, list):
+            # arrays may be changed in place (renormalization, batched rows), lists are always replaced
+            game_state = game_state.copy()
+        self._game_state = game_state
+        GameFork.all_forks[self.game_id] = self
+        while len(GameFork.all_forks) > GameFork.MAX_FORKS:
+            GameFork.all_forks.popitem(last= False)[1].release()
 
+    @classmethod
+    def get_fork(cls, fork_id:str)-> "GameFork|None":
+        return cls.all_forks.get(fork_id)
 
-        
-gates = ['X', 'Z', 'Rx', 'CX', 'Ry','Reset']
-qubits  =[[1], [0], [2], [0,1], [2], [1]]
-angles = [None, None, cmath.pi, None, cmath.pi/4, None]
+    def fork(self)-> "GameFork":
+        return GameFork(parent= self, hands= {name: bytes(hand) for name, hand in self.hands.items()}, targets= dict(self.targets))
+
+    def player_cards(self, player:str)-> list:
+        return [CARDS[i] for i in self.hands[player]]
+
+    def fidelities(self)-> dict:
+        return {name: self.fidelity(target, self.game_state).real for name, target in self.targets.items() if target is not None}
 
-Game().save_circuit_image(gates=gates, qubits=qubits, angles=angles)
+    def drop_card(self, player:str, card:str, qubits:list= [], angle:float = None, evaluate:bool = True)-> (int|None, list|None, str, dict|None):
+        """ Plays a card of a player of the fork, with the rules of `Game.drop_card`.
 
+        Returns:
+            (int|None, list|None, str, dict|None): measurement of remove_card, game state, new card of the player, fidelities of the players
+        """
+        if player not in self.hands:
+            raise Exception("Player not a part of the game.")
+        if card not in CARD_CODES or CARD_CODES[card] not in self.hands[player]:
+            raise Exception("Card not in Player's cards")
+        gate_matrix = self.check_card(card= card, qubits= qubits)
+        measurement = None
+        if gate_matrix is not None:
+            self.queue_gate(gate_matrix= gate_matrix, qubits= qubits)
+        else:
+            measurement, game_state = self.next_game_state(card= card, qubits= qubits, gate_matrix= None)
+            self.game_state = game_state if Game.precision is None else Game.precision.store(game_state)
+        self.version = self.version+1
+        hand = bytearray(self.hands[player])
+        hand.remove(CARD_CODES[card])
+        if self.num_decks is not None:
+            if isinstance(self._remaining_cards, bytes):
+                self._remaining_cards = bytearray(self._remaining_cards)
+            new_card = self.rng.choice(self._remaining_cards)
+            self._remaining_cards.remove(new_card)
+            new_card = CARDS[new_card]
+        else:
+            new_card = self.rng.choice(self.total_cards())
+        hand.append(CARD_CODES[new_card])
+        self.hands[player] = hand
+        if not evaluate:
+            return measurement, None, new_card, None
+        return measurement, self.game_state, new_card, self.fidelities()
+
+    def release(self):
+        """ Discards the fork.
+        """
+        GameFork.all_forks.pop(self.game_id, None)
+        if Game.scratch is not None:
+            Game.scratch.release(self)
+        if Game.sampler is not None:
+            Game.sampler.release(self)
@@ -29,7 +29,12 @@ class QuantumGates(Enum):
             new_statevector.append(0)
         return new_statevector
 
-    def measure_and_remove_qubit(qubit:int, statevector:list)-> (int, list):
+    def measure_and_remove_qubit(qubit:int, statevector:list, rng:random.Random|None = None)-> (int, list):
+        if rng is None:
+            rng = random
+        if Operations.parallel is not None and Operations.parallel.accepts(statevector):
+            measurement, reduced_statevector = Operations.parallel.measure_and_remove_qubit(qubit, statevector, rng)
+            return measurement, reduced_statevector.tolist()
         states = len(statevector)
         binary_0 = 0
         binary_1 = 0
@@ -45,8 +50,12 @@ class QuantumGates(Enum):
             elif binary[qubit] == '1' and isinstance(amplitude, complex):
                 binary_1 = binary_1 + abs((amplitude**2).real)
             # print("measures:", binary_0, binary_1)
-        measurement = random.choices([0, 1], [binary_0, binary_1])[0]
+        measurement = rng.choices([0, 1], [binary_0, binary_1])[0]
         reduced_statevector = Operations().reduce_statevector(statevector= statevector, qubit= qubit, measurment_value= measurement)
         # print("reduced:",reduced_statevector)
         return measurement, reduced_statevector
     
+
+# Every card of a deck, a card is stored as its index in this list.
+CARDS = [i.name for i in list(QuantumGates)] + ["add_card", "remove_card", "Rx", "Ry", "Rz"]
+CARD_CODES = {card: code for code, card in enumerate(CARDS)}
@@ -0,0 +1,333 @@
+from array import array
+
+import json
+import os
+import struct
+import threading
+import time
+
+from code_game import Game
+from players import Player
+
+class GameJournal():
+    """ Append-only log of game events with periodic binary checkpoints of every game.
+
+    Every event (create, deal, targets, play, add_deck, show, drop, end) is appended to
+    the log as one JSON line with an increasing sequence number. Lines are flushed to the
+    file at once but only fsynced in batches, after `fsync_every` lines or at the latest
+    `fsync_interval` seconds after a line by a background thread, so a crash of the process
+    loses nothing and a crash of the machine at most the last batch. Every
+    `checkpoint_every` moves of a game its statevector, deck, hands and random generator
+    state are written to a compact binary checkpoint, so that recovery only has to replay
+    the moves logged after it.
+    """
+    MAGIC = b"QNCK"
+    VERSION = 1
+    LOG_FILE = "games.log"
+
+    def __init__(self, directory:str, checkpoint_every:int = 20, fsync_every:int = 32, fsync_interval:float = 0.05) -> None:
+        self.directory = directory
+        self.checkpoint_every = checkpoint_every
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok= True)
+        self.log_path = os.path.join(directory, GameJournal.LOG_FILE)
+        self._truncate_torn_tail()
+        self.seq = self._last_seq()
+        self.moves = {}
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.log_file = open(self.log_path, "a", encoding= "utf-8")
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.syncer = threading.Thread(target= self._sync_periodically, name= "journal-fsync", daemon= True)
+        self.syncer.start()
+
+    def record(self, game_id:int, event:str, **data):
+        """ Appends an event of a game to the log.
+
+        Args:
+            game_id (int): id of the game the event belongs to
+            event (str): name of the event
+            data: JSON serializable details of the event
+        """
+        with self.lock:
+            self.seq = self.seq+1
+            data["seq"] = self.seq
+            data["game_id"] = game_id
+            data["event"] = event
+            self.log_file.write(json.dumps(data, separators= (",", ":"))+"\n")
+            self.log_file.flush()
+            self.pending = self.pending+1
+            if self.pending >= self.fsync_every:
+                self._sync()
+
+    def record_create(self, game:Game):
+        self.record(game.game_id, "create", initial_state= [self._encode_amplitude(i) for i in game.initial_state], decks= game.num_decks, seed= game.seed)
+
+    def record_move(self, game:Game, **data):
+        """ Logs a played card and writes a checkpoint of the game every `checkpoint_every` moves.
+        """
+        self.record(game.game_id, "play", **data)
+        self.moves[game.game_id] = self.moves.get(game.game_id, 0)+1
+        if self.moves[game.game_id] % self.checkpoint_every == 0:
+            self.checkpoint(game)
+
+    def sync(self):
+        with self.lock:
+            if not self.log_file.closed:
+                self._sync()
+
+    def _sync(self):
+        self.log_file.flush()
+        os.fsync(self.log_file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def _sync_periodically(self):
+        while not self.stopped.wait(self.fsync_interval):
+            if self.pending != 0:
+                self.sync()
+
+    def close(self):
+        self.stopped.set()
+        with self.lock:
+            if not self.log_file.closed:
+                self._sync()
+                self.log_file.close()
+
+    def checkpoint_path(self, game_id:int)-> str:
+        return os.path.join(self.directory, "checkpoint_"+str(game_id)+".bin")
+
+    def checkpoint(self, game:Game):
+        """ Writes a binary checkpoint of the game, replacing the previous one atomically.
+
+        The checkpoint is a JSON header followed by the game state and the target states
+        of the players as packed little endian float64 (real, imag) pairs.
+        """
+        # The checkpoint must never be ahead of the log it refers to.
+        self.sync()
+        players = []
+        for player in game.get_players()+game.winning_players+game.ejected_players:
+            if player.name not in [i["name"] for i in players]:
+                players.append({"name": player.name,
+                                "cards": player.cards or [],
+                                "game_id": player.game_id,
+                                "target_state": None if player.target_state is None else len(player.target_state)})
+        header = {"seq": self.seq,
+                  "game_id": game.game_id,
+                  "moves": self.moves.get(game.game_id, 0),
+                  "game_state": len(game.game_state),
+                  "num_decks": game.num_decks,
+                  "game_started": game.game_started,
+                  "target_seed": game.target_seed,
+                  "gate_sequence": game.gate_sequence,
+                  "target_sequence_num": game.target_sequence_num,
+                  "random_angles": game.random_angles,
+                  "remaining_cards": game.remaining_cards,
+                  "rng_state": game.rng.getstate(),
+                  "players": players,
+                  "game_players": [player.name for player in (game.players or [])],
+                  "winning_players": [player.name for player in game.winning_players],
+                  "ejected_players": [player.name for player in game.ejected_players]}
+        body = self._pack_vector(game.game_state)
+        for _player in players:
+            if _player["target_state"] is not None:
+                body = body+self._pack_vector(Player.get_player(_player["name"]).target_state)
+        _header = json.dumps(header, separators= (",", ":")).encode("utf-8")
+        path = self.checkpoint_path(game.game_id)
+        with open(path+".tmp", "wb") as file:
+            file.write(GameJournal.MAGIC+struct.pack("<II", GameJournal.VERSION, len(_header))+_header+body)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path+".tmp", path)
+
+    def load_checkpoint(self, game_id:int)-> dict|None:
+        """ Reads the checkpoint of a game.
+
+        Returns:
+            dict|None: checkpoint header with the vectors unpacked, None if the game has no checkpoint.
+        """
+        path = self.checkpoint_path(game_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            data = file.read()
+        if data[:4] != GameJournal.MAGIC:
+            raise Exception("Checkpoint "+path+" is corrupted")
+        version, header_length = struct.unpack("<II", data[4:12])
+        if version != GameJournal.VERSION:
+            raise Exception("Unsupported checkpoint version: "+str(version))
+        header = json.loads(data[12:12+header_length].decode("utf-8"))
+        offset = 12+header_length
+        header["game_state"], offset = self._unpack_vector(data, offset, header["game_state"])
+        for player in header["players"]:
+            if player["target_state"] is not None:
+                player["target_state"], offset = self._unpack_vector(data, offset, player["target_state"])
+        return header
+
+    def read_events(self)-> list:
+        """ Reads all complete events of the log. A torn last line left by a crash is ignored.
+        """
+        events = []
+        if not os.path.exists(self.log_path):
+            return events
+        with open(self.log_path, "r", encoding= "utf-8") as file:
+            for line in file:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        return events
+
+    def recover(self)-> list:
+        """ Rebuilds every game of the log from its latest checkpoint plus the events logged after it.
+
+        Must be called before any new game is created, so that game ids match the log.
+
+        Raises:
+            Exception: game ids of the log do not match the game registry
+            Exception: replayed move does not reproduce the logged outcome
+
+        Returns:
+            list: recovered games
+        """
+        journal = Game.journal
+        Game.journal = None
+        try:
+            events = {}
+            for event in self.read_events():
+                events.setdefault(event["game_id"], []).append(event)
+            games = []
+            for game_id in sorted(events.keys()):
+                create = events[game_id][0]
+                if create["event"] != "create":
+                    continue
+                if game_id != len(Game.get_all_games()):
+                    raise Exception("Journal game "+str(game_id)+" does not match the game registry")
+                game = Game(initial_state= [self._decode_amplitude(i) for i in create["initial_state"]], decks= create["decks"], seed= create["seed"])
+                checkpoint = self.load_checkpoint(game_id)
+                replay_from = create["seq"]
+                if checkpoint is not None:
+                    self._restore_checkpoint(game, checkpoint)
+                    replay_from = checkpoint["seq"]
+                for event in events[game_id]:
+                    if event["seq"] > replay_from:
+                        self._replay(game, event)
+                games.append(game)
+            return games
+        finally:
+            Game.journal = journal
+
+    def _replay(self, game:Game, event:dict):
+        if event["event"] == "deal":
+            for name in event["players"]:
+                if Player.get_player(name) is None:
+                    Player(name= name)
+            game.distribute_cards(players= event["players"], decks= event["decks"], num_cards= event["num_cards"])
+        elif event["event"] == "targets":
+            game.set_target_states(total_qubits= event["total_qubits"], seed= event["seed"])
+        elif event["event"] == "play":
+            measurement, _, new_card, _ = game.drop_card(players= game.get_players(), player= event["player"], card= event["card"], qubits= event["qubits"], angle= event["angle"])
+            if measurement != event["measurement"] or new_card != event["new_card"]:
+                raise Exception("Replay of game "+str(game.game_id)+" diverged at event "+str(event["seq"]))
+            self.moves[game.game_id] = self.moves.get(game.game_id, 0)+1
+        elif event["event"] == "add_deck":
+            game.add_deck()
+        elif event["event"] == "show":
+            game.show(player= event["player"])
+        elif event["event"] == "drop":
+            game.drop(player= event["player"])
+        elif event["event"] == "end":
+            game.end_game()
+
+    def _restore_checkpoint(self, game:Game, checkpoint:dict):
+        game.game_state = checkpoint["game_state"] if Game.precision is None else Game.precision.store(checkpoint["game_state"])
+        game.num_decks = checkpoint["num_decks"]
+        game.game_started = checkpoint["game_started"]
+        game.target_seed = checkpoint["target_seed"]
+        game.gate_sequence = checkpoint["gate_sequence"]
+        game.target_sequence_num = checkpoint["target_sequence_num"]
+        game.random_angles = checkpoint["random_angles"]
+        game.remaining_cards = checkpoint["remaining_cards"]
+        version, internal_state, gauss = checkpoint["rng_state"]
+        game.rng.setstate((version, tuple(internal_state), gauss))
+        for _player in checkpoint["players"]:
+            player = Player.get_player(_player["name"])
+            if player is None:
+                player = Player(name= _player["name"])
+            player.target_state = _player["target_state"] if Game.precision is None or _player["target_state"] is None else Game.precision.store(_player["target_state"])
+            player.empty_cards()
+            for card in _player["cards"]:
+                player.add_card(card)
+            player.game_id = None
+            player.game_id = _player["game_id"]
+        game.players = game.player_ids_to_object(players= checkpoint["game_players"])
+        game.winning_players = game.player_ids_to_object(players= checkpoint["winning_players"])
+        game.ejected_players = game.player_ids_to_object(players= checkpoint["ejected_players"])
+        self.moves[game.game_id] = checkpoint["moves"]
+
+    def _truncate_torn_tail(self):
+        # A crash in the middle of a write leaves a line without its newline, appending to it would corrupt the next event.
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "rb+") as file:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            end = size
+            while end > 0:
+                file.seek(max(0, end-4096))
+                block = file.read(end-max(0, end-4096))
+                newline = block.rfind(b"\n")
+                if newline != -1:
+                    end = max(0, end-4096)+newline+1
+                    break
+                end = max(0, end-4096)
+            if end != size:
+                file.truncate(end)
+
+    def _last_seq(self)-> int:
+        if not os.path.exists(self.log_path):
+            return 0
+        with open(self.log_path, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            file.seek(max(0, size-65536))
+            lines = file.read().splitlines()
+        for line in reversed(lines):
+            try:
+                return json.loads(line)["seq"]
+            except (json.JSONDecodeError, UnicodeDecodeError, KeyError):
+                continue
+        events = self.read_events()
+        return events[-1]["seq"] if len(events) != 0 else 0
+
+    def _encode_amplitude(self, amplitude):
+        if isinstance(amplitude, int|float):
+            return amplitude
+        return [amplitude.real, amplitude.imag]
+
+    def _decode_amplitude(self, amplitude):
+        if isinstance(amplitude, list):
+            return complex(amplitude[0], amplitude[1])
+        return amplitude
+
+    def _pack_vector(self, vector:list)-> bytes:
+        values = array("d")
+        for amplitude in vector:
+            amplitude = complex(amplitude)
+            values.append(amplitude.real)
+            values.append(amplitude.imag)
+        if values.itemsize != 8:
+            raise Exception("float64 arrays are required for checkpoints")
+        if struct.pack("=d", 1.0) != struct.pack("<d", 1.0):
+            values.byteswap()
+        return values.tobytes()
+
+    def _unpack_vector(self, data:bytes, offset:int, length:int)-> (list, int):
+        values = array("d")
+        values.frombytes(data[offset:offset+16*length])
+        if struct.pack("=d", 1.0) != struct.pack("<d", 1.0):
+            values.byteswap()
+        vector = [complex(values[2*i], values[2*i+1]) for i in range(length)]
+        return vector, offset+16*length
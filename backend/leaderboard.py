@@ -0,0 +1,150 @@
+import random
+
+class SkipList():
+    """ Sorted set of comparable keys with O(log n) expected insert and remove, and the first k keys in O(log n + k).
+    """
+    MAX_LEVEL = 32
+
+    def __init__(self, seed:int = 0) -> None:
+        self.rng = random.Random(seed)
+        # a node is [key, next node per level]
+        self.head = [None, [None]*SkipList.MAX_LEVEL]
+        self.level = 1
+        self.size = 0
+
+    def __len__(self)-> int:
+        return self.size
+
+    def predecessors(self, key)-> list:
+        """ Last node before `key` on every level.
+        """
+        node = self.head
+        update = [self.head]*SkipList.MAX_LEVEL
+        for level in range(self.level-1, -1, -1):
+            while node[1][level] is not None and node[1][level][0] < key:
+                node = node[1][level]
+            update[level] = node
+        return update
+
+    def insert(self, key):
+        update = self.predecessors(key)
+        level = 1
+        while level < SkipList.MAX_LEVEL and self.rng.random() < 0.5:
+            level = level+1
+        self.level = max(self.level, level)
+        node = [key, [None]*level]
+        for i in range(level):
+            node[1][i] = update[i][1][i]
+            update[i][1][i] = node
+        self.size = self.size+1
+
+    def remove(self, key):
+        update = self.predecessors(key)
+        node = update[0][1][0]
+        if node is None or node[0] != key:
+            raise KeyError(key)
+        for i in range(len(node[1])):
+            update[i][1][i] = node[1][i]
+        while self.level > 1 and self.head[1][self.level-1] is None:
+            self.level = self.level-1
+        self.size = self.size-1
+
+    def first(self, k:int)-> list:
+        keys = []
+        node = self.head[1][0]
+        while node is not None and len(keys) < k:
+            keys.append(node[0])
+            node = node[1][0]
+        return keys
+
+class Leaderboard():
+    """ Lobby-wide player rankings, updated incrementally from game results.
+
+    Every result (a `show`, a `drop`, or a player left at `end_game`) updates the totals of one
+    player and moves them in one sorted index per ranking, so updates are O(log n) and top-k
+    queries O(log n + k) however many games have been played. Players are ranked by their lobby
+    name, the player name without its "_<game id>" suffix.
+    """
+    RANKINGS = ["wins", "win_rate", "fidelity", "fastest_win"]
+
+    def __init__(self) -> None:
+        self.players = {}
+        self.moves = {}
+        self.indexes = {ranking: SkipList() for ranking in Leaderboard.RANKINGS}
+        self.keys = {ranking: {} for ranking in Leaderboard.RANKINGS}
+
+    @staticmethod
+    def lobby_name(name:str)-> str:
+        return name.rsplit("_", 1)[0]
+
+    def record_move(self, game, player:str):
+        # moves are counted per player, a win is only as fast as the moves of the winner
+        moves = self.moves.setdefault(game.game_id, {})
+        moves[player] = moves.get(player, 0)+1
+
+    def release(self, game):
+        self.moves.pop(game.game_id, None)
+
+    def sort_key(self, ranking:str, name:str, stats:dict)-> tuple|None:
+        """ Key of a player in a ranking, smaller keys rank higher. None leaves the player out of the ranking.
+        """
+        if ranking == "wins":
+            return (-stats["wins"], name)
+        if ranking == "win_rate":
+            return (-stats["wins"]/stats["games"], -stats["games"], name)
+        if ranking == "fidelity":
+            if stats["fidelities"] == 0:
+                return None
+            return (-stats["fidelity_sum"]/stats["fidelities"], name)
+        if stats["fastest_win"] is None:
+            return None
+        return (stats["fastest_win"], name)
+
+    def record_result(self, game, player:str, won:bool, fidelity:float|None = None):
+        """ Adds the result of a player in a game.
+
+        Args:
+            game (Game): the game the player finished
+            player (str): name of the player in the game
+            won (bool): whether the player won
+            fidelity (float|None): fidelity of the player's target state with the final game state
+        """
+        name = Leaderboard.lobby_name(player)
+        stats = self.players.setdefault(name, {"games": 0, "wins": 0, "fidelity_sum": 0.0, "fidelities": 0, "fastest_win": None})
+        stats["games"] = stats["games"]+1
+        if won:
+            stats["wins"] = stats["wins"]+1
+            moves = self.moves.get(game.game_id, {}).get(player, 0)
+            if stats["fastest_win"] is None or moves < stats["fastest_win"]:
+                stats["fastest_win"] = moves
+        if fidelity is not None:
+            stats["fidelity_sum"] = stats["fidelity_sum"]+float(fidelity)
+            stats["fidelities"] = stats["fidelities"]+1
+        for ranking in Leaderboard.RANKINGS:
+            key = self.sort_key(ranking, name, stats)
+            previous = self.keys[ranking].get(name)
+            if previous == key:
+                continue
+            if previous is not None:
+                self.indexes[ranking].remove(previous)
+            if key is not None:
+                self.indexes[ranking].insert(key)
+                self.keys[ranking][name] = key
+
+    def player_stats(self, name:str)-> dict|None:
+        stats = self.players.get(name)
+        if stats is None:
+            return None
+        return {"player": name,
+                "games": stats["games"],
+                "wins": stats["wins"],
+                "win_rate": stats["wins"]/stats["games"],
+                "fidelity": stats["fidelity_sum"]/stats["fidelities"] if stats["fidelities"] != 0 else None,
+                "fastest_win": stats["fastest_win"]}
+
+    def top(self, ranking:str, k:int = 10)-> list:
+        """ The first k players of a ranking with their statistics.
+        """
+        if ranking not in Leaderboard.RANKINGS:
+            raise ValueError(f"Unknown ranking: {ranking}")
+        return [self.player_stats(key[-1]) for key in self.indexes[ranking].first(k)]
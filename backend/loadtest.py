@@ -0,0 +1,180 @@
+""" Load generator that plays many concurrent rooms against the game API.
+
+Every room is created through /create_game/ and then played turn by turn through /play_card/,
+with /game_circuit/ renders, /add_deck/ when the deck runs low, and /show/ and /drop/ at the
+end. Concurrency is ramped through the given stages, and for each stage throughput, latency
+percentiles and error rates per endpoint and the RSS of the server process are reported.
+
+Usage:
+    python loadtest.py --concurrency 1,4,16 --rooms 20            # in-process against main.app
+    python loadtest.py --url http://127.0.0.1:8000 --pid 1234     # against a running uvicorn
+"""
+import argparse
+import asyncio
+import random
+import resource
+import time
+
+import httpx
+
+class LoadStats():
+    def __init__(self) -> None:
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint:str, latency:float, error:bool):
+        self.latencies.setdefault(endpoint, []).append(latency)
+        self.errors[endpoint] = self.errors.get(endpoint, 0)+int(error)
+
+    def percentile(self, values:list, percent:float)-> float:
+        values = sorted(values)
+        return values[min(len(values)-1, int(round(percent/100*(len(values)-1))))]
+
+    def report(self, elapsed:float)-> str:
+        total = sum(len(i) for i in self.latencies.values())
+        lines = [f"{total} requests in {elapsed:.2f} s, {total/elapsed:.1f} req/s"]
+        lines.append(f"{'endpoint':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+        for endpoint, latencies in sorted(self.latencies.items()):
+            lines.append(f"{endpoint:<16}{len(latencies):>7}"
+                         f"{self.percentile(latencies, 50)*1000:>10.1f}{self.percentile(latencies, 95)*1000:>10.1f}{self.percentile(latencies, 99)*1000:>10.1f}"
+                         f"{self.errors[endpoint]/len(latencies):>8.1%}")
+        return "\n".join(lines)
+
+class Room():
+    """ Client side view of one room: the hands of its players and the circuit played so far.
+    """
+    def __init__(self, client:httpx.AsyncClient, stats:LoadStats, rng:random.Random, players:int, growth:float, render_ratio:float, circuit_format:str) -> None:
+        self.client = client
+        self.stats = stats
+        self.rng = rng
+        self.players = ["P"+str(i) for i in range(players)]
+        self.growth = growth
+        self.render_ratio = render_ratio
+        self.circuit_format = circuit_format
+        self.game_id = None
+        self.hands = {}
+        self.num_qubits = 2
+        self.remaining_cards = None
+        self.circuit = []
+
+    async def post(self, endpoint:str, body:dict)-> dict|None:
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(endpoint, json= body)
+            data = response.json()
+            error = response.status_code >= 400 or (isinstance(data, dict) and "error" in data)
+        except (httpx.HTTPError, ValueError):
+            data = None
+            error = True
+        self.stats.record(endpoint, time.perf_counter()-start, error)
+        return None if error else data
+
+    async def create(self)-> bool:
+        data = await self.post("/create_game/", {"players": self.players, "initial_state": [1, 0, 0, 0], "decks": len(self.players)+1})
+        if data is None:
+            return False
+        self.game_id = data["game_id"]
+        self.hands = {name: list(details["cards"]) for name, details in data["data"].items()}
+        return True
+
+    def choose_move(self, player:str)-> tuple|None:
+        hand = self.hands[player]
+        if "add_card" in hand and self.rng.random() < self.growth:
+            return "add_card", [0]
+        cards = [card for card in hand if card not in ["add_card", "remove_card"] and (card not in ["CNOT", "SWAP"] or self.num_qubits > 1)]
+        if len(cards) == 0:
+            return None
+        card = self.rng.choice(cards)
+        if card in ["CNOT", "SWAP"]:
+            return card, self.rng.sample(range(self.num_qubits), 2)
+        return card, [self.rng.randrange(self.num_qubits)]
+
+    async def turn(self, player:str):
+        move = self.choose_move(player)
+        if move is None:
+            return
+        card, qubits = move
+        data = await self.post("/play_card/", {"game_id": self.game_id, "player": player, "card": card, "qubits": qubits, "angle": 0})
+        if data is None or player not in data:
+            return
+        result = data[player]
+        self.hands[player].remove(card)
+        self.hands[player].append(result["new_card"])
+        self.num_qubits = len(result["game_state"]).bit_length()-1
+        self.remaining_cards = result["remaining_cards"]
+        if card not in ["add_card", "remove_card"]:
+            self.circuit.append([card, qubits, None])
+        if self.remaining_cards < 2*len(self.players):
+            await self.post("/add_deck/", {"game_id": self.game_id})
+        if self.rng.random() < self.render_ratio and len(self.circuit) != 0:
+            await self.post("/game_circuit/", {"game_id": self.game_id, "format": self.circuit_format,
+                                               "data": {str(i): gate for i, gate in enumerate(self.circuit)}})
+
+    async def play(self, turns:int):
+        if not await self.create():
+            return
+        for i in range(turns):
+            await self.turn(self.players[i % len(self.players)])
+        await self.post("/show/", {"game_id": self.game_id, "player": self.players[0]})
+        for player in self.players[1:-1]:
+            await self.post("/drop/", {"game_id": self.game_id, "player": player})
+
+def rss_bytes(pid:int|None = None)-> int:
+    """ Resident set size of a process, this one by default.
+    """
+    try:
+        with open("/proc/"+(str(pid) if pid is not None else "self")+"/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+    return 0
+
+async def run_stage(client:httpx.AsyncClient, concurrency:int, rooms:int, args, rng:random.Random)-> (LoadStats, float):
+    stats = LoadStats()
+    queue = list(range(rooms))
+
+    async def worker():
+        while len(queue) != 0:
+            queue.pop()
+            room = Room(client, stats, random.Random(rng.getrandbits(64)), args.players, args.growth, args.render_ratio, args.circuit_format)
+            await room.play(args.turns)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return stats, time.perf_counter()-start
+
+async def run(args):
+    if args.url is None:
+        import main as game_api
+        transport = httpx.ASGITransport(app= game_api.app)
+        client = httpx.AsyncClient(transport= transport, base_url= "http://loadtest", timeout= None)
+        pid = None
+    else:
+        client = httpx.AsyncClient(base_url= args.url, timeout= None)
+        pid = args.pid
+    rng = random.Random(args.seed)
+    async with client:
+        for concurrency in [int(i) for i in args.concurrency.split(",")]:
+            stats, elapsed = await run_stage(client, concurrency, args.rooms, args, rng)
+            print(f"\n== concurrency {concurrency}, {args.rooms} rooms x {args.turns} turns ==")
+            print(stats.report(elapsed))
+            if args.url is None or pid is not None:
+                print(f"server RSS: {rss_bytes(pid)/2**20:.1f} MiB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default= None, help= "base url of a running server, the app is loaded in-process if omitted")
+    parser.add_argument("--pid", type= int, default= None, help= "pid of the server process to report RSS for")
+    parser.add_argument("--concurrency", default= "1,4,16", help= "comma separated concurrent rooms per stage")
+    parser.add_argument("--rooms", type= int, default= 20, help= "rooms played per stage")
+    parser.add_argument("--players", type= int, default= 3)
+    parser.add_argument("--turns", type= int, default= 30, help= "cards played per room")
+    parser.add_argument("--growth", type= float, default= 0.3, help= "probability of playing add_card when it is in the hand")
+    parser.add_argument("--render-ratio", type= float, default= 0.2, help= "probability of requesting /game_circuit/ after a turn")
+    parser.add_argument("--circuit-format", default= "svg", choices= ["svg", "png"])
+    parser.add_argument("--seed", type= int, default= 0)
+    asyncio.run(run(parser.parse_args()))
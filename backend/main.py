@@ -1,15 +1,174 @@
-from fastapi import FastAPI, HTTPException, APIRouter, Request
+from fastapi import FastAPI, HTTPException, APIRouter, Request, Response
+from fastapi.responses import FileResponse, JSONResponse
 from players import Player
-from code_game import Game
+from code_game import Game, GameFork
+from journal import GameJournal
+from budget import ResourceBudget
+from target_pool import TargetStatePool
+from renders import RenderCache
+from profiler import RequestProfiler
+from parallel import ParallelKernels
+from precision import StatePrecision
+from scratch import ScratchStorage
+from admission import AdmissionController
+from leaderboard import Leaderboard
+from sampling import StateSampler
+from bots import BotEngine
+from recorder import TrafficRecorder
+from transitions import TransitionCache
+from snapshots import RoomSnapshots
+from utils import Operations
 
 from pydantic import BaseModel
 
+from contextlib import asynccontextmanager
+
+import asyncio
 import json
 import os
+import time
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    yield
+    # lines logged since the last batch are fsynced before the server stops
+    if Game.journal is not None:
+        Game.journal.close()
 
-app = FastAPI()
+app = FastAPI(lifespan= lifespan)
 # app = APIRouter()
 
+# Game and target states are stored as complex64 or complex128 arrays when QUNO_PRECISION is set, as lists of complex numbers otherwise.
+if os.environ.get("QUNO_PRECISION"):
+    Game.precision = StatePrecision(dtype= os.environ["QUNO_PRECISION"],
+                                    renormalize_every= int(os.environ.get("QUNO_RENORMALIZE_EVERY", 8)))
+
+# Game states of QUNO_SCRATCH_QUBITS qubits or more are memory-mapped in QUNO_SCRATCH_DIR when it is set.
+if os.environ.get("QUNO_SCRATCH_DIR"):
+    Game.scratch = ScratchStorage(directory= os.environ["QUNO_SCRATCH_DIR"],
+                                  min_qubits= int(os.environ.get("QUNO_SCRATCH_QUBITS", 20)),
+                                  dtype= Game.precision.dtype if Game.precision is not None else complex)
+
+# Games are journaled and recovered after a restart only when a journal directory is configured.
+if os.environ.get("QUNO_JOURNAL_DIR"):
+    journal = GameJournal(directory= os.environ["QUNO_JOURNAL_DIR"],
+                          checkpoint_every= int(os.environ.get("QUNO_CHECKPOINT_EVERY", 20)))
+    journal.recover()
+    Game.journal = journal
+
+# Rankings cover the results of games played since the server started.
+leaderboard = Leaderboard()
+Game.leaderboard = leaderboard
+
+# Measurement tables of the QUNO_SAMPLER_TABLES most recently sampled game states are kept.
+sampler = StateSampler(max_tables= int(os.environ.get("QUNO_SAMPLER_TABLES", 64)))
+Game.sampler = sampler
+MAX_SHOTS = 2**20
+
+# Bot players search QUNO_BOT_DEPTH turns ahead for at most QUNO_BOT_TIME seconds a move, in QUNO_BOT_WORKERS processes (0 plans in the server).
+bots = BotEngine(depth= int(os.environ.get("QUNO_BOT_DEPTH", 2)),
+                 time_budget= float(os.environ.get("QUNO_BOT_TIME", 0.25)),
+                 workers= int(os.environ.get("QUNO_BOT_WORKERS", 0)))
+
+# Games are capped at QUNO_MAX_QUBITS qubits only when it is set, otherwise their byte budgets bound them.
+budget = ResourceBudget(max_qubits= int(os.environ["QUNO_MAX_QUBITS"]) if os.environ.get("QUNO_MAX_QUBITS") else None,
+                        max_game_bytes= int(float(os.environ.get("QUNO_MAX_GAME_MB", 64))*2**20),
+                        max_total_bytes= int(float(os.environ.get("QUNO_MAX_TOTAL_MB", 1024))*2**20),
+                        bytes_per_amplitude= Game.precision.bytes_per_amplitude if Game.precision is not None else None)
+budget.scratch = Game.scratch
+# Seconds a new game waits for memory to be freed before it is rejected.
+ADMISSION_TIMEOUT = float(os.environ.get("QUNO_ADMISSION_TIMEOUT", 5))
+for game in Game.get_all_games():
+    if len(game.get_players()) != 0:
+        budget.update(game)
+Game.budget = budget
+
+# Gates and fidelities of states of at most QUNO_TRANSITION_QUBITS qubits are memoized across games when it is set.
+if os.environ.get("QUNO_TRANSITION_QUBITS"):
+    Game.transitions = TransitionCache(max_qubits= int(os.environ["QUNO_TRANSITION_QUBITS"]),
+                                       max_entries= int(os.environ.get("QUNO_TRANSITION_ENTRIES", 2**16)))
+
+# Gates, measurements and fidelities of states with at least QUNO_PARALLEL_QUBITS qubits run on a thread pool.
+Operations.parallel = ParallelKernels(workers= int(os.environ["QUNO_PARALLEL_WORKERS"]) if os.environ.get("QUNO_PARALLEL_WORKERS") else None,
+                                      min_qubits= int(os.environ.get("QUNO_PARALLEL_QUBITS", 14)))
+
+snapshots = RoomSnapshots(max_rooms= int(os.environ.get("QUNO_SNAPSHOT_ROOMS", 4096)))
+
+renders = RenderCache(max_images= int(os.environ.get("QUNO_RENDER_CACHE_SIZE", 1024)))
+
+# Target state sets are generated ahead of time while the server is idle.
+if int(os.environ.get("QUNO_TARGET_POOL_SIZE", 8)) > 0:
+    target_pool = TargetStatePool(pool_size= int(os.environ.get("QUNO_TARGET_POOL_SIZE", 8)))
+    target_pool.start()
+    Game.target_pool = target_pool
+
+    @app.middleware("http")
+    async def track_activity(request: Request, call_next):
+        target_pool.request_started()
+        try:
+            return await call_next(request)
+        finally:
+            target_pool.request_finished()
+
+# Requests are profiled on demand (X-Profile: 1 header or sampling) only when a profile directory is configured.
+profiler = None
+if os.environ.get("QUNO_PROFILE_DIR"):
+    profiler = RequestProfiler(directory= os.environ["QUNO_PROFILE_DIR"],
+                               max_profiles= int(os.environ.get("QUNO_PROFILE_KEEP", 64)),
+                               sample_rate= float(os.environ.get("QUNO_PROFILE_SAMPLE_RATE", 0)))
+    profiler.instrument(Game, ["drop_card", "set_target_states"])
+    profiler.instrument(Operations, ["save_circuit_image", "circuit_svg", "save_bloch_sphere", "save_q_sphere"])
+
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        session = profiler.start(request.method, request.url.path, request.headers)
+        if session is None:
+            return await call_next(request)
+        token = RequestProfiler.current.set(session)
+        try:
+            response = await call_next(request)
+        finally:
+            RequestProfiler.current.reset(token)
+            profile = profiler.finish(session)
+        if profile is not None:
+            response.headers["X-Profile-Id"] = profile
+        return response
+
+# Expensive requests (large states, renders, new games) run a few at a time, cheapest first, and are rejected once too many wait.
+admission = AdmissionController(max_running= int(os.environ.get("QUNO_ADMISSION_RUNNING", os.cpu_count() or 1)),
+                                max_queued= int(os.environ.get("QUNO_ADMISSION_QUEUE", 64)),
+                                cheap_cost= int(os.environ.get("QUNO_ADMISSION_CHEAP_COST", 2**10)))
+
+@app.middleware("http")
+async def admit_request(request: Request, call_next):
+    cost = 0
+    if request.method == "POST":
+        cost = admission.estimate(request.url.path, await request.body(), Game.get_all_games())
+    response = await admission.run(cost, lambda: call_next(request))
+    if response is None:
+        return JSONResponse(status_code= 429, content= {"detail": "Server is busy, try again later"},
+                            headers= {"Retry-After": str(admission.retry_after())})
+    return response
+
+# Request traces are recorded for replay.py into QUNO_RECORD_DIR when it is set.
+recorder = None
+if os.environ.get("QUNO_RECORD_DIR"):
+    recorder = TrafficRecorder(directory= os.environ["QUNO_RECORD_DIR"],
+                               max_bytes= int(float(os.environ.get("QUNO_RECORD_FILE_MB", 16))*2**20),
+                               max_files= int(os.environ.get("QUNO_RECORD_FILES", 8)))
+
+    @app.middleware("http")
+    async def record_request(request: Request, call_next):
+        entry = recorder.start(request.method, request.url.path, request.url.query, await request.body())
+        token = TrafficRecorder.current.set(entry)
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            TrafficRecorder.current.reset(token)
+        recorder.finish(entry, response.status_code, time.perf_counter()-start)
+        return response
+
 class ComplexNumber(BaseModel):
     real: float
     imag: float
@@ -39,7 +198,16 @@ async def create_game(_json:dict[str, str|list[str|int]|int])-> dict[str, int|di
     else:
         initial_state = [1,0,0,0]
 
-    game = Game(initial_state= initial_state, decks= decks)
+    # queue the game until enough memory is free, reject it if that takes too long
+    waited = 0
+    while not budget.can_admit(initial_state= initial_state, num_players= len(players)):
+        if waited >= ADMISSION_TIMEOUT:
+            raise HTTPException(status_code= 503, detail= "Server is at its memory budget", headers= {"Retry-After": str(max(1, int(ADMISSION_TIMEOUT)))})
+        await asyncio.sleep(0.1)
+        waited = waited+0.1
+
+    # replays pass the seeds of the recorded game
+    game = Game(initial_state= initial_state, decks= decks, seed= _json.get("seed"))
     game_id = game.game_id
 
     # create players
@@ -54,7 +222,8 @@ async def create_game(_json:dict[str, str|list[str|int]|int])-> dict[str, int|di
     game.distribute_cards(players= [player.name for player in players], decks= game.num_decks)
 
     # set target states
-    game.set_target_states()
+    game.set_target_states(seed= _json.get("target_seed"))
+    TrafficRecorder.annotate(game_id= game.game_id, seed= game.seed, target_seed= game.target_seed)
 
     response['game_id']= game.game_id
     
@@ -65,17 +234,74 @@ async def create_game(_json:dict[str, str|list[str|int]|int])-> dict[str, int|di
         details[player.name.split("_")[0]]['cards'] = player.cards
         details[player.name.split("_")[0]]['target_state'] = [str(i) for i in player.target_state]
         details[player.name.split("_")[0]]['fidelities'] = game.fidelity(player.target_state, game.game_state).real
-        details[player.name.split("_")[0]]['bloch_sphere'] = send_bloch_sphere({"game_id": player.game_id,
-                                                       "statevector": player.target_state,
-                                                       "player": player.name.split("_")[0]})
-        details[player.name.split("_")[0]]['q_sphere'] = send_q_sphere({"game_id": player.game_id,
-                                                       "statevector": player.target_state,
-                                                       "player": player.name.split("_")[0]})
+        if _json.get("inline_images", False):
+            details[player.name.split("_")[0]]['bloch_sphere'] = send_bloch_sphere({"game_id": player.game_id,
+                                                           "statevector": player.target_state.copy(),
+                                                           "player": player.name.split("_")[0]})
+            details[player.name.split("_")[0]]['q_sphere'] = send_q_sphere({"game_id": player.game_id,
+                                                           "statevector": player.target_state.copy(),
+                                                           "player": player.name.split("_")[0]})
+        else:
+            # images are rendered in the background and fetched from /images/
+            for kind in RenderCache.KINDS:
+                image_id = renders.submit(kind= kind, statevector= player.target_state)
+                details[player.name.split("_")[0]][kind] = {"image_id": image_id, "url": "/images/"+image_id}
 
     response['data'] = details
     return response 
 
 
+@app.post("/create_rooms/", status_code= 201)
+def create_rooms(_json:dict)-> dict:
+    """ Creates many games at once, for tournaments and events.
+
+    Takes {"rooms": [{"players", "initial_state", "decks", "seed"?, "target_seed"?}, ...]} and
+    returns the ids, hands and targets of all the rooms. State images are not rendered until they
+    are first fetched from /images/. Creating hundreds of rooms takes a while, so like /bot_turn/
+    this runs in the thread pool rather than on the event loop.
+    """
+    rooms = _json.get("rooms")
+    if not isinstance(rooms, list) or len(rooms) == 0:
+        return {"error": "No rooms to create"}
+    for room in rooms:
+        if not isinstance(room, dict) or not room.get("players"):
+            return {"error": "Every room needs players"}
+        if room.get("initial_state") is not None:
+            room["initial_state"] = [complex(i["real"], i["imag"]) if isinstance(i, dict) else i for i in room["initial_state"]]
+        else:
+            room["initial_state"] = [1,0,0,0]
+
+    # rooms are created together or not at all
+    waited = 0
+    while not budget.can_admit_rooms(rooms= [(room["initial_state"], len(room["players"])) for room in rooms]):
+        if waited >= ADMISSION_TIMEOUT:
+            raise HTTPException(status_code= 503, detail= "Server is at its memory budget", headers= {"Retry-After": str(max(1, int(ADMISSION_TIMEOUT)))})
+        time.sleep(0.1)
+        waited = waited+0.1
+
+    try:
+        games = Game.create_rooms(rooms= rooms)
+    except Exception as e:
+        return {"error": str(e)}
+    TrafficRecorder.annotate(game_ids= [game.game_id for game in games], seeds= [game.seed for game in games], target_seeds= [game.target_seed for game in games])
+
+    response = []
+    for game in games:
+        details = {}
+        game_state = game.game_state
+        for player in game.players:
+            name = player.name.split("_")[0]
+            details[name] = {"game_id": player.game_id,
+                             "cards": player.cards,
+                             "target_state": [str(i) for i in player.target_state],
+                             "fidelities": game.fidelity(player.target_state, game_state).real}
+            for kind in RenderCache.KINDS:
+                image_id = renders.defer(kind= kind, statevector= player.target_state)
+                details[name][kind] = {"image_id": image_id, "url": "/images/"+image_id}
+        response.append({"game_id": game.game_id, "data": details})
+    return {"rooms": response}
+
+
 @app.post("/play_card/", status_code= 201)
 def play_card(_json:dict[str, None|int|float|str|list[str|int|None|float]])->dict[str, int|dict|str|float|list]:
     _response = {}
@@ -87,32 +313,68 @@ def play_card(_json:dict[str, None|int|float|str|list[str|int|None|float]])->dic
     card = _json['card']
     qubits = _json['qubits']
     angle = _json['angle']
+    # clients that do not look at the state after their turn skip its evaluation
+    evaluate = _json.get('evaluate', True)
 
     game = get_game(game_id= game_id)
     game_players = game.get_players()
     if player not in [i.name for i in game.winning_players] and player not in [i.name for i in game.ejected_players]:
         try:
-            measurement, game_state, new_card, _fidelities = game.drop_card(players= game_players, player= player, card= card, qubits= qubits, angle= angle)
+            measurement, game_state, new_card, _fidelities = game.drop_card(players= game_players, player= player, card= card, qubits= qubits, angle= angle, evaluate= evaluate)
         except Exception as e:
             return {"error":str(e)}
+        TrafficRecorder.annotate(measurement= measurement, new_card= new_card)
     else:
         return {"error": "Player not a part of the game"}
     
-    fidelities={}
-    for key in _fidelities.keys():
-        fidelities[key.split('_')[0]] = _fidelities[key]
-
     _response[player.split('_')[0]] = {
                                         "measurement": measurement,
-                                        "game_state": [str(i) for i in game_state],
                                         "new_card": new_card,
-                                        "remaining_cards": len(game.remaining_cards),
-                                        "fidelities" : fidelities}
+                                        "remaining_cards": len(game.remaining_cards)}
+    if evaluate:
+        fidelities={}
+        for key in _fidelities.keys():
+            fidelities[key.split('_')[0]] = _fidelities[key]
+        _response[player.split('_')[0]]["game_state"] = [str(i) for i in game_state]
+        _response[player.split('_')[0]]["fidelities"] = fidelities
 
     # print(game.gate_sequence)
     # print(len(game.gate_sequence))
     return _response
 
+@app.post("/bot_turn/", status_code= 201)
+def bot_turn(_json:dict[str, int|str])-> dict:
+    """ Plays the turn of a player with a bot: the card it plays and the response of /play_card/, or the response of /show/.
+
+    The search runs in the worker pool of the bots, or on the thread serving the request without
+    one, never on the event loop.
+    """
+    game_id = _json['game_id']
+    game = get_game(game_id)
+    player = game.player_ids_to_object(players= _json['player']+'_'+str(game_id))
+    if player is None or player.game_id != game.game_id or player.target_state is None:
+        return {"error": "Player not a part of the game"}
+    card, qubits = bots.submit(game, player).result()
+    if card == "show":
+        return {"move": "show", **show({"game_id": game_id, "player": _json['player']})}
+    return {"move": card, "qubits": qubits, **play_card({"game_id": game_id, "player": _json['player'], "card": card, "qubits": qubits, "angle": None})}
+
+@app.get("/recorder/")
+def get_recorder()-> dict:
+    if recorder is None:
+        raise HTTPException(status_code= 404, detail= "Traffic recording is off, set QUNO_RECORD_DIR")
+    return recorder.stats()
+
+@app.get("/transitions/")
+def get_transitions()-> dict:
+    if Game.transitions is None:
+        raise HTTPException(status_code= 404, detail= "Transition cache is off, set QUNO_TRANSITION_QUBITS")
+    return Game.transitions.stats()
+
+@app.get("/bots/")
+def get_bots()-> dict[str, int|float]:
+    return bots.stats()
+
 @app.post("/show/", status_code= 201)
 def show(_json:dict[str, int|str])-> dict[str, str]:
     
@@ -166,6 +428,11 @@ def send_game_circuit(_json:dict[str, int|str|float|dict[str, list[str|list[int]
             pass
 
     game = get_game(game_id)
+    if _json.get('format', 'png') == 'svg':
+        # native renderer, no qiskit or matplotlib involved
+        svg = game.circuit_svg(gates=gates, qubits=qubits, angles=angles)
+        image_id = renders.put(content= svg.encode("utf-8"), media_type= "image/svg+xml")
+        return {"circuit": svg, "format": "svg", "image_id": image_id, "url": "/images/"+image_id}
     path = "circuit_"+str(game_id)+".png"
     game.save_circuit_image(gates=gates, qubits=qubits, angles=angles, path= path)
     
@@ -210,6 +477,159 @@ def send_q_sphere(_json:dict[str, int|str])-> dict[str, str]:
     os.remove(path= path)
     return _response
 
+@app.get("/images/{image_id}")
+async def get_image(image_id:str, request:Request)-> Response:
+    image = renders.get(image_id)
+    if image is None:
+        raise HTTPException(status_code= 404, detail= "Image not found")
+    if not isinstance(image, tuple):
+        image = await asyncio.wrap_future(image)
+    content, etag, media_type = image
+    # image ids are derived from the rendered state, so an image never changes
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code= 304, headers= headers)
+    return Response(content= content, media_type= media_type, headers= headers)
+
+@app.get("/rooms/{game_id}")
+def get_room(game_id:int, request:Request)-> Response:
+    """ Public state of a room, for polling players and spectators. Unchanged rooms answer 304 to If-None-Match.
+    """
+    game = get_game(game_id)
+    if request.headers.get("if-none-match") == snapshots.etag(game):
+        return Response(status_code= 304, headers= {"ETag": snapshots.etag(game), "Cache-Control": "no-cache"})
+    etag, content = snapshots.get(game)
+    return Response(content= content, media_type= "application/json", headers= {"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.get("/state_summary/{game_id}")
+def send_state_summary(game_id:int, player:str|None = None, top_k:int = 8)-> dict:
+    """ Bloch vectors, qubit marginals and the most probable basis states of the game state, or of a player's target state.
+    """
+    game = get_game(game_id)
+    statevector = game.game_state
+    if player is not None:
+        _player = game.player_ids_to_object(players= player+'_'+str(game_id))
+        if _player is None or _player.target_state is None:
+            raise HTTPException(status_code= 404, detail= "Player not a part of the game")
+        statevector = _player.target_state
+    return game.state_summary(statevector= statevector, top_k= top_k)
+
+@app.get("/samples/{game_id}")
+def send_samples(game_id:int, shots:int = 1024, seed:int|None = None)-> dict:
+    """ Counts of the basis states measured in `shots` measurements of all the qubits of the game state.
+    """
+    if shots < 1 or shots > MAX_SHOTS:
+        raise HTTPException(status_code= 422, detail= f"shots must be between 1 and {MAX_SHOTS}")
+    game = get_game(game_id)
+    return {"shots": shots, "counts": sampler.sample(game, shots= shots, seed= seed)}
+
+@app.get("/sampler/")
+def get_sampler()-> dict[str, int]:
+    return sampler.stats()
+
+@app.get("/limits/")
+def get_limits()-> dict[str, int|float|None]:
+    return budget.limits()
+
+@app.post("/limits/", status_code= 201)
+def set_limits(_json:dict[str, int|float])-> dict[str, int|float|None]:
+    budget.set_limits(max_qubits= _json.get('max_qubits'),
+                      max_game_bytes= _json.get('max_game_bytes'),
+                      max_total_bytes= _json.get('max_total_bytes'),
+                      admission_ratio= _json.get('admission_ratio'))
+    return budget.limits()
+
+def get_profiler()-> RequestProfiler:
+    if profiler is None:
+        raise HTTPException(status_code= 404, detail= "Profiling is not configured")
+    return profiler
+
+@app.get("/profiler/")
+def get_profiler_settings()-> dict:
+    return get_profiler().settings()
+
+@app.post("/profiler/", status_code= 201)
+def set_profiler_settings(_json:dict[str, bool|int|float])-> dict:
+    get_profiler().set_settings(enabled= _json.get('enabled'),
+                                sample_rate= _json.get('sample_rate'),
+                                max_profiles= _json.get('max_profiles'))
+    return get_profiler().settings()
+
+@app.get("/profiler/profiles/")
+def list_profiles()-> list:
+    return get_profiler().list_profiles()
+
+@app.get("/profiler/profiles/{name}")
+def get_profile(name:str)-> FileResponse:
+    path = get_profiler().profile_path(name)
+    if path is None:
+        raise HTTPException(status_code= 404, detail= "Profile not found")
+    return FileResponse(path, media_type= "application/octet-stream", filename= name+".prof")
+
+@app.get("/admission/")
+def get_admission()-> dict[str, int|float]:
+    return admission.stats()
+
+@app.get("/leaderboard/")
+def get_leaderboard(ranking:str = "wins", k:int = 10)-> list:
+    """ Top k players by wins, win_rate, fidelity (average final fidelity) or fastest_win (fewest moves to a win).
+    """
+    if ranking not in Leaderboard.RANKINGS:
+        raise HTTPException(status_code= 404, detail= "Unknown ranking, use one of "+", ".join(Leaderboard.RANKINGS))
+    return leaderboard.top(ranking= ranking, k= min(max(k, 0), 1000))
+
+@app.get("/leaderboard/players/{player}")
+def get_player_statistics(player:str)-> dict:
+    stats = leaderboard.player_stats(player)
+    if stats is None:
+        raise HTTPException(status_code= 404, detail= "Player has no results")
+    return stats
+
+def get_fork(fork_id:str)-> GameFork:
+    fork = GameFork.get_fork(fork_id)
+    if fork is None:
+        raise HTTPException(status_code= 404, detail= "Fork not found")
+    return fork
+
+@app.post("/forks/", status_code= 201)
+def create_fork(_json:dict[str, int|str])-> dict[str, str|int]:
+    """ Forks a game (game_id) or another fork (fork_id) to try moves without changing it.
+    """
+    if _json.get('fork_id') is not None:
+        fork = get_fork(_json['fork_id']).fork()
+    else:
+        fork = get_game(game_id= _json['game_id']).fork()
+    return {"fork_id": fork.game_id, "game_id": fork.parent_id}
+
+@app.post("/forks/{fork_id}/play", status_code= 201)
+def play_fork_card(fork_id:str, _json:dict[str, None|int|float|str|list[str|int|None|float]])-> dict:
+    fork = get_fork(fork_id)
+    player = _json['player']+'_'+str(fork.parent_id)
+    evaluate = _json.get('evaluate', True)
+    try:
+        measurement, game_state, new_card, _fidelities = fork.drop_card(player= player, card= _json['card'], qubits= _json.get('qubits') or [], angle= _json.get('angle'), evaluate= evaluate)
+    except Exception as e:
+        return {"error":str(e)}
+    _response = {"measurement": measurement, "new_card": new_card, "remaining_cards": len(fork.remaining_cards)}
+    if evaluate:
+        _response["game_state"] = [str(i) for i in game_state]
+        _response["fidelities"] = {key.split('_')[0]: value for key, value in _fidelities.items()}
+    return _response
+
+@app.get("/forks/{fork_id}")
+def get_fork_state(fork_id:str)-> dict:
+    fork = get_fork(fork_id)
+    return {"fork_id": fork.game_id,
+            "game_id": fork.parent_id,
+            "game_state": [str(i) for i in fork.game_state],
+            "cards": {name.split('_')[0]: fork.player_cards(name) for name in fork.hands},
+            "fidelities": {name.split('_')[0]: value for name, value in fork.fidelities().items()}}
+
+@app.delete("/forks/{fork_id}")
+def delete_fork(fork_id:str)-> dict[str, str]:
+    get_fork(fork_id).release()
+    return {"fork_id": fork_id}
+
 @app.post("/add_deck/", status_code= 201)
 def add_deck(_json:dict[str, int|str])-> dict[str, str|int]:
 
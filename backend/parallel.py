@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import itertools
+import os
+
+import numpy as np
+
+class ParallelKernels():
+    """ Gate application, measurement and fidelity for large statevectors, split over a thread pool.
+
+    A statevector of n qubits is viewed as an n dimensional array of shape (2, ..., 2), axis 0
+    being qubit 0 (the most significant bit of an index). A gate only mixes amplitudes along its
+    target axes, so fixing the leading non-target qubits splits the state into independent
+    blocks. Every block is processed on a worker with numpy elementwise operations, which release
+    the GIL, so the blocks run in parallel on separate cores.
+
+    Statevectors with fewer than `min_qubits` qubits are left to the single threaded code.
+    """
+    def __init__(self, workers:int|None = None, min_qubits:int = 14) -> None:
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.min_qubits = min_qubits
+        self.executor = ThreadPoolExecutor(max_workers= self.workers, thread_name_prefix= "kernel")
+
+    def accepts(self, statevector)-> bool:
+        return len(statevector) >= 2**self.min_qubits
+
+    def close(self):
+        self.executor.shutdown(wait= True)
+
+    def blocks(self, num_qubits:int, fixed_qubits:tuple = ())-> list:
+        """ Index tuples of the independent blocks of a state, one per value of the leading qubits not in `fixed_qubits`.
+        """
+        free_qubits = [qubit for qubit in range(num_qubits) if qubit not in fixed_qubits]
+        # a few blocks per worker keeps the workers busy when blocks take uneven time
+        num_split = min(len(free_qubits), max(self.workers*4-1, 0).bit_length()) if self.workers > 1 else 0
+        split_qubits = free_qubits[:num_split]
+        blocks = []
+        for bits in itertools.product((0, 1), repeat= num_split):
+            index = [slice(None)]*num_qubits
+            for qubit, bit in zip(split_qubits, bits):
+                index[qubit] = bit
+            # the trailing Ellipsis keeps a fully indexed block a (0 dimensional) view instead of a scalar
+            blocks.append(tuple(index)+(Ellipsis,))
+        return blocks
+
+    def run(self, function, blocks:list)-> list:
+        if len(blocks) == 1:
+            return [function(blocks[0])]
+        return list(self.executor.map(function, blocks))
+
+    @staticmethod
+    def block_axes(index:tuple, qubits:tuple)-> list:
+        """ Axes of the given qubits in a block, after the integer indexed axes of the block are dropped.
+        """
+        return [qubit-sum(1 for i in index[:qubit] if not isinstance(i, slice)) for qubit in qubits]
+
+    @staticmethod
+    def apply_to_block(block:np.ndarray, new_block:np.ndarray, unitary:list, axes:list):
+        """ Writes a gate acting on the given axes of a block into `new_block`.
+        """
+        parts = []
+        for local in range(len(unitary)):
+            # the first axis of the gate is the most significant bit of its basis states
+            part = [slice(None)]*block.ndim
+            for b, axis in enumerate(axes):
+                part[axis] = (local >> (len(axes)-1-b)) & 1
+            parts.append(tuple(part)+(Ellipsis,))
+        product = None
+        for row, out_part in zip(unitary, parts):
+            out = new_block[out_part]
+            terms = [(value, part) for value, part in zip(row, parts) if value != 0]
+            if len(terms) == 0:
+                out[...] = 0
+                continue
+            np.multiply(block[terms[0][1]], terms[0][0], out= out)
+            for value, part in terms[1:]:
+                if product is None:
+                    product = np.empty_like(out)
+                np.multiply(block[part], value, out= product)
+                np.add(out, product, out= out)
+
+    def apply_gate(self, statevector:np.ndarray, unitary, qubits:list)-> np.ndarray:
+        """ Applies a gate on the given qubits of a statevector.
+
+        Args:
+            statevector (np.ndarray): amplitudes of the state
+            unitary (list): single qubit or double qubit gate
+            qubits (list): the qubits the gate is applied on, the first one is the most significant bit of the gate
+
+        Returns:
+            np.ndarray: new statevector
+        """
+        num_qubits = len(statevector).bit_length()-1
+        state = np.asarray(statevector, dtype= complex).reshape((2,)*num_qubits)
+        new_state = np.empty_like(state)
+        unitary = [[complex(value) for value in row] for row in unitary]
+        qubits = tuple(qubits)
+
+        def apply_block(index:tuple):
+            ParallelKernels.apply_to_block(state[index], new_state[index], unitary, ParallelKernels.block_axes(index, qubits))
+
+        self.run(apply_block, self.blocks(num_qubits, qubits))
+        return new_state.reshape(-1)
+
+    def probabilities(self, statevector:np.ndarray, qubit:int)-> (float, float):
+        """ Probabilities of measuring 0 and 1 on a qubit.
+        """
+        num_qubits = len(statevector).bit_length()-1
+        state = np.asarray(statevector, dtype= complex).reshape((2,)*num_qubits)
+
+        def block_probabilities(index:tuple)-> (float, float):
+            block = state[index]
+            axis = ParallelKernels.block_axes(index, (qubit,))[0]
+            results = []
+            for bit in (0, 1):
+                part = np.take(block, bit, axis= axis)
+                results.append(float(np.sum(part.real*part.real+part.imag*part.imag)))
+            return results
+
+        results = self.run(block_probabilities, self.blocks(num_qubits, (qubit,)))
+        return sum(i[0] for i in results), sum(i[1] for i in results)
+
+    def measure_and_remove_qubit(self, qubit:int, statevector:np.ndarray, rng)-> (int, np.ndarray):
+        """ Measures a qubit and returns the normalized state of the remaining qubits.
+        """
+        probabilities = self.probabilities(statevector, qubit)
+        measurement = rng.choices([0, 1], probabilities)[0]
+        num_qubits = len(statevector).bit_length()-1
+        state = np.asarray(statevector, dtype= complex).reshape((2,)*num_qubits)
+        reduced = np.take(state, measurement, axis= qubit)
+        new_state = np.empty(reduced.shape, dtype= complex)
+        scale = 1/np.sqrt(probabilities[measurement])
+
+        def normalize_block(index:tuple):
+            np.multiply(reduced[index], scale, out= new_state[index])
+
+        self.run(normalize_block, self.blocks(num_qubits-1))
+        return measurement, new_state.reshape(-1)
+
+    def fidelity(self, state1:np.ndarray, state2:np.ndarray)-> float:
+        """ |<state1|state2>| over the norms of both states.
+
+        States of different sizes are compared on their common leading amplitudes, like Operations.fidelity.
+        Memory-mapped states are read block by block without being copied.
+        """
+        state1 = state1 if isinstance(state1, np.ndarray) else np.asarray(state1, dtype= complex)
+        state2 = state2 if isinstance(state2, np.ndarray) else np.asarray(state2, dtype= complex)
+        length = max(len(state1), len(state2))
+        size = max(length//max(self.workers*4, 1), 1)
+        blocks = [slice(start, start+size) for start in range(0, length, size)]
+
+        def block_products(index:slice)-> (complex, float, float):
+            a = state1[index]
+            b = state2[index]
+            common = min(len(a), len(b))
+            return np.vdot(b[:common], a[:common]), np.vdot(a, a).real, np.vdot(b, b).real
+
+        results = self.run(block_products, blocks)
+        inner_product = sum(i[0] for i in results)
+        norm1 = sum(i[1] for i in results)
+        norm2 = sum(i[2] for i in results)
+        return abs(inner_product)/np.sqrt(norm1*norm2)
@@ -1,12 +1,16 @@
 
+from gates import CARDS, CARD_CODES
+
 class Player:
+    # slots and a bytearray of card codes keep idle players small
+    __slots__ = ("__name", "__target_state", "__cards", "__game_id")
     all_players = []
 
     def __init__(self, name, target_state = None, game_id = None):
         if name not in [i.name for i in Player.all_players]:
             self.__name = name
             self.__target_state = target_state
-            self.__cards = []
+            self.__cards = bytearray()
             self.__game_id = game_id
             Player.all_players.append(self)
         else:
@@ -15,6 +19,24 @@ class Player:
     def __str__(self):
         return f"{self.__name} (Target state: {self.__target_state}, Game id: {self.__game_id})"
 
+    @classmethod
+    def create_players(cls, names:list, game_id = None)-> list:
+        """ Creates many players at once, checking their names against the taken ones in one pass.
+        """
+        taken = {player.name for player in cls.all_players}
+        if len(set(names)) != len(names) or any(name in taken for name in names):
+            raise Exception("Player id already taken. Choose another")
+        players = []
+        for name in names:
+            player = cls.__new__(cls)
+            player.__name = name
+            player.__target_state = None
+            player.__cards = bytearray()
+            player.__game_id = game_id
+            players.append(player)
+        cls.all_players.extend(players)
+        return players
+
     @classmethod
     def get_players_count(cls):
         return len(cls.all_players)
@@ -23,6 +45,13 @@ class Player:
     def get_all_players(cls):
         return cls.all_players
 
+    @classmethod
+    def get_player(cls, name:str):
+        for player in cls.all_players:
+            if player.name == name:
+                return player
+        return None
+
     @property
     def name(self):
         return self.__name
@@ -56,13 +85,29 @@ class Player:
 
     @property
     def cards(self):
-        if self.__cards == []:
+        if len(self.__cards) == 0:
             return None
         else:
-            return self.__cards
+            return [CARDS[i] for i in self.__cards]
     
+    @property
+    def card_codes(self)-> bytes:
+        """ Snapshot of the hand as card codes.
+        """
+        return bytes(self.__cards)
+
     def add_card(self, card:str):
-        self.__cards.append(card)
+        if card not in CARD_CODES:
+            raise Exception(str(card)+" is not a card")
+        self.__cards.append(CARD_CODES[card])
+
+    def remove_card(self, card:str):
+        if card not in CARD_CODES or CARD_CODES[card] not in self.__cards:
+            raise ValueError("Card not in Player's cards")
+        self.__cards.remove(CARD_CODES[card])
+
+    def has_card(self, card:str)-> bool:
+        return card in CARD_CODES and CARD_CODES[card] in self.__cards
 
     def empty_cards(self):
-        self.__cards = []
\ No newline at end of file
+        self.__cards = bytearray()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import numpy as np
+
+class StatePrecision():
+    """ Storage precision of game states and target states.
+
+    States are kept as numpy arrays of `dtype` instead of lists of Python complex numbers;
+    complex64 takes 8 bytes per amplitude, a quarter of a list of complex objects and half of
+    complex128. Rounding errors of single precision make the norm of a game state drift away
+    from 1 over many gates, so a game state is renormalized every `renormalize_every` moves.
+    """
+    DTYPES = {"complex64": np.complex64, "complex128": np.complex128}
+    BLOCK_SIZE = 2**16
+
+    def __init__(self, dtype:str = "complex64", renormalize_every:int = 8) -> None:
+        if dtype not in StatePrecision.DTYPES:
+            raise ValueError(f"Unsupported precision: {dtype}")
+        self.dtype = StatePrecision.DTYPES[dtype]
+        self.renormalize_every = renormalize_every
+        self.moves = {}
+
+    @property
+    def bytes_per_amplitude(self)-> int:
+        return np.dtype(self.dtype).itemsize
+
+    def store(self, statevector)-> np.ndarray:
+        """ Returns the statevector as an array of the storage precision, without copying it if it already is one.
+        """
+        if isinstance(statevector, np.ndarray) and statevector.dtype == self.dtype:
+            # memory-mapped states stay mapped
+            return statevector
+        return np.asarray(statevector, dtype= self.dtype)
+
+    def to_list(self, statevector:np.ndarray)-> list:
+        """ Statevector as a list of double precision complex numbers renormalized to norm 1, for the list based code (measurements).
+        """
+        statevector = np.asarray(statevector, dtype= np.complex128)
+        return (statevector/np.linalg.norm(statevector)).tolist()
+
+    def renormalize(self, statevector:np.ndarray)-> np.ndarray:
+        """ Rescales a stored statevector in place to norm 1, the norm is summed in double precision.
+
+        The state is processed in blocks of `BLOCK_SIZE` amplitudes, so large (memory-mapped) states are never copied whole.
+        """
+        norm = 0.0
+        for start in range(0, len(statevector), StatePrecision.BLOCK_SIZE):
+            block = statevector[start:start+StatePrecision.BLOCK_SIZE].astype(np.complex128)
+            norm = norm+np.vdot(block, block).real
+        if norm != 0:
+            scale = self.dtype(1/np.sqrt(norm))
+            for start in range(0, len(statevector), StatePrecision.BLOCK_SIZE):
+                statevector[start:start+StatePrecision.BLOCK_SIZE] *= scale
+        return statevector
+
+    def after_move(self, game):
+        """ Counts a move of a game and renormalizes its game state when it is due.
+        """
+        moves = self.moves.get(game.game_id, 0)+1
+        if moves >= self.renormalize_every:
+            self.renormalize(game.game_state)
+            moves = 0
+        self.moves[game.game_id] = moves
+
+    def release(self, game):
+        self.moves.pop(game.game_id, None)
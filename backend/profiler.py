@@ -0,0 +1,129 @@
+import contextvars
+import cProfile
+import functools
+import os
+import random
+import re
+import threading
+import time
+
+class ProfileSession():
+    """ Profile of one request, collected over the instrumented functions the request calls.
+    """
+    __slots__ = ("name", "profile", "active", "calls", "started")
+
+    def __init__(self, name:str) -> None:
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.active = False
+        self.calls = 0
+        self.started = time.perf_counter()
+
+class RequestProfiler():
+    """ Captures cProfile profiles of sampled requests into a bounded directory of .prof files.
+
+    A request is profiled when it carries the `X-Profile: 1` header or is picked at random with
+    probability `sample_rate`. Only the functions passed to `instrument` are profiled, and only
+    while they run on behalf of a profiled request; for every other call the instrumented
+    function costs one context variable lookup. One request is profiled at a time, a request
+    sampled while another one is being profiled runs unprofiled.
+
+    Profiles are written with `pstats` dump format (readable by `python -m pstats`, snakeviz or
+    flameprof) and only the latest `max_profiles` files are kept.
+    """
+    HEADER = "x-profile"
+    current = contextvars.ContextVar("profile_session", default= None)
+
+    def __init__(self, directory:str, max_profiles:int = 64, sample_rate:float = 0.0) -> None:
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.sample_rate = sample_rate
+        self.enabled = True
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok= True)
+        profiles = self.list_profiles()
+        self.sequence = int(profiles[-1]["name"].split("_")[0])+1 if len(profiles) != 0 else 0
+
+    def instrument(self, cls, names:list):
+        """ Replaces the given methods of a class by wrappers that run them under the profile of the current request.
+        """
+        for name in names:
+            setattr(cls, name, RequestProfiler.profiled(getattr(cls, name)))
+
+    @staticmethod
+    def profiled(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            session = RequestProfiler.current.get()
+            if session is None or session.active:
+                return function(*args, **kwargs)
+            session.active = True
+            session.calls = session.calls+1
+            try:
+                return session.profile.runcall(function, *args, **kwargs)
+            finally:
+                session.active = False
+        return wrapper
+
+    def should_profile(self, headers)-> bool:
+        if not self.enabled:
+            return False
+        if headers.get(RequestProfiler.HEADER) == "1":
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, method:str, path:str, headers)-> ProfileSession|None:
+        """ Starts the profile of a request if it is sampled and no other request is being profiled.
+        """
+        if not self.should_profile(headers):
+            return None
+        if not self.lock.acquire(blocking= False):
+            return None
+        label = re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-") or "root"
+        session = ProfileSession(f"{self.sequence:08d}_{method.lower()}_{label}")
+        self.sequence = self.sequence+1
+        return session
+
+    def finish(self, session:ProfileSession)-> str|None:
+        """ Writes the profile of a request and drops the oldest profiles past `max_profiles`.
+
+        Returns:
+            str|None: name of the profile, None if the request did not reach an instrumented function
+        """
+        try:
+            if session.calls == 0:
+                return None
+            path = os.path.join(self.directory, session.name+".prof")
+            session.profile.dump_stats(path+".tmp")
+            os.replace(path+".tmp", path)
+            for profile in self.list_profiles()[:-self.max_profiles]:
+                os.remove(os.path.join(self.directory, profile["name"]+".prof"))
+            return session.name
+        finally:
+            self.lock.release()
+
+    def list_profiles(self)-> list:
+        profiles = []
+        for file_name in sorted(os.listdir(self.directory)):
+            if file_name.endswith(".prof") and file_name.split("_")[0].isdigit():
+                profiles.append({"name": file_name[:-len(".prof")],
+                                 "bytes": os.path.getsize(os.path.join(self.directory, file_name))})
+        return profiles
+
+    def profile_path(self, name:str)-> str|None:
+        path = os.path.join(self.directory, os.path.basename(name)+".prof")
+        return path if os.path.isfile(path) else None
+
+    def settings(self)-> dict:
+        return {"enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "max_profiles": self.max_profiles,
+                "profiles": len(self.list_profiles())}
+
+    def set_settings(self, enabled:bool|None = None, sample_rate:float|None = None, max_profiles:int|None = None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if max_profiles is not None:
+            self.max_profiles = max(int(max_profiles), 1)
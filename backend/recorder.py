@@ -0,0 +1,118 @@
+import contextvars
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+class TrafficRecorder():
+    """ Records anonymized request traces into rotating JSON lines files, to be replayed by replay.py.
+
+    Every request is one line: its offset in seconds from the start of the recording ("t"),
+    method ("m"), path ("p"), query string ("q"), JSON body ("b"), status ("s") and latency in
+    milliseconds ("e"). Player names, in the body, the path or the query string, are replaced by
+    salted hashes, consistently within a recording. Endpoints add what a replay needs to reproduce their outcomes with `annotate`:
+    /create_game/ adds the id of the game and the seeds of its random generator and of its target
+    states, from which the deck, the hands, the targets, the cards drawn and the measurements of
+    the game all follow, and /create_rooms/ the same for every room it creates; /play_card/ adds
+    the measurement and the card drawn, so a replay can check it stayed in step.
+
+    A file is closed once it reaches `max_bytes` and only the latest `max_files` files are kept.
+    """
+    current = contextvars.ContextVar("traffic_entry", default= None)
+    # fields and query parameters holding player names
+    NAME_FIELDS = ["player", "players"]
+
+    def __init__(self, directory:str, max_bytes:int = 16*2**20, max_files:int = 8) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.salt = os.urandom(16)
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.file = None
+        self.sequence = 0
+        self.recorded = 0
+        os.makedirs(directory, exist_ok= True)
+        self.prefix = "trace_"+time.strftime("%Y%m%d%H%M%S")
+
+    def anonymize_name(self, name:str)-> str:
+        return "p"+hashlib.blake2b(name.encode(), key= self.salt, digest_size= 5).hexdigest()
+
+    def anonymize(self, body):
+        if not isinstance(body, dict):
+            return body
+        body = dict(body)
+        for field in TrafficRecorder.NAME_FIELDS:
+            if isinstance(body.get(field), str):
+                body[field] = self.anonymize_name(body[field])
+            elif isinstance(body.get(field), list):
+                body[field] = [self.anonymize_name(name) if isinstance(name, str) else name for name in body[field]]
+        if isinstance(body.get("rooms"), list):
+            body["rooms"] = [self.anonymize(room) for room in body["rooms"]]
+        return body
+
+    def anonymize_path(self, path:str)-> str:
+        if path.startswith("/leaderboard/players/"):
+            return "/leaderboard/players/"+self.anonymize_name(path[len("/leaderboard/players/"):])
+        return path
+
+    def anonymize_query(self, query:str)-> str:
+        if not query:
+            return query
+        params = urllib.parse.parse_qsl(query, keep_blank_values= True)
+        return urllib.parse.urlencode([(key, self.anonymize_name(value) if key in TrafficRecorder.NAME_FIELDS else value) for key, value in params])
+
+    def start(self, method:str, path:str, query:str, body:bytes)-> dict:
+        """ Starts the trace entry of a request, endpoints annotate it while it runs.
+        """
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        return {"t": round(time.monotonic()-self.started, 4), "m": method, "p": self.anonymize_path(path), "q": self.anonymize_query(query), "b": self.anonymize(data)}
+
+    @staticmethod
+    def annotate(**data):
+        """ Adds details to the trace entry of the current request, if it is recorded.
+        """
+        entry = TrafficRecorder.current.get()
+        if entry is not None:
+            entry.update(data)
+
+    def finish(self, entry:dict, status:int, elapsed:float):
+        entry["s"] = status
+        entry["e"] = round(elapsed*1000, 3)
+        line = json.dumps(entry, separators= (",", ":"), default= str)+"\n"
+        with self.lock:
+            if self.file is None or self.file.tell()+len(line) > self.max_bytes:
+                self.rotate()
+            self.file.write(line)
+            self.file.flush()
+            self.recorded = self.recorded+1
+
+    def rotate(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = open(os.path.join(self.directory, f"{self.prefix}_{self.sequence:04d}.jsonl"), "w")
+        self.sequence = self.sequence+1
+        files = TrafficRecorder.trace_files(self.directory)
+        for path in files[:max(len(files)-self.max_files, 0)]:
+            os.remove(path)
+
+    @staticmethod
+    def trace_files(directory:str)-> list:
+        """ Trace files of a directory, oldest first.
+        """
+        return sorted(glob.glob(os.path.join(directory, "trace_*.jsonl")))
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def stats(self)-> dict:
+        return {"directory": self.directory, "files": len(TrafficRecorder.trace_files(self.directory)), "recorded": self.recorded}
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import hashlib
+import io
+import threading
+
+from utils import Operations
+
+class RenderCache():
+    """ Renders state images in the background and keeps the latest ones in memory.
+
+    An image is identified by a hash of its kind and its (rounded) statevector, so the same state
+    always maps to the same image id and is rendered only once, whichever game it comes from.
+    Renders run on a single worker thread, since pyplot is not thread safe.
+
+    The state of an evicted image is kept with the deferred ones, so its id is rendered again
+    when it is fetched; only ids of images neither fetched nor kept for the last
+    16*`max_images` deferred states (and of images cached with `put`) expire.
+    """
+    KINDS = ["bloch_sphere", "q_sphere"]
+
+    def __init__(self, max_images:int = 1024, decimals:int = 10) -> None:
+        self.max_images = max_images
+        self.decimals = decimals
+        self.images = OrderedDict()
+        self.pending = {}
+        # image id -> (kind, statevector) of images rendered only once they are first fetched
+        self.deferred = OrderedDict()
+        # image id -> (kind, statevector) of the rendered images
+        self.sources = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers= 1, thread_name_prefix= "render")
+        self.operations = Operations()
+
+    def image_id(self, kind:str, statevector:list)-> str:
+        amplitudes = ";".join(f"{round(complex(i).real, self.decimals)+0.0},{round(complex(i).imag, self.decimals)+0.0}" for i in statevector)
+        return hashlib.sha256((kind+":"+amplitudes).encode("utf-8")).hexdigest()[:32]
+
+    def submit(self, kind:str, statevector:list)-> str:
+        """ Schedules the render of a state image unless it is already rendered or being rendered.
+
+        Args:
+            kind (str): "bloch_sphere" or "q_sphere"
+            statevector (list): state to render
+
+        Returns:
+            str: id of the image
+        """
+        if kind not in RenderCache.KINDS:
+            raise ValueError(f"Unsupported image kind: {kind}")
+        image_id = self.image_id(kind, statevector)
+        with self.lock:
+            if image_id in self.images:
+                self.images.move_to_end(image_id)
+                return image_id
+            if image_id in self.pending:
+                return image_id
+            self.pending[image_id] = self.executor.submit(self._render, image_id, kind, [complex(i) for i in statevector])
+        return image_id
+
+    def defer(self, kind:str, statevector:list)-> str:
+        """ Gives the id of a state image without rendering it, it is rendered when it is first fetched.
+
+        Returns:
+            str: id of the image
+        """
+        if kind not in RenderCache.KINDS:
+            raise ValueError(f"Unsupported image kind: {kind}")
+        image_id = self.image_id(kind, statevector)
+        with self.lock:
+            if image_id not in self.images and image_id not in self.pending:
+                self.deferred[image_id] = (kind, [complex(i) for i in statevector])
+                self.deferred.move_to_end(image_id)
+                # ids handed out for images nobody fetches are forgotten first
+                while len(self.deferred) > 16*self.max_images:
+                    self.deferred.popitem(last= False)
+        return image_id
+
+    def _render(self, image_id:str, kind:str, statevector:list)-> (bytes, str, str):
+        buffer = io.BytesIO()
+        try:
+            if kind == "bloch_sphere":
+                self.operations.save_bloch_sphere(state_vector= statevector, path= buffer, reverse= True)
+            else:
+                self.operations.save_q_sphere(state_vector= statevector, path= buffer, reverse= True)
+            return self._store(image_id, buffer.getvalue(), "image/png", source= (kind, statevector))
+        finally:
+            with self.lock:
+                self.pending.pop(image_id, None)
+
+    def _store(self, image_id:str, content:bytes, media_type:str, source:tuple|None = None)-> (bytes, str, str):
+        etag = '"'+hashlib.sha256(content).hexdigest()[:32]+'"'
+        with self.lock:
+            self.images[image_id] = (content, etag, media_type)
+            self.images.move_to_end(image_id)
+            if source is not None:
+                self.sources[image_id] = source
+            while len(self.images) > self.max_images:
+                evicted, _ = self.images.popitem(last= False)
+                # the image can be rendered again from its state
+                if evicted in self.sources:
+                    self.deferred[evicted] = self.sources.pop(evicted)
+                    self.deferred.move_to_end(evicted)
+            while len(self.deferred) > 16*self.max_images:
+                self.deferred.popitem(last= False)
+        return content, etag, media_type
+
+    def put(self, content:bytes, media_type:str)-> str:
+        """ Caches an image rendered elsewhere under an id derived from its content.
+
+        Returns:
+            str: id of the image
+        """
+        image_id = hashlib.sha256(content).hexdigest()[:32]
+        self._store(image_id, content, media_type)
+        return image_id
+
+    def get(self, image_id:str):
+        """ Returns the rendered image, or the future of a render in progress.
+
+        Returns:
+            (bytes, str, str)|Future|None: image, its ETag and media type, the future resolving to them, None if the image is unknown
+        """
+        with self.lock:
+            if image_id in self.images:
+                self.images.move_to_end(image_id)
+                return self.images[image_id]
+            if image_id in self.pending:
+                return self.pending[image_id]
+            deferred = self.deferred.pop(image_id, None)
+        if deferred is None:
+            return None
+        self.submit(kind= deferred[0], statevector= deferred[1])
+        with self.lock:
+            return self.images.get(image_id) or self.pending.get(image_id)
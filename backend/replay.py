@@ -0,0 +1,156 @@
+""" Replays request traces recorded by TrafficRecorder (QUNO_RECORD_DIR) against the game API.
+
+Requests are sent at their recorded offsets divided by --speed (0 sends them as fast as
+possible), but the requests of one game are always sent one after the other in recorded order.
+Games are created with their recorded seeds, so they deal the same cards, get the same targets
+and measure the same outcomes as the recorded games; the recorded game ids are mapped to the ids
+of the replayed games, for /create_game/ and for every room of /create_rooms/. Latency percentiles per endpoint are reported next to the recorded ones,
+with the number of moves whose drawn card or measurement differs from the recording.
+
+Usage:
+    python replay.py traces/ --speed 4                          # in-process against main.app
+    python replay.py traces/ --url http://127.0.0.1:8000 --speed 0
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from loadtest import LoadStats
+from recorder import TrafficRecorder
+
+# paths ending with a game id
+GAME_PATHS = ["/state_summary/", "/samples/", "/rooms/"]
+
+def load_traces(directory:str)-> list:
+    entries = []
+    for path in TrafficRecorder.trace_files(directory):
+        with open(path) as file:
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # the last line of a file may be cut short
+                    pass
+    return entries
+
+def recorded_game(entry:dict)-> int|None:
+    """ Recorded id of the game a request belongs to.
+    """
+    if entry["p"] == "/create_game/":
+        return entry.get("game_id")
+    if isinstance(entry.get("b"), dict) and isinstance(entry["b"].get("game_id"), int):
+        return entry["b"]["game_id"]
+    for prefix in GAME_PATHS:
+        if entry["p"].startswith(prefix) and entry["p"][len(prefix):].isdigit():
+            return int(entry["p"][len(prefix):])
+    return None
+
+def recorded_games(entry:dict)-> list:
+    """ Recorded ids of the games a request belongs to, all the rooms of a /create_rooms/ request.
+    """
+    if entry["p"] == "/create_rooms/":
+        return list(entry.get("game_ids") or [])
+    game = recorded_game(entry)
+    return [game] if game is not None else []
+
+class Replay():
+    def __init__(self, client:httpx.AsyncClient, speed:float) -> None:
+        self.client = client
+        self.speed = speed
+        self.stats = LoadStats()
+        self.recorded = LoadStats()
+        self.game_ids = {}
+        # last request sent for every recorded game
+        self.chains = {}
+        self.diverged = 0
+        self.checked = 0
+
+    async def send(self, entry:dict, previous:list):
+        for task in previous:
+            await task
+        game = recorded_game(entry)
+        body = entry.get("b")
+        path = entry["p"]
+        if entry["p"] == "/create_game/" and isinstance(body, dict):
+            body = dict(body, seed= entry.get("seed"), target_seed= entry.get("target_seed"))
+        elif entry["p"] == "/create_rooms/" and isinstance(body, dict) and isinstance(body.get("rooms"), list) and "seeds" in entry:
+            body = dict(body, rooms= [dict(room, seed= seed, target_seed= target_seed) if isinstance(room, dict) else room
+                                      for room, seed, target_seed in zip(body["rooms"], entry["seeds"], entry["target_seeds"])])
+        elif game is not None:
+            if game not in self.game_ids:
+                # the game was created before the recording started, or its creation failed
+                return
+            if isinstance(body, dict) and "game_id" in body:
+                body = dict(body, game_id= self.game_ids[game])
+            else:
+                path = path[:len(path)-len(str(game))]+str(self.game_ids[game])
+        url = path+("?"+entry["q"] if entry.get("q") else "")
+        start = time.perf_counter()
+        try:
+            if entry["m"] == "GET":
+                response = await self.client.get(url)
+            else:
+                response = await self.client.request(entry["m"], url, json= body)
+            data = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+            error = response.status_code >= 400 or (isinstance(data, dict) and "error" in data)
+        except (httpx.HTTPError, ValueError):
+            data = None
+            error = True
+        self.stats.record(entry["p"], time.perf_counter()-start, error)
+        if "e" in entry:
+            self.recorded.record(entry["p"], entry["e"]/1000, entry.get("s", 200) >= 400)
+        if error or not isinstance(data, dict):
+            return
+        if entry["p"] == "/create_game/" and game is not None:
+            self.game_ids[game] = data["game_id"]
+        if entry["p"] == "/create_rooms/":
+            for recorded, room in zip(recorded_games(entry), data.get("rooms", [])):
+                self.game_ids[recorded] = room["game_id"]
+        if entry["p"] == "/play_card/" and "new_card" in entry:
+            move = data.get(body["player"], {})
+            self.checked = self.checked+1
+            if move.get("new_card") != entry["new_card"] or move.get("measurement") != entry.get("measurement"):
+                self.diverged = self.diverged+1
+
+    async def run(self, entries:list)-> float:
+        tasks = []
+        start = time.monotonic()
+        for entry in entries:
+            if self.speed > 0:
+                delay = start+entry["t"]/self.speed-time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            games = recorded_games(entry)
+            task = asyncio.create_task(self.send(entry, [self.chains[game] for game in games if game in self.chains]))
+            for game in games:
+                self.chains[game] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        return time.monotonic()-start
+
+async def run(args):
+    entries = load_traces(args.traces)
+    if args.url is None:
+        import main as game_api
+        client = httpx.AsyncClient(transport= httpx.ASGITransport(app= game_api.app), base_url= "http://replay", timeout= None)
+    else:
+        client = httpx.AsyncClient(base_url= args.url, timeout= None)
+    async with client:
+        replay = Replay(client, args.speed)
+        elapsed = await replay.run(entries)
+    duration = entries[-1]["t"]-entries[0]["t"] if len(entries) != 0 else 0
+    print(f"== recorded ({duration:.2f} s) ==")
+    print(replay.recorded.report(max(duration, 1e-9)))
+    print(f"\n== replayed at speed {args.speed} ==")
+    print(replay.stats.report(max(elapsed, 1e-9)))
+    print(f"\n{replay.diverged} of {replay.checked} moves diverged from the recording")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= __doc__, formatter_class= argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("traces", help= "directory of the trace files")
+    parser.add_argument("--url", default= None, help= "base url of a running server, the app is loaded in-process if omitted")
+    parser.add_argument("--speed", type= float, default= 1.0, help= "time compression of the recording, 0 to send requests as fast as possible")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+
+import numpy as np
+
+class StateSampler():
+    """ Samples measurements of all the qubits of game states, many shots at a time.
+
+    The cumulative distribution of a game state is built once and kept until the state changes:
+    every move bumps the version of the game, including moves that update the state in place
+    (batched rows), so a table is kept with the version it was built from. A batch of shots is then one vectorized binary search of uniform draws in the table,
+    and the outcomes are returned as counts. Tables of at most `max_tables` games are kept, the
+    least recently sampled ones are dropped first.
+    """
+    BLOCK_SIZE = 2**16
+
+    def __init__(self, max_tables:int = 64) -> None:
+        self.max_tables = max_tables
+        self.tables = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cumulative(self, statevector)-> np.ndarray:
+        """ Cumulative measurement probabilities of a state, normalized so the last one is 1.
+
+        Large (possibly memory-mapped) states are read block by block.
+        """
+        table = np.empty(len(statevector), dtype= np.float64)
+        total = 0.0
+        for start in range(0, len(statevector), StateSampler.BLOCK_SIZE):
+            block = np.asarray(statevector[start:start+StateSampler.BLOCK_SIZE], dtype= complex)
+            probabilities = block.real**2+block.imag**2
+            np.cumsum(probabilities, out= table[start:start+len(block)])
+            table[start:start+len(block)] += total
+            total = table[start+len(block)-1]
+        if total <= 0:
+            raise ValueError("Game state has no probability to sample from")
+        table /= total
+        return table
+
+    def table(self, game)-> np.ndarray:
+        statevector = game.game_state
+        entry = self.tables.get(game.game_id)
+        if entry is not None and entry[0] == game.version:
+            self.hits = self.hits+1
+            self.tables.move_to_end(game.game_id)
+            return entry[1]
+        self.misses = self.misses+1
+        table = self.cumulative(statevector)
+        self.tables[game.game_id] = (game.version, table)
+        self.tables.move_to_end(game.game_id)
+        while len(self.tables) > self.max_tables:
+            self.tables.popitem(last= False)
+        return table
+
+    def sample(self, game, shots:int, seed:int|None = None)-> dict:
+        """ Measures all the qubits of the game state `shots` times.
+
+        Sampling does not change the game, nor its random generator.
+
+        Args:
+            game (Game): the game whose state is measured
+            shots (int): number of measurements
+            seed (int|None, optional): seed of the draws. Defaults to None.
+
+        Returns:
+            dict: basis states (qubit 0 the leftmost bit) and how many shots gave them, most frequent first
+        """
+        table = self.table(game)
+        num_qubits = len(table).bit_length()-1
+        draws = np.random.default_rng(seed).random(shots)
+        outcomes = np.searchsorted(table, draws, side= "right")
+        # rounding can leave the last cumulative probability a hair below a draw
+        np.minimum(outcomes, len(table)-1, out= outcomes)
+        values, counts = np.unique(outcomes, return_counts= True)
+        order = np.argsort(-counts, kind= "stable")
+        return {format(value, f"0{num_qubits}b"): count for value, count in zip(values[order].tolist(), counts[order].tolist())}
+
+    def release(self, game):
+        self.tables.pop(game.game_id, None)
+
+    def stats(self)-> dict:
+        return {"tables": len(self.tables), "max_tables": self.max_tables, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,132 @@
+import itertools
+import os
+
+import numpy as np
+
+from parallel import ParallelKernels
+
+class ScratchStorage():
+    """ Keeps the game states of large games in memory-mapped files of a local scratch directory.
+
+    Game states of at least `min_qubits` qubits are stored in a file per game and every move
+    streams over them in blocks of 2**`block_qubits` amplitudes: a block is read, updated in
+    memory and written to the file of the new state. Only a few blocks are resident at a time,
+    the rest of the state stays in the page cache, which the kernel can write back and evict, so a
+    big game slows down instead of exhausting the memory of the worker.
+    """
+    def __init__(self, directory:str, min_qubits:int = 20, block_qubits:int = 16, dtype = np.complex128) -> None:
+        self.directory = directory
+        self.min_qubits = min_qubits
+        self.block_qubits = block_qubits
+        self.dtype = dtype
+        self.files = {}
+        self.generation = 0
+        os.makedirs(directory, exist_ok= True)
+
+    def accepts(self, num_amplitudes:int)-> bool:
+        return num_amplitudes >= 2**self.min_qubits
+
+    def new_state(self, game, num_amplitudes:int)-> np.ndarray:
+        """ Creates the zero filled array a new game state of a game is written into.
+
+        States that are large enough get a new file, and the file of the previous state of the
+        game is unlinked (its mapping stays readable until it is dropped). Smaller states are
+        plain arrays.
+        """
+        previous = self.files.pop(game.game_id, None)
+        if previous is not None:
+            os.remove(previous)
+        if not self.accepts(num_amplitudes):
+            return np.zeros(num_amplitudes, dtype= self.dtype)
+        self.generation = self.generation+1
+        path = os.path.join(self.directory, f"game_{game.game_id}_{self.generation}.state")
+        self.files[game.game_id] = path
+        return np.memmap(path, dtype= self.dtype, mode= "w+", shape= (num_amplitudes,))
+
+    def finish(self, statevector:np.ndarray):
+        """ Flushes a mapped state, and turns a state that became too small to map into a list.
+        """
+        if isinstance(statevector, np.memmap):
+            statevector.flush()
+            return statevector
+        return statevector.tolist()
+
+    def release(self, game):
+        path = self.files.pop(game.game_id, None)
+        if path is not None:
+            os.remove(path)
+
+    def blocks(self, num_qubits:int, fixed_qubits:tuple = ())-> list:
+        """ Index tuples of blocks of at most 2**block_qubits amplitudes, never splitting the qubits in `fixed_qubits`.
+        """
+        free_qubits = [qubit for qubit in range(num_qubits) if qubit not in fixed_qubits]
+        split_qubits = free_qubits[:max(num_qubits-self.block_qubits, 0)]
+        blocks = []
+        for bits in itertools.product((0, 1), repeat= len(split_qubits)):
+            index = [slice(None)]*num_qubits
+            for qubit, bit in zip(split_qubits, bits):
+                index[qubit] = bit
+            blocks.append(tuple(index)+(Ellipsis,))
+        return blocks
+
+    def store(self, game, statevector)-> np.ndarray:
+        """ Copies a game state into a mapped file block by block.
+        """
+        new_state = self.new_state(game, len(statevector))
+        size = 2**self.block_qubits
+        for start in range(0, len(statevector), size):
+            chunk = np.asarray(statevector[start:start+size], dtype= self.dtype)
+            new_state[start:start+len(chunk)] = chunk
+        return self.finish(new_state)
+
+    def next_game_state(self, game, card:str, qubits:list, gate_matrix:list|None)-> (int|None, np.ndarray|list):
+        """ Streamed counterpart of Game.next_game_state for mapped game states.
+        """
+        if card == "add_card":
+            return None, self.add_qubit(game, game.game_state)
+        if card == "remove_card":
+            return self.measure_and_remove_qubit(game, qubits[0], game.game_state, game.rng)
+        return None, self.apply_gate(game, game.game_state, gate_matrix, qubits)
+
+    def add_qubit(self, game, statevector)-> np.ndarray:
+        """ Adds a qubit in state 0 in front of the others, like QuantumGates.add_qubit: the old amplitudes followed by zeros.
+        """
+        new_state = self.new_state(game, 2*len(statevector))
+        size = 2**self.block_qubits
+        for start in range(0, len(statevector), size):
+            # a state smaller than a block gives a shorter chunk, the zeros after it stay untouched
+            chunk = np.asarray(statevector[start:start+size], dtype= self.dtype)
+            new_state[start:start+len(chunk)] = chunk
+        return self.finish(new_state)
+
+    def apply_gate(self, game, statevector, unitary:list, qubits:list)-> np.ndarray:
+        num_qubits = len(statevector).bit_length()-1
+        state = np.asarray(statevector).reshape((2,)*num_qubits)
+        new_state = self.new_state(game, len(statevector))
+        new_view = new_state.reshape((2,)*num_qubits)
+        unitary = [[complex(value) for value in row] for row in unitary]
+        for index in self.blocks(num_qubits, tuple(qubits)):
+            block = np.array(state[index], dtype= complex)
+            new_block = np.empty_like(block)
+            ParallelKernels.apply_to_block(block, new_block, unitary, ParallelKernels.block_axes(index, qubits))
+            new_view[index] = new_block
+        return self.finish(new_state)
+
+    def measure_and_remove_qubit(self, game, qubit:int, statevector, rng)-> (int, np.ndarray|list):
+        num_qubits = len(statevector).bit_length()-1
+        state = np.asarray(statevector).reshape((2,)*num_qubits)
+        probabilities = [0.0, 0.0]
+        for index in self.blocks(num_qubits, (qubit,)):
+            block = state[index]
+            axis = ParallelKernels.block_axes(index, (qubit,))[0]
+            for bit in (0, 1):
+                part = np.take(block, bit, axis= axis).astype(complex)
+                probabilities[bit] = probabilities[bit]+np.vdot(part, part).real
+        measurement = rng.choices([0, 1], probabilities)[0]
+        scale = 1/np.sqrt(probabilities[measurement])
+        new_state = self.new_state(game, len(statevector)//2)
+        new_view = new_state.reshape((2,)*(num_qubits-1))
+        for index in self.blocks(num_qubits-1):
+            source = index[:qubit]+(measurement,)+index[qubit:]
+            new_view[index] = np.asarray(state[source], dtype= complex)*scale
+        return measurement, self.finish(new_state)
@@ -0,0 +1,368 @@
+""" Game host that spreads games over worker processes.
+
+Each worker process owns a shard of the games and serves them with the handlers of main.py,
+so all state of a game stays inside one process and needs no locking. The FastAPI app of this
+module only routes requests to the owning worker by game id. Game ids are global: the game
+`local_id` of shard `shard` is exposed as `local_id*num_shards + shard`.
+
+Usage: QUNO_SHARDS=4 uvicorn sharding:app
+"""
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+
+def run_shard(shard:int, connection):
+    """ Serves requests of one shard until it receives None or the connection is closed. Runs in the worker process.
+    """
+    if os.environ.get("QUNO_JOURNAL_DIR"):
+        os.environ["QUNO_JOURNAL_DIR"] = os.path.join(os.environ["QUNO_JOURNAL_DIR"], "shard_"+str(shard))
+    import main
+
+    handlers = {"/create_game/": main.create_game,
+                "/play_card/": main.play_card,
+                "/show/": main.show,
+                "/drop/": main.drop,
+                "/add_deck/": main.add_deck,
+                "/game_circuit/": main.send_game_circuit,
+                "/create_rooms/": main.create_rooms,
+                "/bot_turn/": main.bot_turn,
+                "/rooms/": lambda body: room_snapshot(main, body),
+                "/state_summary/": lambda body: main.send_state_summary(body["game_id"], player= body.get("player"), top_k= body.get("top_k", 8)),
+                "/samples/": lambda body: main.send_samples(body["game_id"], shots= body.get("shots", 1024), seed= body.get("seed")),
+                "/forks/": main.create_fork,
+                "/forks/play": lambda body: main.play_fork_card(body["fork_id"], body),
+                "/forks/get": lambda body: main.get_fork_state(body["fork_id"]),
+                "/forks/delete": lambda body: main.delete_fork(body["fork_id"]),
+                "/limits/": lambda body: main.get_limits() if body is None else main.set_limits(body),
+                "/sampler/": lambda body: main.get_sampler(),
+                "/bots/": lambda body: main.get_bots(),
+                "/transitions/": lambda body: main.get_transitions(),
+                "/recorder/": lambda body: main.get_recorder(),
+                "/admission/": lambda body: main.get_admission(),
+                "/images/": lambda body: get_image(main.renders, body["image_id"])}
+    loop = asyncio.new_event_loop()
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        request_id, endpoint, body = message
+        try:
+            response = handlers[endpoint](body)
+            if asyncio.iscoroutine(response):
+                response = loop.run_until_complete(response)
+            connection.send((request_id, 200, response))
+        except main.HTTPException as e:
+            connection.send((request_id, e.status_code, {"detail": e.detail}))
+        except Exception as e:
+            connection.send((request_id, 500, {"detail": str(e)}))
+    loop.close()
+
+def get_image(renders, image_id:str)-> dict:
+    image = renders.get(image_id)
+    if image is None:
+        raise HTTPException(status_code= 404, detail= "Image not found")
+    if not isinstance(image, tuple):
+        image = image.result()
+    return {"content": image[0], "etag": image[1], "media_type": image[2]}
+
+def room_snapshot(main, body:dict)-> dict:
+    game = main.get_game(body["game_id"])
+    etag = main.snapshots.etag(game)
+    if body.get("etag") == etag:
+        return {"etag": etag, "content": None}
+    etag, content = main.snapshots.get(game)
+    return {"etag": etag, "content": content}
+
+class ShardedGameHost():
+    """ Starts the shard worker processes and forwards requests to them over pipes.
+    """
+    def __init__(self, num_shards:int|None = None) -> None:
+        if num_shards is None:
+            num_shards = os.cpu_count() or 1
+        self.num_shards = num_shards
+        self.request_ids = itertools.count()
+        # request id -> future of the response, one dict per shard
+        self.pending = [{} for shard in range(num_shards)]
+        self.dead = [False]*num_shards
+        self.next_shard = itertools.cycle(range(num_shards))
+        self.connections = []
+        self.processes = []
+        self.listeners = []
+        self.loop = None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context("spawn")
+        for shard in range(self.num_shards):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target= run_shard, args= (shard, worker_connection), daemon= True)
+            process.start()
+            worker_connection.close()
+            listener = threading.Thread(target= self._listen, args= (shard, connection), daemon= True)
+            listener.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+            self.listeners.append(listener)
+
+    def stop(self):
+        # The listener threads keep the pipes open while they wait, so workers are told to stop explicitly.
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(timeout= 5)
+            if process.is_alive():
+                process.terminate()
+        for connection in self.connections:
+            connection.close()
+
+    def _listen(self, shard:int, connection):
+        while True:
+            try:
+                request_id, status_code, response = connection.recv()
+            except (EOFError, OSError):
+                break
+            future = self.pending[shard].pop(request_id, None)
+            if future is not None:
+                self.loop.call_soon_threadsafe(self._resolve, future, (status_code, response))
+        # the worker is gone, requests still waiting for it would never be answered
+        self.loop.call_soon_threadsafe(self._fail_shard, shard)
+
+    def _resolve(self, future:asyncio.Future, result:tuple):
+        if not future.done():
+            future.set_result(result)
+
+    def _fail_shard(self, shard:int):
+        self.dead[shard] = True
+        pending, self.pending[shard] = self.pending[shard], {}
+        for future in pending.values():
+            self._resolve(future, (503, {"detail": "Shard "+str(shard)+" is down"}))
+
+    def shard_of(self, game_id:int)-> (int, int):
+        """ Returns the shard owning a game and the id of the game inside that shard.
+        """
+        game_id = int(game_id)
+        return game_id % self.num_shards, game_id // self.num_shards
+
+    def global_game_id(self, shard:int, local_game_id:int)-> int:
+        return local_game_id*self.num_shards + shard
+
+    async def forward(self, shard:int, endpoint:str, body:dict)-> dict:
+        if self.dead[shard]:
+            raise HTTPException(status_code= 503, detail= "Shard "+str(shard)+" is down")
+        request_id = next(self.request_ids)
+        future = self.loop.create_future()
+        self.pending[shard][request_id] = future
+        try:
+            self.connections[shard].send((request_id, endpoint, body))
+        except OSError:
+            self._fail_shard(shard)
+        status_code, response = await future
+        if status_code != 200:
+            raise HTTPException(status_code= status_code, detail= response["detail"])
+        return response
+
+    async def broadcast(self, endpoint:str, body:dict|None)-> list:
+        return list(await asyncio.gather(*[self.forward(shard, endpoint, body) for shard in range(self.num_shards)]))
+
+    def next_live_shard(self)-> int:
+        for _ in range(self.num_shards):
+            shard = next(self.next_shard)
+            if not self.dead[shard]:
+                return shard
+        raise HTTPException(status_code= 503, detail= "All shards are down")
+
+    def globalize_room(self, shard:int, room:dict):
+        room["game_id"] = self.global_game_id(shard, room["game_id"])
+        for details in room["data"].values():
+            details["game_id"] = self.global_game_id(shard, details["game_id"])
+            # rendered images live in the shard that created the game
+            for image in details.values():
+                if isinstance(image, dict) and "url" in image:
+                    image["url"] = "/shards/"+str(shard)+image["url"]
+
+    async def create_game(self, body:dict)-> dict:
+        shard = self.next_live_shard()
+        response = await self.forward(shard, "/create_game/", body)
+        self.globalize_room(shard, response)
+        return response
+
+    async def create_rooms(self, body:dict)-> dict:
+        # the rooms of a request are created together, in one shard
+        shard = self.next_live_shard()
+        response = await self.forward(shard, "/create_rooms/", body)
+        for room in response.get("rooms", []):
+            self.globalize_room(shard, room)
+        return response
+
+    async def route(self, endpoint:str, body:dict)-> dict:
+        if "game_id" not in body:
+            raise HTTPException(status_code= 422, detail= "game_id is required")
+        try:
+            shard, local_game_id = self.shard_of(body["game_id"])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code= 404, detail= "Game instance not found")
+        body = dict(body)
+        body["game_id"] = local_game_id
+        response = await self.forward(shard, endpoint, body)
+        if isinstance(response.get("url"), str) and response["url"].startswith("/images/"):
+            response["url"] = "/shards/"+str(shard)+response["url"]
+        return response
+
+    def global_fork_id(self, shard:int, fork_id:str)-> str:
+        return fork_id+"-"+str(shard)
+
+    def shard_of_fork(self, fork_id:str)-> (int, str):
+        """ Returns the shard owning a fork and the id of the fork inside that shard.
+        """
+        local_fork_id, _, shard = fork_id.rpartition("-")
+        if not shard.isdigit() or int(shard) >= self.num_shards:
+            raise HTTPException(status_code= 404, detail= "Fork not found")
+        return int(shard), local_fork_id
+
+    async def route_fork(self, endpoint:str, fork_id:str, body:dict)-> dict:
+        shard, local_fork_id = self.shard_of_fork(fork_id)
+        response = await self.forward(shard, endpoint, dict(body, fork_id= local_fork_id))
+        if "fork_id" in response:
+            response["fork_id"] = self.global_fork_id(shard, response["fork_id"])
+        if "game_id" in response:
+            response["game_id"] = self.global_game_id(shard, response["game_id"])
+        return response
+
+host = ShardedGameHost(num_shards= int(os.environ["QUNO_SHARDS"]) if os.environ.get("QUNO_SHARDS") else None)
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    host.start()
+    yield
+    host.stop()
+
+app = FastAPI(lifespan= lifespan)
+
+@app.post("/create_game/", status_code= 201)
+async def create_game(_json:dict)-> dict:
+    return await host.create_game(_json)
+
+@app.post("/create_rooms/", status_code= 201)
+async def create_rooms(_json:dict)-> dict:
+    return await host.create_rooms(_json)
+
+@app.post("/play_card/", status_code= 201)
+async def play_card(_json:dict)-> dict:
+    return await host.route("/play_card/", _json)
+
+@app.post("/show/", status_code= 201)
+async def show(_json:dict)-> dict:
+    return await host.route("/show/", _json)
+
+@app.post("/drop/", status_code= 201)
+async def drop(_json:dict)-> dict:
+    return await host.route("/drop/", _json)
+
+@app.post("/add_deck/", status_code= 201)
+async def add_deck(_json:dict)-> dict:
+    return await host.route("/add_deck/", _json)
+
+@app.post("/game_circuit/", status_code= 201)
+async def send_game_circuit(_json:dict)-> dict:
+    return await host.route("/game_circuit/", _json)
+
+@app.post("/bot_turn/", status_code= 201)
+async def bot_turn(_json:dict)-> dict:
+    return await host.route("/bot_turn/", _json)
+
+@app.get("/rooms/{game_id}")
+async def get_room(game_id:int, request:Request)-> Response:
+    room = await host.route("/rooms/", {"game_id": game_id, "etag": request.headers.get("if-none-match")})
+    headers = {"ETag": room["etag"], "Cache-Control": "no-cache"}
+    if room["content"] is None:
+        return Response(status_code= 304, headers= headers)
+    # snapshots carry the id of the game inside its shard
+    snapshot = json.loads(room["content"])
+    snapshot["game_id"] = game_id
+    return Response(content= json.dumps(snapshot, separators= (",", ":")), media_type= "application/json", headers= headers)
+
+@app.get("/state_summary/{game_id}")
+async def send_state_summary(game_id:int, player:str|None = None, top_k:int = 8)-> dict:
+    return await host.route("/state_summary/", {"game_id": game_id, "player": player, "top_k": top_k})
+
+@app.get("/samples/{game_id}")
+async def send_samples(game_id:int, shots:int = 1024, seed:int|None = None)-> dict:
+    return await host.route("/samples/", {"game_id": game_id, "shots": shots, "seed": seed})
+
+@app.post("/forks/", status_code= 201)
+async def create_fork(_json:dict)-> dict:
+    if _json.get("fork_id") is not None:
+        return await host.route_fork("/forks/", _json["fork_id"], _json)
+    response = await host.route("/forks/", _json)
+    shard, _ = host.shard_of(_json["game_id"])
+    response["fork_id"] = host.global_fork_id(shard, response["fork_id"])
+    response["game_id"] = host.global_game_id(shard, response["game_id"])
+    return response
+
+@app.post("/forks/{fork_id}/play", status_code= 201)
+async def play_fork_card(fork_id:str, _json:dict)-> dict:
+    return await host.route_fork("/forks/play", fork_id, _json)
+
+@app.get("/forks/{fork_id}")
+async def get_fork_state(fork_id:str)-> dict:
+    return await host.route_fork("/forks/get", fork_id, {})
+
+@app.delete("/forks/{fork_id}")
+async def delete_fork(fork_id:str)-> dict:
+    return await host.route_fork("/forks/delete", fork_id, {})
+
+@app.get("/limits/")
+async def get_limits()-> dict:
+    return {"shards": await host.broadcast("/limits/", None)}
+
+@app.post("/limits/", status_code= 201)
+async def set_limits(_json:dict)-> dict:
+    return {"shards": await host.broadcast("/limits/", _json)}
+
+@app.get("/sampler/")
+async def get_sampler()-> dict:
+    return {"shards": await host.broadcast("/sampler/", None)}
+
+@app.get("/bots/")
+async def get_bots()-> dict:
+    return {"shards": await host.broadcast("/bots/", None)}
+
+@app.get("/transitions/")
+async def get_transitions()-> dict:
+    return {"shards": await host.broadcast("/transitions/", None)}
+
+@app.get("/recorder/")
+async def get_recorder()-> dict:
+    return {"shards": await host.broadcast("/recorder/", None)}
+
+@app.get("/admission/")
+async def get_admission()-> dict:
+    return {"shards": await host.broadcast("/admission/", None)}
+
+# rankings and profiles are kept by each shard and cannot be served from one of them
+@app.api_route("/leaderboard/{path:path}", methods= ["GET"])
+@app.api_route("/profiler/{path:path}", methods= ["GET", "POST"])
+async def not_sharded(request:Request):
+    raise HTTPException(status_code= 501, detail= request.url.path+" is not available with QUNO_SHARDS, run a single server to use it")
+
+@app.get("/shards/{shard}/images/{image_id}")
+async def get_shard_image(shard:int, image_id:str, request:Request)-> Response:
+    if shard not in range(host.num_shards):
+        raise HTTPException(status_code= 404, detail= "Image not found")
+    image = await host.forward(shard, "/images/", {"image_id": image_id})
+    headers = {"ETag": image["etag"], "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == image["etag"]:
+        return Response(status_code= 304, headers= headers)
+    return Response(content= image["content"], media_type= image["media_type"], headers= headers)
@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+class RoomSnapshots():
+    """ Pre-serialized public snapshots of rooms, one per version of the game.
+
+    A snapshot is built (and the queued gates of the game applied) the first time a version is
+    requested, and served as the same bytes until the game changes. The ETag of a snapshot is
+    derived from the game id and version alone, so a poll with a matching If-None-Match is
+    answered without building or even reading anything of the game. The token of the server
+    process is part of the ETag, so versions counted by an earlier process never match. Snapshots
+    of at most `max_rooms` rooms are kept, the least recently polled ones are dropped first.
+    """
+    def __init__(self, max_rooms:int = 4096) -> None:
+        self.max_rooms = max_rooms
+        self.token = os.urandom(4).hex()
+        self.snapshots = OrderedDict()
+        self.lock = threading.Lock()
+        self.built = 0
+        self.served = 0
+
+    def etag(self, game)-> str:
+        return f'"{self.token}-{game.game_id}-{game.version}"'
+
+    def snapshot(self, game)-> dict:
+        """ What everyone in or watching a room may see: the game state, the fidelities and hand sizes of the players and the results so far.
+        """
+        # the version is read first: a move landing in between makes the snapshot newer than its
+        # version, which only costs a rebuild, never older, which would be served as current
+        version = game.version
+        game_state = game.game_state
+        players = {}
+        for player in game.get_players():
+            players[player.name.split("_")[0]] = {"fidelity": game.fidelity(player.target_state, game_state).real if player.target_state is not None else None,
+                                                  "cards": len(player.card_codes)}
+        return {"game_id": game.game_id,
+                "version": version,
+                "num_qubits": len(game_state).bit_length()-1,
+                "game_state": [str(i) for i in game_state],
+                "remaining_cards": len(game._remaining_cards),
+                "players": players,
+                "winners": [player.name.split("_")[0] for player in game.winning_players],
+                "ejected": [player.name.split("_")[0] for player in game.ejected_players]}
+
+    def get(self, game)-> (str, bytes):
+        """ ETag and JSON body of the snapshot of the current version of a game.
+        """
+        etag = self.etag(game)
+        with self.lock:
+            entry = self.snapshots.get(game.game_id)
+            if entry is not None and entry[0] == etag:
+                self.snapshots.move_to_end(game.game_id)
+                self.served = self.served+1
+                return entry
+        snapshot = self.snapshot(game)
+        content = json.dumps(snapshot, separators= (",", ":")).encode()
+        # the game may have moved on since the ETag above, the snapshot is stored under the version it was read at
+        etag = f'"{self.token}-{game.game_id}-{snapshot["version"]}"'
+        with self.lock:
+            self.snapshots[game.game_id] = (etag, content)
+            self.snapshots.move_to_end(game.game_id)
+            while len(self.snapshots) > self.max_rooms:
+                self.snapshots.popitem(last= False)
+            self.built = self.built+1
+            self.served = self.served+1
+        return etag, content
+
+    def stats(self)-> dict:
+        return {"rooms": len(self.snapshots), "max_rooms": self.max_rooms, "built": self.built, "served": self.served}
@@ -0,0 +1,124 @@
+from collections import OrderedDict, deque
+
+import random
+import threading
+import time
+
+from code_game import Game
+
+class TargetStatePool():
+    """ Pool of target state sets generated ahead of time, per game configuration.
+
+    A configuration is the initial state, no. of decks, no. of players and no. of qubits of a
+    game. Every configuration a game asks for is remembered (at most `max_configurations`, least
+    recently used first out), and a background thread keeps up to `pool_size` ready sets for
+    each of them. The thread only generates while no request is being served, so refilling
+    does not compete with the games for the interpreter.
+    """
+    def __init__(self, pool_size:int = 8, max_configurations:int = 32, idle_delay:float = 0.05) -> None:
+        self.pool_size = pool_size
+        self.max_configurations = max_configurations
+        self.idle_delay = idle_delay
+        self.pools = OrderedDict()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.active_requests = 0
+        self.last_activity = time.monotonic()
+        self.rng = random.Random()
+        self.hits = 0
+        self.misses = 0
+        self.thread = None
+        self.running = False
+
+    def key(self, initial_state:list, num_decks:int, num_players:int, total_qubits:int)-> tuple:
+        return (tuple(complex(i) for i in initial_state), num_decks, num_players, total_qubits)
+
+    def pop(self, initial_state:list, num_decks:int, num_players:int, total_qubits:int)-> tuple|None:
+        """ Takes a ready target set of the configuration out of the pool.
+
+        Returns:
+            tuple|None: (seed, target states, gate sequence, target sequence numbers, random angles), None if the pool of the configuration is empty
+        """
+        key = self.key(initial_state, num_decks, num_players, total_qubits)
+        with self.lock:
+            if key not in self.pools:
+                self.pools[key] = deque()
+                if len(self.pools) > self.max_configurations:
+                    self.pools.popitem(last= False)
+            self.pools.move_to_end(key)
+            target_set = self.pools[key].popleft() if len(self.pools[key]) != 0 else None
+            if target_set is None:
+                self.misses = self.misses+1
+            else:
+                self.hits = self.hits+1
+        self.wakeup.set()
+        return target_set
+
+    def prewarm(self, initial_state:list, num_decks:int, num_players:int, total_qubits:int):
+        """ Registers a configuration, so that its pool is filled before the first game asks for it.
+        """
+        key = self.key(initial_state, num_decks, num_players, total_qubits)
+        with self.lock:
+            if key not in self.pools:
+                self.pools[key] = deque()
+        self.wakeup.set()
+
+    def request_started(self):
+        self.active_requests = self.active_requests+1
+
+    def request_finished(self):
+        self.active_requests = self.active_requests-1
+        self.last_activity = time.monotonic()
+
+    def is_idle(self)-> bool:
+        return self.active_requests == 0 and time.monotonic()-self.last_activity >= self.idle_delay
+
+    def next_key(self)-> tuple|None:
+        with self.lock:
+            for key, pool in reversed(self.pools.items()):
+                if len(pool) < self.pool_size:
+                    return key
+        return None
+
+    def refill_one(self)-> bool:
+        """ Generates one target set for the most recently used configuration that is not full.
+
+        Returns:
+            bool: False if every pool is full
+        """
+        key = self.next_key()
+        if key is None:
+            return False
+        initial_state, num_decks, num_players, total_qubits = key
+        seed = self.rng.getrandbits(64)
+        target_set = Game.generate_target_set(initial_state= list(initial_state), num_decks= num_decks, num_players= num_players, total_qubits= total_qubits, seed= seed)
+        with self.lock:
+            if key in self.pools and len(self.pools[key]) < self.pool_size:
+                self.pools[key].append((seed,)+target_set)
+        return True
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target= self.run, daemon= True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def run(self):
+        while self.running:
+            if not self.is_idle():
+                time.sleep(self.idle_delay)
+                continue
+            self.wakeup.clear()
+            if not self.refill_one():
+                self.wakeup.wait()
+
+    def stats(self)-> dict:
+        with self.lock:
+            return {"configurations": len(self.pools),
+                    "ready_sets": sum(len(pool) for pool in self.pools.values()),
+                    "hits": self.hits,
+                    "misses": self.misses}
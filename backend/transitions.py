@@ -0,0 +1,110 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import Operations
+
+class TransitionCache():
+    """ Memoizes gate transitions and fidelities of small game states, shared by all games.
+
+    Most games stay at a few qubits and play a finite set of gates, so the same states come up
+    again and again across rooms. States of at most `max_qubits` qubits are keyed by a hash of
+    their amplitudes rounded to `decimals` digits; a gate on such a state is looked up by (state,
+    gate, qubits) and returns the next state computed the first time, and a fidelity by (state,
+    target). Entries are evicted least recently used first, past `max_entries` of each kind.
+    """
+    def __init__(self, max_qubits:int = 4, max_entries:int = 2**16, decimals:int = 10) -> None:
+        self.max_qubits = max_qubits
+        self.max_entries = max_entries
+        self.decimals = decimals
+        self.scale = 10.0**decimals
+        self.max_amplitudes = 2**max_qubits
+        self.states = OrderedDict()
+        self.fidelities = OrderedDict()
+        # id of a list -> (list, key), the list is kept so its id is not reused
+        self.keys = OrderedDict()
+        self.state_hits = 0
+        self.state_misses = 0
+        self.fidelity_hits = 0
+        self.fidelity_misses = 0
+
+    def accepts(self, num_amplitudes:int)-> bool:
+        return num_amplitudes <= self.max_amplitudes
+
+    def state_key(self, statevector, amplitudes = None)-> int:
+        """ Hash of the rounded amplitudes of a state (or of `amplitudes` given for it, like the entries of a gate matrix).
+        """
+        # lists are never changed in place, only replaced, so the key of a list is kept with it (arrays may be changed in place)
+        if isinstance(statevector, list):
+            entry = self.keys.get(id(statevector))
+            if entry is not None and entry[0] is statevector:
+                return entry[1]
+        # adding 0.0 turns -0.0 into 0.0, so both hash alike
+        key = hash((np.rint(np.asarray(amplitudes if amplitudes is not None else statevector, dtype= complex).view(float)*self.scale)+0.0).tobytes())
+        if isinstance(statevector, list):
+            self.remember_key(statevector, key)
+        return key
+
+    def remember_key(self, statevector:list, key:int):
+        self.store(self.keys, id(statevector), (statevector, key))
+
+    def lookup(self, entries:OrderedDict, key):
+        value = entries.get(key)
+        if value is not None:
+            try:
+                entries.move_to_end(key)
+            except KeyError:
+                # evicted by another thread in between, it is still a valid value
+                pass
+        return value
+
+    def store(self, entries:OrderedDict, key, value):
+        entries[key] = value
+        if len(entries) > self.max_entries:
+            try:
+                entries.popitem(last= False)
+            except KeyError:
+                pass
+
+    def apply_gate(self, statevector, gate_matrix, qubits, compute)-> list:
+        """ Next state of a gate on a state, `compute()` gives it on a miss.
+
+        Lists are never changed in place, so the cached list itself is returned and may become the
+        game state of several games.
+        """
+        key = hash((self.state_key(statevector), tuple(qubits), self.state_key(gate_matrix, [value for row in gate_matrix for value in row])))
+        new_statevector = self.lookup(self.states, key)
+        if new_statevector is not None:
+            self.state_hits = self.state_hits+1
+            return new_statevector
+        self.state_misses = self.state_misses+1
+        new_statevector = compute()
+        self.store(self.states, key, new_statevector)
+        return new_statevector
+
+    def fidelity(self, game, state1, state2):
+        """ Fidelity of two states, computed by `game` on a miss.
+        """
+        key = (self.state_key(state1), self.state_key(state2))
+        fidelity = self.lookup(self.fidelities, key)
+        if fidelity is not None:
+            self.fidelity_hits = self.fidelity_hits+1
+            return fidelity
+        self.fidelity_misses = self.fidelity_misses+1
+        fidelity = float(Operations.fidelity(game, state1, state2).real)
+        self.store(self.fidelities, key, fidelity)
+        return fidelity
+
+    def stats(self)-> dict:
+        state_lookups = self.state_hits+self.state_misses
+        fidelity_lookups = self.fidelity_hits+self.fidelity_misses
+        return {"max_qubits": self.max_qubits,
+                "max_entries": self.max_entries,
+                "transitions": len(self.states),
+                "transition_hits": self.state_hits,
+                "transition_misses": self.state_misses,
+                "transition_hit_rate": self.state_hits/state_lookups if state_lookups != 0 else 0.0,
+                "fidelities": len(self.fidelities),
+                "fidelity_hits": self.fidelity_hits,
+                "fidelity_misses": self.fidelity_misses,
+                "fidelity_hit_rate": self.fidelity_hits/fidelity_lookups if fidelity_lookups != 0 else 0.0}
@@ -4,10 +4,16 @@ from qiskit.visualization import plot_bloch_multivector, plot_state_qsphere
 
 import matplotlib.pyplot as plt
 import base64
+from xml.sax.saxutils import escape
 
+import collections
 import enum
 import cmath
+import functools
 import random
+import threading
+
+import numpy as np
 
 # from gates import QuantumGates
 
@@ -15,6 +21,15 @@ class Constants(enum.Enum):
     R_angles = [0, cmath.pi, cmath.pi/2, -cmath.pi/2, cmath.pi/4, -cmath.pi/4, 3*cmath.pi/2, -3*cmath.pi/2]
 
 class Operations():
+    __slots__ = ()
+    # ParallelKernels used for statevectors it accepts, None to always use the single threaded code
+    parallel = None
+    # index gathers and phases of gates on whole states, kept up to GATE_CACHE_BYTES in total
+    GATE_CACHE_BYTES = 64*2**20
+    gate_cache = collections.OrderedDict()
+    gate_cache_bytes = 0
+    gate_cache_lock = threading.Lock()
+
     def __init__(self) -> None:
         pass
     
@@ -73,6 +88,146 @@ class Operations():
         image = circuit_drawer(qc, output='mpl')
         image.savefig(path, format='png')
 
+    def circuit_svg(self, gates:list, qubits:list, angles:list)-> str:
+        """Lays out the given gates as a circuit diagram and returns it as SVG text, without qiskit or matplotlib.
+
+        Gates are placed in the earliest column free on all of their qubits. `add_card` starts the wire
+        of its qubit (a new wire below the others if no qubit is given) and `remove_card` ends it with
+        a measurement.
+
+        Args:
+            gates (list): list of gates
+            qubits (list): list of qubits the gate should be applied on
+            angles (list): List of angles for roatation gates, if angles are not required add None at that position
+
+        Raises:
+            Exception: gates, qubits and angles lengths are not equal
+
+        Returns:
+            str: SVG document
+        """
+        if not len(gates) == len(qubits) == len(angles):
+            raise Exception("gates, qubits and angles lengths are not equal")
+        column_width, row_height, margin, box = 72, 48, 40, 36
+        added_wires = max([item+1 for sublist in qubits for item in (sublist or [])], default= 0)
+        num_wires = max(1, added_wires + sum(1 for i in range(len(gates)) if gates[i] == "add_card" and not qubits[i]))
+
+        # place every gate in a column, and find where each wire starts and ends
+        next_column = [0]*num_wires
+        first_events = {}
+        placed = []
+        for i in range(len(gates)):
+            _qubits = list(qubits[i] or [])
+            if gates[i] == "add_card" and len(_qubits) == 0:
+                _qubits = [added_wires]
+                added_wires = added_wires+1
+            span = range(min(_qubits), max(_qubits)+1) if len(_qubits) > 1 else _qubits
+            column = max(next_column[q] for q in span)
+            for q in span:
+                next_column[q] = column+1
+            for q in _qubits:
+                first_events.setdefault(q, gates[i])
+            placed.append((gates[i], _qubits, angles[i], column))
+        num_columns = max(next_column, default= 0)+1
+        width = 2*margin + num_columns*column_width
+        height = margin + num_wires*row_height
+
+        def x(column):
+            return margin + column*column_width + column_width//2
+
+        def y(qubit):
+            return margin//2 + qubit*row_height + row_height//2
+
+        # wires are drawn as segments between add_card and remove_card events
+        segments = {q: [] for q in range(num_wires)}
+        start = {q: (None if first_events.get(q) == "add_card" else 0) for q in range(num_wires)}
+        for gate, _qubits, angle, column in sorted(placed, key= lambda item: item[3]):
+            for q in _qubits:
+                if gate == "add_card":
+                    start[q] = column
+                elif gate == "remove_card" and start[q] is not None:
+                    segments[q].append((start[q], column))
+                    start[q] = None
+        for q in range(num_wires):
+            if start[q] is not None:
+                segments[q].append((start[q], num_columns))
+
+        elements = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="13">',
+                    '<rect width="100%" height="100%" fill="white"/>']
+        for q in range(num_wires):
+            elements.append(f'<text x="{margin-6}" y="{y(q)+4}" text-anchor="end">q{q}</text>')
+            for begin, end in segments[q]:
+                x1 = x(begin) if first_events.get(q) == "add_card" or begin != 0 else margin
+                x2 = x(end) if end != num_columns else width-margin//2
+                elements.append(f'<line x1="{x1}" y1="{y(q)}" x2="{x2}" y2="{y(q)}" stroke="black"/>')
+        for gate, _qubits, angle, column in placed:
+            cx = x(column)
+            if gate == "add_card":
+                elements.append(f'<circle cx="{cx}" cy="{y(_qubits[0])}" r="8" fill="white" stroke="black"/><text x="{cx}" y="{y(_qubits[0])+4}" text-anchor="middle">+</text>')
+            elif gate == "remove_card":
+                elements.append(f'<rect x="{cx-box//2}" y="{y(_qubits[0])-box//2}" width="{box}" height="{box}" fill="#ffe0e0" stroke="black"/><text x="{cx}" y="{y(_qubits[0])+4}" text-anchor="middle">M</text>')
+            elif gate in ["CNOT", "CX"] and len(_qubits) == 2:
+                control, target = _qubits
+                elements.append(f'<line x1="{cx}" y1="{y(control)}" x2="{cx}" y2="{y(target)}" stroke="black"/>')
+                elements.append(f'<circle cx="{cx}" cy="{y(control)}" r="5" fill="black"/>')
+                elements.append(f'<circle cx="{cx}" cy="{y(target)}" r="11" fill="white" stroke="black"/><line x1="{cx-11}" y1="{y(target)}" x2="{cx+11}" y2="{y(target)}" stroke="black"/><line x1="{cx}" y1="{y(target)-11}" x2="{cx}" y2="{y(target)+11}" stroke="black"/>')
+            elif gate == "SWAP" and len(_qubits) == 2:
+                elements.append(f'<line x1="{cx}" y1="{y(_qubits[0])}" x2="{cx}" y2="{y(_qubits[1])}" stroke="black"/>')
+                for q in _qubits:
+                    elements.append(f'<path d="M{cx-7} {y(q)-7}L{cx+7} {y(q)+7}M{cx-7} {y(q)+7}L{cx+7} {y(q)-7}" stroke="black" stroke-width="2"/>')
+            else:
+                label = {"SDAGGER": "S†", "TDAGGER": "T†"}.get(gate, gate)
+                if angle is not None and gate in ["Rx", "Ry", "Rz"]:
+                    label = label+"("+self.angle_label(angle)+")"
+                top = y(min(_qubits))-box//2
+                bottom = y(max(_qubits))+box//2
+                box_width = max(box, 8*len(label)+8)
+                elements.append(f'<rect x="{cx-box_width//2}" y="{top}" width="{box_width}" height="{bottom-top}" fill="#dde8ff" stroke="black"/>')
+                elements.append(f'<text x="{cx}" y="{(top+bottom)//2+4}" text-anchor="middle">{escape(label)}</text>')
+        elements.append('</svg>')
+        return "".join(elements)
+
+    def angle_label(self, angle:float)-> str:
+        """ Writes an angle as a multiple of π when it is one of the game angles.
+        """
+        labels = {0: "0", 1: "π", 0.5: "π/2", -0.5: "-π/2", 0.25: "π/4", -0.25: "-π/4", 1.5: "3π/2", -1.5: "-3π/2"}
+        multiple = round(float(angle)/cmath.pi, 6)
+        return labels.get(multiple, f"{float(angle):.3g}")
+
+    def state_summary(self, statevector:list, top_k:int = 8)-> dict:
+        """ Computes the numbers needed to draw Bloch spheres and a Q-sphere of a state on the client.
+
+        For every qubit (qubit 0 being the leftmost bit of a basis state, as in int_to_binary) it
+        gives the reduced density matrix, the Bloch vector and the probability of measuring 1.
+        It also gives the `top_k` most probable basis states with their probabilities and phases.
+
+        Args:
+            statevector (list): row Vector
+            top_k (int, optional): no. of basis states to return. Defaults to 8.
+
+        Returns:
+            dict: {"num_qubits", "qubits": [{"qubit", "bloch", "probability_1", "density_matrix"}], "basis_states": [{"state", "probability", "phase"}]}
+        """
+        state = np.asarray(statevector, dtype= complex)
+        num_qubits = int(state.size).bit_length()-1
+        qubits = []
+        for qubit in range(num_qubits):
+            # axes: bits left of the qubit, the qubit, bits right of the qubit
+            amplitudes = state.reshape(2**qubit, 2, 2**(num_qubits-qubit-1))
+            rho = np.einsum("aib,ajb->ij", amplitudes, amplitudes.conj())
+            qubits.append({"qubit": qubit,
+                           "bloch": [float(2*rho[0, 1].real), float(-2*rho[0, 1].imag), float((rho[0, 0]-rho[1, 1]).real)],
+                           "probability_1": float(rho[1, 1].real),
+                           "density_matrix": [[[float(rho[i, j].real), float(rho[i, j].imag)] for j in range(2)] for i in range(2)]})
+        probabilities = np.abs(state)**2
+        top_k = min(top_k, state.size)
+        top = np.argpartition(-probabilities, top_k-1)[:top_k] if top_k > 0 else np.array([], dtype= int)
+        top = top[np.argsort(-probabilities[top], kind= "stable")]
+        basis_states = [{"state": self.int_to_binary(int(i), num_qubits),
+                         "probability": float(probabilities[i]),
+                         "phase": float(np.angle(state[i]))} for i in top]
+        return {"num_qubits": num_qubits, "qubits": qubits, "basis_states": basis_states}
+
     def save_bloch_sphere(self, state_vector:list, path:str = "bloch_sphere.png", reverse:bool= False):
         if reverse:
             state_vector = state_vector[::-1]
@@ -143,17 +298,20 @@ class Operations():
             result = [a * b for a in A for b in B]
         return result
 
-    def random_statevector(self, num_qubits):
+    def random_statevector(self, num_qubits, rng:random.Random|None = None):
         """ Creates a random statevector
 
         Args:
             num_qubits (int): number of qubits
+            rng (random.Random, optional): random generator to draw from. Defaults to the random module.
 
         Returns:
             list: random statevector
         """        
         # Generate random complex numbers for the statevector
-        statevector = [cmath.rect(1, 2*cmath.pi*random.random()) for _ in range(2**num_qubits)]
+        if rng is None:
+            rng = random
+        statevector = [cmath.rect(1, 2*cmath.pi*rng.random()) for _ in range(2**num_qubits)]
         
         # Normalize the statevector
         norm = sum(abs(coeff)**2 for coeff in statevector)**0.5
@@ -195,6 +353,8 @@ class Operations():
         # if len(state1) != len(state2):
         #     raise ValueError("States have different number of qubits.")
         # print("States:", state1, state2)
+        if Operations.parallel is not None and (Operations.parallel.accepts(state1) or Operations.parallel.accepts(state2)):
+            return Operations.parallel.fidelity(state1, state2)
         inner_product = sum(a1 * a2.conjugate() for a1, a2 in zip(state1, state2))
         norm1 = cmath.sqrt(sum(abs(a)**2 for a in state1))
         norm2 = cmath.sqrt(sum(abs(a)**2 for a in state2))
@@ -352,6 +512,135 @@ class Operations():
 
         return total_gate
 
+    @staticmethod
+    @functools.lru_cache(maxsize= 64)
+    def classify_gate(unitary:tuple)-> str:
+        """ Classifies a gate as "diagonal", "permutation" (a 0/1 matrix with a single 1 per row and coloumn) or "general".
+
+        Args:
+            unitary (tuple): gate matrix as a tuple of rows
+
+        Returns:
+            str
+        """
+        size = len(unitary)
+        if all(unitary[i][j] == 0 for i in range(size) for j in range(size) if i != j):
+            return "diagonal"
+        for row in unitary:
+            if sum(1 for value in row if value != 0) != 1 or 1 not in row:
+                return "general"
+        if len(set(row.index(1) for row in unitary)) == size:
+            return "permutation"
+        return "general"
+
+    @staticmethod
+    def local_index(index:int, shifts:list)-> int:
+        local = 0
+        for shift in shifts:
+            local = (local << 1) | ((index >> shift) & 1)
+        return local
+
+    @staticmethod
+    def local_indices(total_qubits:int, shifts:list)-> (np.ndarray, np.ndarray):
+        """ Indices of all the amplitudes of a state and their basis states on the qubits at `shifts`.
+        """
+        indices = np.arange(2**total_qubits, dtype= np.int64)
+        local = np.zeros_like(indices)
+        for shift in shifts:
+            local = (local << 1) | ((indices >> shift) & 1)
+        return indices, local
+
+    @staticmethod
+    def cached_gate_table(key:tuple, build)-> np.ndarray:
+        """ Table of a gate from the gate cache, built with `build()` and cached on a miss.
+
+        The least recently used tables are dropped once the cache holds more than GATE_CACHE_BYTES.
+        """
+        with Operations.gate_cache_lock:
+            table = Operations.gate_cache.get(key)
+            if table is not None:
+                Operations.gate_cache.move_to_end(key)
+                return table
+        table = build()
+        with Operations.gate_cache_lock:
+            if key not in Operations.gate_cache and table.nbytes <= Operations.GATE_CACHE_BYTES:
+                Operations.gate_cache[key] = table
+                Operations.gate_cache_bytes = Operations.gate_cache_bytes+table.nbytes
+                while Operations.gate_cache_bytes > Operations.GATE_CACHE_BYTES:
+                    _, evicted = Operations.gate_cache.popitem(last= False)
+                    Operations.gate_cache_bytes = Operations.gate_cache_bytes-evicted.nbytes
+        return table
+
+    @staticmethod
+    def gate_permutation(unitary:tuple, qubits:tuple, total_qubits:int)-> np.ndarray:
+        """ Index gather that applies a permutation gate: amplitude i of the new state is amplitude permutation[i] of the old one.
+        """
+        def build()-> np.ndarray:
+            shifts = [total_qubits-1-qubit for qubit in qubits]
+            clear = (2**total_qubits-1) ^ sum(1 << shift for shift in shifts)
+            sources = []
+            for row in unitary:
+                source = row.index(1)
+                sources.append(sum(((source >> (len(shifts)-1-b)) & 1) << shift for b, shift in enumerate(shifts)))
+            indices, local = Operations.local_indices(total_qubits, shifts)
+            return ((indices & clear) | np.asarray(sources, dtype= np.int64)[local]).astype(np.int32 if total_qubits < 31 else np.int64)
+        return Operations.cached_gate_table(("permutation", unitary, qubits, total_qubits), build)
+
+    @staticmethod
+    def gate_phases(unitary:tuple, qubits:tuple, total_qubits:int)-> np.ndarray:
+        """ Phase every amplitude is multiplied with by a diagonal gate.
+        """
+        def build()-> np.ndarray:
+            shifts = [total_qubits-1-qubit for qubit in qubits]
+            _, local = Operations.local_indices(total_qubits, shifts)
+            return np.asarray([unitary[i][i] for i in range(len(unitary))], dtype= complex)[local]
+        return Operations.cached_gate_table(("phases", unitary, qubits, total_qubits), build)
+
+    def apply_gate_to_statevector(self, statevector:list, unitary, qubits:list)-> list:
+        """ Applies a single or two qubit gate on the given qubits of a statevector in O(2^n), without building the total unitary.
+
+        Permutation gates (X, CNOT, SWAP) are applied as a cached index gather, diagonal gates (Z, S, T, Rz, ...)
+        as an elementwise product with cached phases, and any other gate on the amplitudes it mixes.
+
+        Args:
+            statevector (list): row Vector
+            unitary (list): Single qubit or double qubit gate
+            qubits (list): the qubits the gate is applied on, the first one is the most significant bit of the gate
+
+        Returns:
+            list: new row vector (an array for states of the parallel kernels)
+        """
+        total_qubits = len(statevector).bit_length()-1
+        qubits = tuple(qubits)
+        if len(qubits) == 0:
+            raise AttributeError("Need to specify qubits to apply the gate")
+        if Operations.parallel is not None and Operations.parallel.accepts(statevector):
+            # the state stays an array, converting it back to a list would take longer than the gate
+            return Operations.parallel.apply_gate(statevector, unitary, qubits)
+        unitary = tuple(tuple(row) for row in unitary)
+        kind = self.classify_gate(unitary)
+        if kind == "permutation":
+            permutation = self.gate_permutation(unitary, qubits, total_qubits)
+            if isinstance(statevector, np.ndarray):
+                return statevector[permutation].tolist()
+            return [statevector[j] for j in permutation.tolist()]
+        if kind == "diagonal":
+            phases = self.gate_phases(unitary, qubits, total_qubits)
+            if isinstance(statevector, np.ndarray):
+                return (statevector*phases).tolist()
+            return [amplitude*phase for amplitude, phase in zip(statevector, phases.tolist())]
+        shifts = [total_qubits-1-qubit for qubit in qubits]
+        mask = sum(1 << shift for shift in shifts)
+        offsets = [sum(((local >> (len(shifts)-1-b)) & 1) << shift for b, shift in enumerate(shifts)) for local in range(2**len(shifts))]
+        new_statevector = [0]*len(statevector)
+        for base in range(len(statevector)):
+            if base & mask:
+                continue
+            amplitudes = [statevector[base+offset] for offset in offsets]
+            for row, offset in zip(unitary, offsets):
+                new_statevector[base+offset] = sum(value*amplitude for value, amplitude in zip(row, amplitudes))
+        return new_statevector
+
     def get_total_unitary(self, unitary, total_qubits:int, qubit_num:list):
         """ Creates unirtary matrix of size 2**total_qubits x 2**total_qubits which applies the specified unitary on specified qubits.
 